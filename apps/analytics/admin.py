@@ -0,0 +1,34 @@
+"""
+read-only admin for engagement rollups
+"""
+
+from django.contrib import admin
+
+from apps.core.pagination import EstimatedCountPaginator
+from .models import VideoEngagementRollup, CategoryEngagementRollup
+
+
+class RollupAdmin(admin.ModelAdmin):
+    list_filter = ['granularity', 'bucket_start']
+    date_hierarchy = 'bucket_start'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VideoEngagementRollup)
+class VideoEngagementRollupAdmin(RollupAdmin):
+    list_display = ['video', 'granularity', 'bucket_start', 'views', 'likes', 'dislikes', 'comments']
+    list_select_related = ['video']
+    raw_id_fields = ['video']
+
+
+@admin.register(CategoryEngagementRollup)
+class CategoryEngagementRollupAdmin(RollupAdmin):
+    list_display = ['category', 'granularity', 'bucket_start', 'views', 'likes', 'dislikes', 'comments']
+    list_select_related = ['category']
@@ -0,0 +1,88 @@
+"""
+helpers for writing engagement events. during a request (EngagementEventMiddleware)
+record_event only collects them, and the request ends with one bulk INSERT
+"""
+
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+
+from .models import EngagementEvent
+
+request_events = contextvars.ContextVar('request_engagement_events', default=None)
+
+
+def record_event(video, event_type, quantity=1):
+    buffer = request_events.get()
+    if buffer is not None:
+        buffer.add(video, event_type, quantity)
+        return
+    EngagementEvent.objects.create(
+        video_id=video.id,
+        category_id=video.category_id,
+        event_type=event_type,
+        quantity=quantity
+    )
+
+
+@contextmanager
+def buffered_events():
+    # the events are written on the way out even if the block raised, like the
+    # counter updates they go with, which are not rolled back either
+    buffer = EventBuffer()
+    token = request_events.set(buffer)
+    try:
+        yield buffer
+    finally:
+        request_events.reset(token)
+        buffer.flush()
+
+
+@asynccontextmanager
+async def abuffered_events():
+    # sync_to_async threads see the same buffer through the copied context
+    buffer = EventBuffer()
+    token = request_events.set(buffer)
+    try:
+        yield buffer
+    finally:
+        request_events.reset(token)
+        await sync_to_async(buffer.flush)()
+
+
+class EventBuffer:
+    """
+    Collects events and writes them with bulk_create, for code paths that touch many videos.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, video, event_type, quantity=1, occurred_at=None):
+        if quantity <= 0:
+            return
+        event = EngagementEvent(
+            video_id=video.id,
+            category_id=video.category_id,
+            event_type=event_type,
+            quantity=quantity
+        )
+        if occurred_at is not None:
+            event.occurred_at = occurred_at
+        self.pending.append(event)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            EngagementEvent.objects.bulk_create(self.pending, batch_size=self.batch_size)
+            self.pending = []
@@ -0,0 +1,19 @@
+"""
+request middleware of the analytics app
+"""
+
+from apps.core.middleware import HybridMiddleware
+
+from .events import abuffered_events, buffered_events
+
+
+class EngagementEventMiddleware(HybridMiddleware):
+    # engagement events recorded by the request (views, likes, comments) are
+    # written in one bulk_create when it finishes instead of an INSERT each
+    def handle(self, request):
+        with buffered_events():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        async with abuffered_events():
+            return await self.get_response(request)
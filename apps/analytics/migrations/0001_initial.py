@@ -0,0 +1,72 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('videos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoEngagementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('likes', models.PositiveBigIntegerField(default=0)),
+                ('dislikes', models.PositiveBigIntegerField(default=0)),
+                ('comments', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='engagement_rollups', to='videos.video')),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='EngagementEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_id', models.BigIntegerField(blank=True, null=True)),
+                ('event_type', models.CharField(choices=[('view', 'View'), ('like', 'Like'), ('dislike', 'Dislike'), ('comment', 'Comment')], max_length=20)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('video', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='videos.video')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryEngagementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('likes', models.PositiveBigIntegerField(default=0)),
+                ('dislikes', models.PositiveBigIntegerField(default=0)),
+                ('comments', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='engagement_rollups', to='videos.videocategory')),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='videoengagementrollup',
+            constraint=models.UniqueConstraint(fields=('video', 'granularity', 'bucket_start'), name='unique_video_rollup_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='categoryengagementrollup',
+            constraint=models.UniqueConstraint(fields=('category', 'granularity', 'bucket_start'), name='unique_category_rollup_bucket'),
+        ),
+    ]
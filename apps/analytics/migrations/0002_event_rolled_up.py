@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:06
+
+from django.db import migrations, models
+
+ROLLUP_WATERMARK = 'analytics.engagement_rollup'
+
+
+def mark_counted_events(apps, schema_editor):
+    # events up to the old id watermark are already in the rollups
+    Watermark = apps.get_model('core', 'Watermark')
+    EngagementEvent = apps.get_model('analytics', 'EngagementEvent')
+    watermark = Watermark.objects.filter(name=ROLLUP_WATERMARK).values_list('value', flat=True).first()
+    if watermark:
+        EngagementEvent.objects.filter(id__lte=watermark).update(rolled_up=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('core', '0002_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='engagementevent',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_counted_events, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='engagementevent',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='engagement_event_pending_idx'),
+        ),
+    ]
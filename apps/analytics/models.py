@@ -0,0 +1,93 @@
+"""
+engagement events and the rollups computed from them
+"""
+
+from django.db import models
+from django.utils import timezone
+
+
+class EngagementEvent(models.Model):
+    # append-only apart from rolled_up, which the rollup sets once it has counted a row
+    EVENT_TYPES = [
+        ('view', 'View'),
+        ('like', 'Like'),
+        ('dislike', 'Dislike'),
+        ('comment', 'Comment'),
+    ]
+
+    video = models.ForeignKey(
+        'videos.Video',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    # denormalized so category rollups never have to join videos
+    category_id = models.BigIntegerField(null=True, blank=True)
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    quantity = models.PositiveIntegerField(default=1)
+    occurred_at = models.DateTimeField(default=timezone.now)
+    rolled_up = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # the rollup reads the pending events in id order, the rolled up ones drop out of the index
+            models.Index(fields=['id'], name='engagement_event_pending_idx', condition=models.Q(rolled_up=False)),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} x{self.quantity} on video {self.video_id}"
+
+
+class EngagementRollup(models.Model):
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    ]
+
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    views = models.PositiveBigIntegerField(default=0)
+    likes = models.PositiveBigIntegerField(default=0)
+    dislikes = models.PositiveBigIntegerField(default=0)
+    comments = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+        ordering = ['bucket_start']
+
+    @property
+    def engagement(self):
+        return self.likes + self.comments
+
+
+class VideoEngagementRollup(EngagementRollup):
+    video = models.ForeignKey(
+        'videos.Video',
+        on_delete=models.CASCADE,
+        related_name='engagement_rollups'
+    )
+
+    class Meta(EngagementRollup.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['video', 'granularity', 'bucket_start'],
+                name='unique_video_rollup_bucket'
+            ),
+        ]
+
+
+class CategoryEngagementRollup(EngagementRollup):
+    category = models.ForeignKey(
+        'videos.VideoCategory',
+        on_delete=models.CASCADE,
+        related_name='engagement_rollups'
+    )
+
+    class Meta(EngagementRollup.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['category', 'granularity', 'bucket_start'],
+                name='unique_category_rollup_bucket'
+            ),
+        ]
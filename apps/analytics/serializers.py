@@ -0,0 +1,27 @@
+from rest_framework import serializers
+
+from apps.core.serializers import TimedModelSerializer, TimedSerializer
+
+from .models import VideoEngagementRollup, CategoryEngagementRollup
+
+
+class EngagementQuerySerializer(TimedSerializer):
+    granularity = serializers.ChoiceField(choices=['hour', 'day'], default='day')
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+
+class VideoEngagementRollupSerializer(TimedModelSerializer):
+    engagement = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = VideoEngagementRollup
+        fields = ['bucket_start', 'views', 'likes', 'dislikes', 'comments', 'engagement']
+
+
+class CategoryEngagementRollupSerializer(TimedModelSerializer):
+    engagement = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = CategoryEngagementRollup
+        fields = ['bucket_start', 'views', 'likes', 'dislikes', 'comments', 'engagement']
@@ -0,0 +1,184 @@
+"""
+Celery tasks for engagement rollups
+"""
+
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import EngagementEvent, VideoEngagementRollup, CategoryEngagementRollup
+from apps.core.locks import skipped_run, task_lease
+from apps.core.models import Watermark
+
+ROLLUP_WATERMARK = 'analytics.engagement_rollup'
+
+EVENT_COUNTERS = {
+    'view': 'views',
+    'like': 'likes',
+    'dislike': 'dislikes',
+    'comment': 'comments',
+}
+
+
+@shared_task(bind=True)
+def calculate_engagement_metrics(self):
+    # runs that overlap one in progress are folded into a single follow-up run,
+    # which picks up the events written in the meantime
+    with task_lease('analytics.calculate_engagement_metrics', rerun=calculate_engagement_metrics) as lease:
+        if not lease.acquired:
+            return skipped_run('calculate_engagement_metrics')
+        
+        try:
+            batch_size = settings.ANALYTICS['ROLLUP_BATCH_SIZE']
+            events_processed = 0
+            rollups_written = 0
+        
+            while lease.heartbeat():
+                # pending events are picked by their flag rather than above an id watermark:
+                # ids are handed out before commit, so an event can become visible after
+                # higher ids were rolled up, and it would be skipped for good
+                with transaction.atomic():
+                    # the watermark row lock keeps overlapping runs from counting an event twice
+                    watermark = Watermark.lock(ROLLUP_WATERMARK)
+                
+                    event_ids = list(
+                        EngagementEvent.objects.filter(rolled_up=False)
+                        .order_by('id').values_list('id', flat=True)[:batch_size]
+                    )
+                    if not event_ids:
+                        break
+                
+                    # the same ids for the totals and the flag, whatever commits meanwhile
+                    hourly = EngagementEvent.objects.filter(
+                        id__in=event_ids
+                    ).annotate(
+                        bucket=TruncHour('occurred_at')
+                    ).order_by().values(
+                        'video_id', 'category_id', 'bucket', 'event_type'
+                    ).annotate(total=Sum('quantity'))
+                
+                    rollups_written += apply_event_totals(hourly)
+                    EngagementEvent.objects.filter(id__in=event_ids).update(rolled_up=True)
+                
+                    # highest id rolled up so far, for the task result
+                    watermark.value = max(watermark.value, event_ids[-1])
+                    watermark.save(update_fields=['value', 'updated_at'])
+            
+                events_processed += len(event_ids)
+        
+            return {
+                'task': 'calculate_engagement_metrics',
+                'status': 'completed' if lease.held else 'lease_lost',
+                'events_processed': events_processed,
+                'analytics_created': rollups_written,
+                'watermark': Watermark.objects.get(name=ROLLUP_WATERMARK).value,
+                'timestamp': timezone.now().isoformat()
+            }
+        
+        except Exception as exc:
+            self.retry(exc=exc, countdown=60, max_retries=3)
+
+
+@shared_task
+def cleanup_rolled_up_events():
+    with task_lease('analytics.cleanup_rolled_up_events') as lease:
+        if not lease.acquired:
+            return skipped_run('cleanup_rolled_up_events')
+        
+        # raw events are only needed until the rollup has consumed them
+        retention_days = settings.ANALYTICS['RAW_EVENT_RETENTION_DAYS']
+    
+        deleted_count, _ = EngagementEvent.objects.filter(
+            rolled_up=True,
+            occurred_at__lt=timezone.now() - timedelta(days=retention_days)
+        ).delete()
+    
+        return {
+            'task': 'cleanup_rolled_up_events',
+            'status': 'completed',
+            'deleted_events': deleted_count,
+            'timestamp': timezone.now().isoformat()
+        }
+
+
+def apply_event_totals(hourly_totals):
+    # fold (video, category, hour, event type) totals into the four rollup sets
+    deltas = {
+        VideoEngagementRollup: {},
+        CategoryEngagementRollup: {},
+    }
+    for row in hourly_totals:
+        counter = EVENT_COUNTERS[row['event_type']]
+        day = row['bucket'].replace(hour=0)
+        
+        for granularity, bucket in (('hour', row['bucket']), ('day', day)):
+            video_key = (row['video_id'], granularity, bucket)
+            deltas[VideoEngagementRollup].setdefault(video_key, {})
+            deltas[VideoEngagementRollup][video_key][counter] = (
+                deltas[VideoEngagementRollup][video_key].get(counter, 0) + row['total']
+            )
+            
+            if row['category_id'] is not None:
+                category_key = (row['category_id'], granularity, bucket)
+                deltas[CategoryEngagementRollup].setdefault(category_key, {})
+                deltas[CategoryEngagementRollup][category_key][counter] = (
+                    deltas[CategoryEngagementRollup][category_key].get(counter, 0) + row['total']
+                )
+    
+    written = 0
+    written += merge_rollups(VideoEngagementRollup, 'video_id', deltas[VideoEngagementRollup])
+    written += merge_rollups(CategoryEngagementRollup, 'category_id', deltas[CategoryEngagementRollup])
+    return written
+
+
+def merge_rollups(model, owner_field, deltas):
+    if not deltas:
+        return 0
+    
+    # events outlive hard-deleted videos/categories, their totals have nowhere to go
+    owner_model = model._meta.get_field(owner_field[:-len('_id')]).related_model
+    owner_ids = set(owner_model._base_manager.filter(
+        pk__in={key[0] for key in deltas}
+    ).values_list('pk', flat=True))
+    deltas = {key: counters for key, counters in deltas.items() if key[0] in owner_ids}
+    if not deltas:
+        return 0
+    
+    buckets = [key[2] for key in deltas]
+    existing = {
+        (getattr(rollup, owner_field), rollup.granularity, rollup.bucket_start): rollup
+        for rollup in model.objects.filter(
+            **{f'{owner_field}__in': owner_ids},
+            bucket_start__gte=min(buckets),
+            bucket_start__lte=max(buckets)
+        )
+    }
+    
+    to_create = []
+    to_update = []
+    for (owner_id, granularity, bucket), counters in deltas.items():
+        rollup = existing.get((owner_id, granularity, bucket))
+        if rollup is None:
+            to_create.append(model(
+                **{owner_field: owner_id},
+                granularity=granularity,
+                bucket_start=bucket,
+                **counters
+            ))
+            continue
+        for counter, amount in counters.items():
+            setattr(rollup, counter, getattr(rollup, counter) + amount)
+        rollup.updated_at = timezone.now()
+        to_update.append(rollup)
+    
+    model.objects.bulk_create(to_create, batch_size=500)
+    model.objects.bulk_update(
+        to_update,
+        ['views', 'likes', 'dislikes', 'comments', 'updated_at'],
+        batch_size=500
+    )
+    return len(to_create) + len(to_update)
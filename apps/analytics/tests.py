@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.analytics.events import buffered_events, record_event
+from apps.analytics.models import CategoryEngagementRollup, EngagementEvent, VideoEngagementRollup
+from apps.analytics.tasks import calculate_engagement_metrics, cleanup_rolled_up_events
+from apps.videos.models import Video, VideoCategory
+
+HOUR = datetime(2026, 1, 5, 10, tzinfo=dt_timezone.utc)
+
+
+class EngagementRollupTests(TestCase):
+    """
+    calculate_engagement_metrics folds each event into the hourly and daily rollups
+    exactly once, including events that become visible after higher ids
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = VideoCategory.objects.create(name='Rollup category')
+        cls.video = Video.objects.create(
+            title='Rollup test', channel_name='Rollup', duration=60, category=cls.category
+        )
+
+    def event(self, event_type, minutes=0, **kwargs):
+        return EngagementEvent.objects.create(
+            video_id=self.video.pk,
+            category_id=self.category.pk,
+            event_type=event_type,
+            occurred_at=HOUR + timedelta(minutes=minutes),
+            **kwargs
+        )
+
+    def rollup(self):
+        return calculate_engagement_metrics.apply().get()
+
+    def totals(self, model=VideoEngagementRollup, granularity='day'):
+        return {
+            rollup.bucket_start: (rollup.views, rollup.likes, rollup.comments)
+            for rollup in model.objects.filter(granularity=granularity)
+        }
+
+    def test_hourly_and_daily_buckets(self):
+        self.event('view', quantity=3)
+        self.event('like', minutes=30)
+        self.event('view', minutes=90)
+        self.event('comment', minutes=90)
+
+        result = self.rollup()
+        self.assertEqual(result['events_processed'], 4)
+        self.assertEqual(self.totals(granularity='hour'), {
+            HOUR: (3, 1, 0),
+            HOUR + timedelta(hours=1): (1, 0, 1),
+        })
+        self.assertEqual(self.totals(), {HOUR.replace(hour=0): (4, 1, 1)})
+        self.assertEqual(self.totals(CategoryEngagementRollup), {HOUR.replace(hour=0): (4, 1, 1)})
+
+    def test_events_are_counted_once(self):
+        self.event('view')
+        self.rollup()
+        result = self.rollup()
+        self.assertEqual(result['events_processed'], 0)
+        self.assertEqual(self.totals(), {HOUR.replace(hour=0): (1, 0, 0)})
+
+    def test_late_committed_event_is_not_skipped(self):
+        first, in_flight, last = self.event('view'), self.event('view'), self.event('view')
+        # the middle id was handed out but its transaction had not committed yet
+        in_flight.delete()
+        result = self.rollup()
+        self.assertEqual(result['watermark'], last.pk)
+        self.assertEqual(self.totals(), {HOUR.replace(hour=0): (2, 0, 0)})
+
+        self.event('view', id=in_flight.pk)
+        self.assertEqual(self.rollup()['events_processed'], 1)
+        self.assertEqual(self.totals(), {HOUR.replace(hour=0): (3, 0, 0)})
+        self.assertFalse(EngagementEvent.objects.filter(rolled_up=False).exists())
+
+    def test_cleanup_keeps_pending_events(self):
+        old = timezone.now() - timedelta(days=30)
+        counted = self.event('view')
+        EngagementEvent.objects.filter(pk=counted.pk).update(occurred_at=old)
+        self.rollup()
+        pending = self.event('view')
+        EngagementEvent.objects.filter(pk=pending.pk).update(occurred_at=old)
+
+        self.assertEqual(cleanup_rolled_up_events.apply().get()['deleted_events'], 1)
+        self.assertEqual(list(EngagementEvent.objects.values_list('pk', flat=True)), [pending.pk])
+
+
+class RequestEventBufferTests(TestCase):
+    """
+    the events of a request are collected and written in one INSERT at its end
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = VideoCategory.objects.create(name='Buffer category')
+        cls.video = Video.objects.create(
+            title='Buffer test', channel_name='Buffer', duration=60, category=cls.category, status='published'
+        )
+
+    def inserts(self, queries):
+        table = EngagementEvent._meta.db_table
+        return [query for query in queries.captured_queries if query['sql'].startswith(f'INSERT INTO "{table}"')]
+
+    def test_buffered_events_are_written_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            with buffered_events():
+                self.video.increment_view_count()
+                self.video.add_like()
+                self.video.add_dislike()
+                self.assertFalse(EngagementEvent.objects.exists())
+        self.assertEqual(len(self.inserts(queries)), 1)
+        self.assertEqual(
+            sorted(EngagementEvent.objects.values_list('event_type', 'category_id')),
+            [('dislike', self.category.pk), ('like', self.category.pk), ('view', self.category.pk)]
+        )
+
+    def test_events_outside_a_request_are_written_at_once(self):
+        record_event(self.video, 'view')
+        self.assertEqual(EngagementEvent.objects.count(), 1)
+
+    def test_request_flushes_its_events(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/v1/videos/{self.video.pk}/toggle_like/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.inserts(queries)), 1)
+        self.assertEqual(list(EngagementEvent.objects.values_list('event_type', flat=True)), ['like'])
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from .views import video_engagement, category_engagement
+
+app_name = 'analytics'
+
+urlpatterns = [
+    path('videos/<int:video_id>/engagement/', video_engagement, name='video_engagement'),
+    path('categories/<int:category_id>/engagement/', category_engagement, name='category_engagement'),
+]
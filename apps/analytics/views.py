@@ -0,0 +1,65 @@
+"""
+engagement-over-time API, served from the rollup tables only
+"""
+
+from datetime import timedelta
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from .models import VideoEngagementRollup, CategoryEngagementRollup
+from .serializers import (
+    EngagementQuerySerializer, VideoEngagementRollupSerializer,
+    CategoryEngagementRollupSerializer
+)
+from apps.videos.models import Video, VideoCategory
+
+
+def rollup_series(request, queryset, serializer_class):
+    params = EngagementQuerySerializer(data=request.query_params)
+    if not params.is_valid():
+        return None, Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    granularity = params.validated_data['granularity']
+    default_window = timedelta(hours=48) if granularity == 'hour' else timedelta(days=30)
+    since = params.validated_data.get('since', timezone.now() - default_window)
+    
+    queryset = queryset.filter(granularity=granularity, bucket_start__gte=since)
+    if 'until' in params.validated_data:
+        queryset = queryset.filter(bucket_start__lt=params.validated_data['until'])
+    
+    return {
+        'granularity': granularity,
+        'since': since,
+        'series': serializer_class(queryset.order_by('bucket_start'), many=True).data
+    }, None
+
+
+@api_view(['GET'])
+def video_engagement(request, video_id):
+    video = get_object_or_404(Video.objects.only('id', 'title'), id=video_id)
+    data, error = rollup_series(
+        request,
+        VideoEngagementRollup.objects.filter(video_id=video.id),
+        VideoEngagementRollupSerializer
+    )
+    if error:
+        return error
+    
+    return Response({'video_id': video.id, 'video_title': video.title, **data})
+
+
+@api_view(['GET'])
+def category_engagement(request, category_id):
+    category = get_object_or_404(VideoCategory, id=category_id)
+    data, error = rollup_series(
+        request,
+        CategoryEngagementRollup.objects.filter(category_id=category.id),
+        CategoryEngagementRollupSerializer
+    )
+    if error:
+        return error
+    
+    return Response({'category_id': category.id, 'category': category.name, **data})
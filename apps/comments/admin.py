@@ -3,9 +3,14 @@ simple Django admin for comments
 """
 
 from django.contrib import admin
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
 
-from .models import Comment
+from apps.core import outbox
+from apps.core.pagination import EstimatedCountPaginator
+from .models import Comment, ArchivedComment
 
 
 @admin.register(Comment)
@@ -20,6 +25,10 @@ class CommentAdmin(admin.ModelAdmin):
     ]
     search_fields = ['content', 'author_name', 'video__title']
     readonly_fields = ['like_count', 'created_at', 'updated_at']
+    # id inputs instead of a <select> of every video and comment on the change form
+    raw_id_fields = ['video', 'parent_comment']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Content', {
@@ -49,27 +58,52 @@ class CommentAdmin(admin.ModelAdmin):
     def video_link(self, obj):
         return format_html(
             '<a href="{}">{}</a>',
-            f'/admin/videos/video/{obj.video.id}/change/',
+            reverse('admin:videos_video_change', args=[obj.video_id]),
             obj.video.title[:30] + "..." if len(obj.video.title) > 30 else obj.video.title
         )
     video_link.short_description = "Video"
     
     def is_reply(self, obj):
-        return obj.parent_comment is not None
+        return obj.parent_comment_id is not None
     is_reply.boolean = True
     is_reply.short_description = "Is Reply"
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('video', 'parent_comment')
+        return super().get_queryset(request).select_related('video')
     
     actions = ['approve_comments', 'disapprove_comments']
     
     def approve_comments(self, request, queryset):
-        updated = queryset.update(is_approved=True)
+        updated = self.set_approved(queryset, True)
         self.message_user(request, f'{updated} comments were approved.')
     approve_comments.short_description = "Approve selected comments"
     
     def disapprove_comments(self, request, queryset):
-        updated = queryset.update(is_approved=False)
+        updated = self.set_approved(queryset, False)
         self.message_user(request, f'{updated} comments were disapproved.')
-    disapprove_comments.short_description = "Disapprove selected comments"
\ No newline at end of file
+    disapprove_comments.short_description = "Disapprove selected comments"
+    
+    def set_approved(self, queryset, approved):
+        # the video comment counts are refreshed from the outbox events written with the UPDATE
+        with transaction.atomic():
+            rows = list(queryset.values_list('pk', 'video_id'))
+            updated = queryset.update(is_approved=approved, updated_at=timezone.now())
+            outbox.record_many('comment', 'updated', [
+                (pk, {'video_id': video_id, 'fields': ['is_approved']}) for pk, video_id in rows
+            ])
+        return updated
+
+
+@admin.register(ArchivedComment)
+class ArchivedCommentAdmin(admin.ModelAdmin):
+    list_display = ['id', 'author_name', 'video_id', 'is_ai_generated', 'created_at', 'archived_at']
+    list_filter = ['is_ai_generated', 'archived_at']
+    raw_id_fields = ['video', 'parent_comment']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
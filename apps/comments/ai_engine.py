@@ -47,9 +47,15 @@ class YouTubeAICommentEngine:
         ]
 
     def generate_user_comment(self, video: Video) -> Comment:
+        comment = self.build_user_comment(video)
+        comment.save()
+        return comment
+
+    def build_user_comment(self, video: Video) -> Comment:
+        # unsaved instance, callers may bulk_create several at once
         content = random.choice(self.comment_templates)
         
-        comment = Comment.objects.create(
+        comment = Comment(
             video=video,
             content=content,
             author_name=self.fake.name(),
@@ -130,6 +136,12 @@ class YouTubeAICommentEngine:
         }
 
     def generate_business_reply(self, user_comment: Comment, analysis: Dict) -> Comment:
+        reply = self.build_business_reply(user_comment, analysis)
+        reply.save()
+        return reply
+
+    def build_business_reply(self, user_comment: Comment, analysis: Dict) -> Comment:
+        # user_comment must already be saved, its id seeds the reply variation
 
         reply_templates = {
             'first_comment': [
@@ -168,7 +180,7 @@ class YouTubeAICommentEngine:
             offer = analysis['matched_offers'][0]
             reply_content += f" You might like my {offer['name']}: {offer['info']}"
         
-        reply = Comment.objects.create(
+        reply = Comment(
             video=user_comment.video,
             parent_comment=user_comment,
             content=reply_content,
@@ -182,6 +194,11 @@ class YouTubeAICommentEngine:
         return reply
 
     def generate_channel_promotional_comment(self, video: Video, offer_type: str = None) -> Comment:
+        promo_comment = self.build_channel_promotional_comment(video, offer_type)
+        promo_comment.save()
+        return promo_comment
+
+    def build_channel_promotional_comment(self, video: Video, offer_type: str = None) -> Comment:
         offer = random.choice(self.offers)
         
         promo_templates = [
@@ -191,7 +208,7 @@ class YouTubeAICommentEngine:
         
         content = random.choice(promo_templates)
         
-        promo_comment = Comment.objects.create(
+        promo_comment = Comment(
             video=video,
             content=content,
             author_name=video.channel_name,
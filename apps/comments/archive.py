@@ -0,0 +1,194 @@
+"""
+comment archival and the monthly partitions of comments_comment on PostgreSQL
+"""
+
+import datetime
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Comment, ArchivedComment
+
+TABLE = Comment._meta.db_table
+LEGACY = f'{TABLE}_unpartitioned'
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_PREFIX = f'{TABLE}_p'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def month_start(value):
+    value = value.astimezone(datetime.timezone.utc)
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f'{PARTITION_PREFIX}{month:%Y_%m}'
+
+
+def monthly_partitions(cursor):
+    # month start -> partition name, oldest first; the default partition is left out
+    cursor.execute(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = %s::regclass ORDER BY c.relname',
+        [TABLE]
+    )
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        if name.startswith(PARTITION_PREFIX):
+            year, month = name[len(PARTITION_PREFIX):].split('_')
+            partitions[datetime.datetime(int(year), int(month), 1, tzinfo=datetime.timezone.utc)] = name
+    return partitions
+
+
+def create_partition(cursor, month):
+    # rows for this month may already sit in the default partition, so build the table,
+    # move them over and attach it instead of a plain CREATE TABLE ... PARTITION OF
+    name = partition_name(month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+        f'WHERE created_at >= %s AND created_at < %s RETURNING *) '
+        f'INSERT INTO "{name}" SELECT * FROM moved',
+        [start, end]
+    )
+    cursor.execute(f"ALTER TABLE \"{TABLE}\" ATTACH PARTITION \"{name}\" FOR VALUES FROM ('{start}') TO ('{end}')")
+    return name
+
+
+def index_and_fk_definitions(cursor, table):
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s "
+        "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+        [table, table]
+    )
+    # indexes of a partitioned table are listed as ON ONLY, recreate them recursively
+    indexes = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table]
+    )
+    foreign_keys = cursor.fetchall()
+    return indexes, foreign_keys
+
+
+def recreate(cursor, indexes, foreign_keys):
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{name}" {definition}')
+
+
+def partition_table(cursor, months_ahead):
+    """
+    Turns comments_comment into a table range-partitioned by month on created_at.
+    The primary key becomes (id, created_at), since every unique index of a
+    partitioned table has to include the partition key; ids still come from one
+    sequence. The rows are copied in the caller's transaction, so on a large table
+    run it in a maintenance window.
+    """
+    indexes, foreign_keys = index_and_fk_definitions(cursor, TABLE)
+
+    cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{LEGACY}"')
+    # the identity sequence goes away with the old table, keep its position
+    cursor.execute(f'SELECT COALESCE(MAX(id), 0), MIN(created_at) FROM "{LEGACY}"')
+    max_id, oldest = cursor.fetchone()
+    cursor.execute(f'ALTER TABLE "{LEGACY}" ALTER COLUMN id DROP IDENTITY IF EXISTS')
+
+    # partitioned tables cannot have identity columns before PostgreSQL 17
+    cursor.execute(
+        f'CREATE TABLE "{TABLE}" (LIKE "{LEGACY}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE (created_at)'
+    )
+    cursor.execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY (id, created_at)')
+    cursor.execute(f'CREATE SEQUENCE "{TABLE}_id_seq" OWNED BY "{TABLE}".id')
+    cursor.execute(f"ALTER TABLE \"{TABLE}\" ALTER COLUMN id SET DEFAULT nextval('\"{TABLE}_id_seq\"')")
+    cursor.execute(f"SELECT setval('\"{TABLE}_id_seq\"', %s, %s)", [max_id or 1, max_id > 0])
+
+    month = month_start(timezone.now())
+    last = add_months(month, months_ahead)
+    if oldest is not None:
+        month = min(month, month_start(oldest))
+    while month <= last:
+        end = add_months(month, 1)
+        cursor.execute(
+            f'CREATE TABLE "{partition_name(month)}" PARTITION OF "{TABLE}" '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        month = end
+    cursor.execute(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT')
+
+    cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{LEGACY}"')
+    cursor.execute(f'DROP TABLE "{LEGACY}"')
+    recreate(cursor, indexes, foreign_keys)
+
+
+def unpartition_table(cursor):
+    # back to one plain table with a primary key on id; the archived partitions stay archived
+    indexes, foreign_keys = index_and_fk_definitions(cursor, TABLE)
+
+    cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{LEGACY}"')
+    cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{LEGACY}"')
+    max_id = cursor.fetchone()[0]
+
+    cursor.execute(f'CREATE TABLE "{TABLE}" (LIKE "{LEGACY}" INCLUDING CONSTRAINTS)')
+    cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{LEGACY}"')
+    # CASCADE also drops every partition and the sequence owned by the old id column
+    cursor.execute(f'DROP TABLE "{LEGACY}" CASCADE')
+    cursor.execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY (id)')
+    cursor.execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('\"{TABLE}\"', 'id'), %s, %s)", [max_id or 1, max_id > 0]
+    )
+    recreate(cursor, indexes, foreign_keys)
+
+
+def archive_partition(cursor, name):
+    # detaching is a catalog change, so the hot table is only locked for an instant;
+    # the copy then reads the detached table, which nothing else uses any more
+    cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+    cursor.execute(f'SELECT DISTINCT video_id FROM "{name}"')
+    video_ids = [video_id for (video_id,) in cursor.fetchall()]
+    archived = copy_to_archive(cursor, f'SELECT {{columns}}, %s FROM "{name}"', [timezone.now()])
+    cursor.execute(f'DROP TABLE "{name}"')
+    return archived, video_ids
+
+
+def archive_rows(cursor, ids):
+    return copy_to_archive(
+        cursor,
+        f'SELECT {{columns}}, %s FROM "{TABLE}" WHERE id IN ({", ".join(["%s"] * len(ids))})',
+        [timezone.now(), *ids]
+    )
+
+
+def delete_rows(cursor, ids):
+    # a plain DELETE: the ORM collector would load every row to cascade over the replies,
+    # which the callers have already walked, and comments have no delete signals
+    cursor.execute(f'DELETE FROM "{TABLE}" WHERE id IN ({", ".join(["%s"] * len(ids))})', ids)
+    return cursor.rowcount
+
+
+def copy_to_archive(cursor, select, params):
+    # INSERT ... SELECT keeps the rows inside the database instead of round-tripping them
+    columns = ', '.join(f'"{field.column}"' for field in Comment._meta.concrete_fields)
+    cursor.execute(
+        f'INSERT INTO "{ArchivedComment._meta.db_table}" ({columns}, "archived_at") '
+        + select.format(columns=columns),
+        params
+    )
+    return cursor.rowcount
@@ -0,0 +1,100 @@
+"""
+comment likes with bursts coalesced. The first like of a comment in a window of
+COMMENT_LIKE_WINDOW_SECONDS is written at once; the likes that follow within the
+window are only counted in the cache and applied with one UPDATE by
+flush_comment_likes, so a popular comment gets one write per window instead of
+one per like. The pending counts must be visible to the worker that flushes them,
+so likes are only coalesced with a shared cache (CACHE_REDIS_URL); with the
+per-process default every like is written at once.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.cache import is_shared
+
+from .models import Comment
+
+logger = logging.getLogger(__name__)
+
+PENDING_TIMEOUT = 24 * 60 * 60
+
+
+def window_key(comment_id):
+    return f'comment-likes:window:{comment_id}'
+
+
+def pending_key(comment_id):
+    return f'comment-likes:pending:{comment_id}'
+
+
+def flush_key(comment_id):
+    return f'comment-likes:flush:{comment_id}'
+
+
+def like_comment(comment):
+    # returns the like count to show, including likes not written yet
+    window = settings.YOUTUBE_SIMULATION['COMMENT_LIKE_WINDOW_SECONDS']
+    if not window or not is_shared() or cache.add(window_key(comment.pk), 1, window):
+        apply_likes(comment.pk, 1, comment)
+        return comment.like_count
+
+    pending = add_pending(comment.pk)
+    if cache.add(flush_key(comment.pk), 1, window):
+        from .tasks import flush_comment_likes
+        try:
+            flush_comment_likes.apply_async((comment.pk,), countdown=window)
+        except Exception:
+            # broker down: the like stays pending, the next one tries to schedule again
+            cache.delete(flush_key(comment.pk))
+            logger.exception('could not schedule flush_comment_likes for comment %s', comment.pk)
+    return comment.like_count + pending
+
+
+def apply_likes(comment_id, count, comment=None):
+    # writes count likes plus whatever is pending, returns the number written
+    count += take_pending(comment_id)
+    if not count:
+        return 0
+    try:
+        if comment is not None:
+            comment.add_like(count)
+        else:
+            Comment.objects.add_likes(comment_id, count)
+    except Exception:
+        add_pending(comment_id, count)
+        raise
+    return count
+
+
+def add_pending(comment_id, count=1):
+    key = pending_key(comment_id)
+    cache.add(key, 0, PENDING_TIMEOUT)
+    try:
+        return cache.incr(key, count)
+    except ValueError:
+        # expired between add and incr
+        cache.add(key, 0, PENDING_TIMEOUT)
+        return cache.incr(key, count)
+
+
+def take_pending(comment_id):
+    """
+    Moves the pending likes out of the cache and returns how many. The decrement
+    keeps likes counted after the read; when another taker got there first the
+    counter goes negative and the amount is put back.
+    """
+    key = pending_key(comment_id)
+    pending = cache.get(key) or 0
+    if pending <= 0:
+        return 0
+    try:
+        remaining = cache.decr(key, pending)
+    except ValueError:
+        return 0
+    if remaining < 0:
+        cache.incr(key, pending)
+        return 0
+    return pending
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0001_initial'),
+        ('comments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='parent_comment',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='comments.comment'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('content', models.TextField(max_length=1000)),
+                ('author_name', models.CharField(max_length=100)),
+                ('author_avatar_url', models.URLField(blank=True)),
+                ('like_count', models.PositiveIntegerField(default=0)),
+                ('is_approved', models.BooleanField(default=True)),
+                ('is_ai_generated', models.BooleanField(default=False)),
+                ('ai_model_used', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('parent_comment', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='replies', to='comments.archivedcomment')),
+                ('video', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='videos.video')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['video', 'created_at'], name='comments_ar_video_i_4a515e_idx')],
+            },
+        ),
+    ]
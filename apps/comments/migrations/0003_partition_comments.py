@@ -0,0 +1,43 @@
+# Converts comments_comment into a table range-partitioned by month on created_at,
+# on PostgreSQL with COMMENT_PARTITIONING=True only; otherwise this migration does
+# nothing, and `manage.py partition_comments` converts the table later.
+#
+# The rows are copied inside the migration transaction, so on a large table
+# run it in a maintenance window. New months are added by archive_comments.
+
+from django.conf import settings
+from django.db import migrations
+
+
+def partitioning_enabled(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql' and settings.COMMENT_PARTITIONING
+
+
+def partition_table(apps, schema_editor):
+    if not partitioning_enabled(schema_editor):
+        return
+
+    from apps.comments import archive
+    with schema_editor.connection.cursor() as cursor:
+        archive.partition_table(cursor, settings.YOUTUBE_SIMULATION['COMMENT_PARTITION_MONTHS_AHEAD'])
+
+
+def unpartition_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from apps.comments import archive
+    if archive.is_partitioned():
+        with schema_editor.connection.cursor() as cursor:
+            archive.unpartition_table(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0002_archivedcomment'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_table, unpartition_table),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0003_partition_comments'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comments_co_video_i_7f3ca4_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comments_co_is_ai_g_aca252_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['video', 'is_approved', 'is_ai_generated'], name='comments_co_video_i_9c5f25_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_approved', True), ('parent_comment__isnull', True)), fields=['video', '-created_at'], name='comment_video_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_ai_generated', False)), fields=['parent_comment', '-created_at'], name='comment_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_ai_generated', True)), fields=['created_at'], name='comment_ai_created_idx'),
+        ),
+    ]
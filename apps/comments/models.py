@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 from apps.core.models import TimeStampedModel
@@ -11,6 +11,17 @@ class CommentManager(models.Manager):
     def top_level(self):
         return self.filter(parent_comment__isnull=True)
 
+    def add_likes(self, comment_id, count=1):
+        # one atomic UPDATE, concurrent likes add up instead of overwriting each other
+        return self.filter(pk=comment_id).update(
+            like_count=models.F('like_count') + count,
+            updated_at=timezone.now()
+        )
+
+
+# fields whose change can change Video.comment_count
+COUNTED_FIELDS = {'video', 'is_approved'}
+
 
 class Comment(TimeStampedModel):
     
@@ -20,12 +31,15 @@ class Comment(TimeStampedModel):
         on_delete=models.CASCADE,
         related_name='comments'
     )
+    # no database constraint: on PostgreSQL the table is partitioned by created_at,
+    # and a partitioned table cannot hold the unique index on id alone an FK needs
     parent_comment = models.ForeignKey(
         'self',
         on_delete=models.CASCADE,
         null=True,
         blank=True,
-        related_name='replies'
+        related_name='replies',
+        db_constraint=False
     )
     content = models.TextField(max_length=1000)  # Reduced from 10000
     
@@ -43,13 +57,37 @@ class Comment(TimeStampedModel):
     # simple AI tracking
     ai_model_used = models.CharField(max_length=50, blank=True)
     
+    # a default instead of auto_now_add, so bulk loads can keep the timestamps of their dump
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    
     objects = CommentManager()
 
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['video', 'is_approved']),
-            models.Index(fields=['is_ai_generated']),
+            # per-video counters (total/AI/user approved comments) read from the index alone
+            models.Index(fields=['video', 'is_approved', 'is_ai_generated']),
+            # top-level comment thread on the video page, newest first
+            models.Index(
+                fields=['video', '-created_at'],
+                name='comment_video_thread_idx',
+                condition=models.Q(parent_comment__isnull=True, is_approved=True),
+            ),
+            # recent top-level user comments waiting for a business reply; parent_comment leads
+            # so `parent_comment_id IS NULL` is a seek here instead of on the plain FK index
+            models.Index(
+                fields=['parent_comment', '-created_at'],
+                name='comment_user_recent_idx',
+                condition=models.Q(is_ai_generated=False),
+            ),
+            # old AI comments picked up by cleanup_old_ai_comments
+            models.Index(
+                fields=['created_at'],
+                name='comment_ai_created_idx',
+                condition=models.Q(is_ai_generated=True),
+            ),
+            # MAX(updated_at) ETag validators (apps.core.conditional)
+            models.Index(fields=['updated_at'], name='comment_updated_at_idx'),
         ]
 
     def __str__(self):
@@ -57,22 +95,47 @@ class Comment(TimeStampedModel):
         return f"{self.author_name}: {preview}"
 
     def save(self, *args, **kwargs):
+        from apps.analytics.events import record_event
+        from apps.core import outbox
+        
+        adding = self._state.adding
+        self.populate_defaults()
+        
+        # the video comment count follows through the outbox (apps.videos.projections)
+        update_fields = kwargs.get('update_fields')
+        payload = {'video_id': self.video_id}
+        if update_fields is not None:
+            payload['fields'] = sorted(update_fields)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            outbox.record('comment', 'created' if adding else 'updated', self.pk, **payload)
+        
+        if adding:
+            record_event(self.video, 'comment')
+
+    def delete(self, using=None, keep_parents=False):
+        from apps.core import outbox
+        from apps.videos.models import Video
+        with transaction.atomic():
+            outbox.record('comment', 'deleted', self.pk, video_id=self.video_id)
+            # a deleted row leaves no updated_at behind, the video's moves the list validators
+            Video.all_objects.filter(pk=self.video_id).update(updated_at=timezone.now())
+            return super().delete(using=using, keep_parents=keep_parents)
+
+    def populate_defaults(self):
+        # also used by bulk_create paths, which never call save()
         # auto-generate avatar if not provided
         if not self.author_avatar_url:
             self.author_avatar_url = f"https://ui-avatars.com/api/?name={self.author_name}&background=random"
-        
-        super().save(*args, **kwargs)
-        
-        # update video comment count
-        self.video.update_comment_count()
 
     @property
     def is_reply(self):
         return self.parent_comment is not None
 
-    def add_like(self):
-        self.like_count += 1
-        self.save(update_fields=['like_count'])
+    def add_like(self, count=1):
+        # no save(): that would queue a comment count refresh for every like
+        Comment.objects.add_likes(self.pk, count)
+        self.refresh_from_db(fields=['like_count'])
 
     # class methods for AI functionality
     @classmethod
@@ -95,4 +158,47 @@ class Comment(TimeStampedModel):
     @classmethod
     def generate_channel_promotional_comment(cls, video, offer_type=None):
         from .ai_engine import youtube_ai_engine
-        return youtube_ai_engine.generate_channel_promotional_comment(video, offer_type)
\ No newline at end of file
+        return youtube_ai_engine.generate_channel_promotional_comment(video, offer_type)
+
+
+class ArchivedComment(models.Model):
+    """
+    Cold copy of comments moved out of the hot table by archive_comments.
+    Same columns as Comment, so rows can be copied with INSERT ... SELECT.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    video = models.ForeignKey(
+        'videos.Video',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+'
+    )
+    parent_comment = models.ForeignKey(
+        'self',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='replies'
+    )
+    content = models.TextField(max_length=1000)
+    author_name = models.CharField(max_length=100)
+    author_avatar_url = models.URLField(blank=True)
+    like_count = models.PositiveIntegerField(default=0)
+    is_approved = models.BooleanField(default=True)
+    is_ai_generated = models.BooleanField(default=False)
+    ai_model_used = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['video', 'created_at']),
+        ]
+
+    def __str__(self):
+        preview = self.content[:50] + "..." if len(self.content) > 50 else self.content
+        return f"{self.author_name}: {preview}"
@@ -0,0 +1,114 @@
+"""
+batched comment purge that keeps video comment counts in sync through the outbox
+"""
+
+import time
+
+from django.db import connection, transaction
+
+from apps.core import outbox
+from apps.core.models import Watermark
+from .archive import archive_rows, delete_rows
+from .models import Comment
+
+
+class CommentPurge:
+    """
+    Deletes the comments matched by a queryset, together with their reply threads,
+    in bounded id ranges with one short transaction per range.
+
+    The last id handled is checkpointed in a Watermark, so a run that hits its time
+    limit (or dies) resumes where it stopped. Each range records one outbox event per
+    affected video in its own transaction (object_id is the video), and drain_outbox
+    refreshes the comment counts of those videos.
+
+    With archive=True every row is copied into ArchivedComment in the same
+    transaction that deletes it.
+    """
+
+    def __init__(self, name, queryset, batch_size=1000, archive=False):
+        self.name = name
+        self.queryset = queryset.order_by()
+        self.batch_size = batch_size
+        self.archive = archive
+
+    def run(self, time_limit=None):
+        started = time.perf_counter()
+        self.video_ids = set()
+        deleted = 0
+        batches = 0
+        completed = False
+        resumed_from = Watermark.objects.filter(name=self.name).values_list('value', flat=True).first() or 0
+
+        while not completed:
+            if time_limit is not None and time.perf_counter() - started >= time_limit:
+                break
+
+            # the watermark row lock also keeps two purges with the same name from overlapping
+            with transaction.atomic():
+                watermark = Watermark.lock(self.name)
+                rows = list(
+                    self.queryset.filter(id__gt=watermark.value)
+                    .order_by('id').values_list('id', 'video_id')[:self.batch_size]
+                )
+                if rows:
+                    deleted += self.delete_threads(rows)
+                    batches += 1
+                    watermark.value = rows[-1][0]
+                else:
+                    # a finished pass starts from the beginning next time,
+                    # since older ids can match again once the cutoff moves
+                    watermark.value = 0
+                    completed = True
+                watermark.save(update_fields=['value', 'updated_at'])
+
+        elapsed = time.perf_counter() - started
+        return {
+            'deleted_comments': deleted,
+            'batches': batches,
+            'videos_affected': len(self.video_ids),
+            'resumed_from_id': resumed_from,
+            'completed': completed,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(deleted / elapsed) if elapsed else 0,
+        }
+
+    def delete_threads(self, rows):
+        # walk the reply tree one level at a time instead of letting the ORM cascade
+        levels = [[comment_id for comment_id, _ in rows]]
+        seen = set(levels[0])
+        video_ids = {video_id for _, video_id in rows}
+
+        while levels[-1]:
+            replies = []
+            # a level can be far wider than the batch, so its IN lists are chunked too
+            for parent_ids in self.chunks(levels[-1]):
+                replies.extend(
+                    (comment_id, video_id)
+                    for comment_id, video_id in Comment.objects.filter(
+                        parent_comment_id__in=parent_ids
+                    ).values_list('id', 'video_id')
+                    if comment_id not in seen
+                )
+            levels.append([comment_id for comment_id, _ in replies])
+            seen.update(levels[-1])
+            video_ids.update(video_id for _, video_id in replies)
+
+        # deepest replies first so no row is left pointing at a deleted parent
+        deleted = 0
+        with connection.cursor() as cursor:
+            for level in reversed(levels):
+                for ids in self.chunks(level):
+                    if self.archive:
+                        archive_rows(cursor, ids)
+                    deleted += delete_rows(cursor, ids)
+        # one recount per video, not one event per deleted comment
+        outbox.record_many('comment', 'purged', [
+            (video_id, {'video_id': video_id}) for video_id in sorted(video_ids)
+        ])
+        self.video_ids.update(video_ids)
+        return deleted
+
+    def chunks(self, ids):
+        for start in range(0, len(ids), self.batch_size):
+            yield ids[start:start + self.batch_size]
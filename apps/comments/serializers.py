@@ -2,12 +2,18 @@
 simple serializers for comment API endpoints
 """
 
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from .models import Comment
+from apps.analytics.events import EventBuffer
+from apps.core import outbox
+from apps.core.fastserializers import ValuesSerializer
+from apps.core.serializers import TimedModelSerializer, TimedSerializer
 from apps.videos.models import Video
 
 
-class CommentListSerializer(serializers.ModelSerializer):
+class CommentListSerializer(TimedModelSerializer):
     video_title = serializers.CharField(source='video.title', read_only=True)
     
     class Meta:
@@ -18,7 +24,12 @@ class CommentListSerializer(serializers.ModelSerializer):
         ]
 
 
-class CommentDetailSerializer(serializers.ModelSerializer):
+class CommentListValuesSerializer(ValuesSerializer):
+    # same output as CommentListSerializer, built from values() rows
+    serializer_class = CommentListSerializer
+
+
+class CommentDetailSerializer(TimedModelSerializer):
     video_title = serializers.CharField(source='video.title', read_only=True)
     replies = serializers.SerializerMethodField()
     
@@ -35,7 +46,7 @@ class CommentDetailSerializer(serializers.ModelSerializer):
         return CommentListSerializer(replies, many=True).data
 
 
-class CommentCreateSerializer(serializers.ModelSerializer):
+class CommentCreateSerializer(TimedModelSerializer):
     video_id = serializers.PrimaryKeyRelatedField(
         queryset=Video.objects.all(),
         source='video',
@@ -52,15 +63,63 @@ class CommentCreateSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class AICommentGenerationSerializer(serializers.Serializer):
+class CommentBatchItemSerializer(TimedSerializer):
+    video_id = serializers.IntegerField(min_value=1)
+    content = serializers.CharField(max_length=1000)
+    author_name = serializers.CharField(max_length=100)
+
+
+class CommentBatchCreateSerializer(TimedSerializer):
+    comments = CommentBatchItemSerializer(
+        many=True,
+        allow_empty=False,
+        max_length=settings.YOUTUBE_SIMULATION['COMMENT_BATCH_MAX_SIZE']
+    )
+
+    def validate_comments(self, value):
+        # resolve every video of the batch with a single query
+        videos = Video.objects.in_bulk({item['video_id'] for item in value})
+
+        errors = []
+        for item in value:
+            if item['video_id'] in videos:
+                errors.append({})
+            else:
+                errors.append({
+                    'video_id': [f'Invalid pk "{item["video_id"]}" - object does not exist.']
+                })
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        for item in value:
+            item['video'] = videos[item.pop('video_id')]
+        return value
+
+    def create(self, validated_data):
+        comments = []
+        for item in validated_data['comments']:
+            comment = Comment(is_ai_generated=False, is_approved=True, **item)
+            comment.populate_defaults()
+            comments.append(comment)
+
+        with transaction.atomic(), EventBuffer() as events:
+            Comment.objects.bulk_create(comments)
+            outbox.record_many('comment', 'created', [(comment.pk, {'video_id': comment.video_id}) for comment in comments])
+            for comment in comments:
+                events.add(comment.video, 'comment')
+
+        return comments
+
+
+class AICommentGenerationSerializer(TimedSerializer):
     video_id = serializers.PrimaryKeyRelatedField(queryset=Video.objects.all())
     count = serializers.IntegerField(min_value=1, max_value=20, default=5)
 
 
-class CommentAnalysisSerializer(serializers.Serializer):
+class CommentAnalysisSerializer(TimedSerializer):
     video_id = serializers.PrimaryKeyRelatedField(queryset=Video.objects.all())
 
 
-class ChannelPromotionalCommentSerializer(serializers.Serializer):
+class ChannelPromotionalCommentSerializer(TimedSerializer):
     video_id = serializers.PrimaryKeyRelatedField(queryset=Video.objects.all())
     offer_type = serializers.CharField(required=False, allow_blank=True)
\ No newline at end of file
@@ -2,145 +2,253 @@
 Celery tasks for comment generation and management
 """
 
+import logging
 import random
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
 
 from .models import Comment
 from .ai_engine import youtube_ai_engine
+from .purge import CommentPurge
+from .serializers import CommentListSerializer
+from apps.analytics.events import record_event
+from apps.core import outbox
+from apps.core.locks import Lease, skipped_run, task_lease
+from apps.core.models import Job
 from apps.videos.models import Video
 
+logger = logging.getLogger(__name__)
+
 
 @shared_task(bind=True)
 def generate_ai_comments_for_popular_videos(self):
+    with task_lease('comments.generate_ai_comments_for_popular_videos') as lease:
+        if not lease.acquired:
+            return skipped_run('generate_ai_comments_for_popular_videos')
+        
+        try:
+            recent_threshold = timezone.now() - timedelta(hours=1)
+        
+            video_ids = list(Video.objects.filter(
+                status='published',
+                published_at__lte=timezone.now(),
+            ).annotate(
+                recent_comments=Count(
+                    'comments', 
+                    filter=Q(comments__created_at__gte=recent_threshold)
+                )
+            ).filter(
+                Q(view_count__gt=100) | Q(recent_comments__gt=0)
+            ).order_by(
+                '-view_count', '-recent_comments'
+            ).values_list('id', flat=True)[:settings.YOUTUBE_SIMULATION['AI_COMMENT_VIDEOS_PER_RUN']])
+        
+            if not video_ids:
+                return aggregate_ai_comment_results([])
+        
+            # fan out one subtask per video, the chord callback aggregates once all are done
+            result = chord(
+                generate_ai_comments_for_video.s(video_id) for video_id in video_ids
+            )(aggregate_ai_comment_results.s())
+        
+            # eager mode runs the whole chord inline, so the aggregate is already available
+            if self.app.conf.task_always_eager:
+                return result.result
+        
+            return {
+                'task': 'generate_ai_comments_for_popular_videos',
+                'status': 'dispatched',
+                'videos_dispatched': len(video_ids),
+                'aggregate_task_id': result.id,
+                'timestamp': timezone.now().isoformat()
+            }
+        
+        except Exception as exc:
+            self.retry(exc=exc, countdown=60, max_retries=3)
+
+
+@shared_task(bind=True)
+def generate_ai_comments_for_video(self, video_id):
+    # a database lease, so it holds across workers whatever the cache backend;
+    # a bare Lease rather than task_lease, which would add a metrics label per video
+    lease = Lease(
+        f'comments.ai_comments.video.{video_id}',
+        settings.YOUTUBE_SIMULATION['AI_COMMENT_VIDEO_LOCK_SECONDS'],
+        transient=True,
+    )
+    # another run is already writing comments for this video
+    if not lease.acquire():
+        return {'video_id': video_id, 'status': 'skipped', 'comments_generated': 0, 'total_generated': 0}
+    
     try:
-        recent_threshold = timezone.now() - timedelta(hours=1)
-        
-        popular_videos = Video.objects.filter(
-            status='published',
-            published_at__lte=timezone.now(),
-        ).annotate(
-            recent_comments=Count(
-                'comments', 
-                filter=Q(comments__created_at__gte=recent_threshold)
-            )
-        ).filter(
-            Q(view_count__gt=100) | Q(recent_comments__gt=0)
-        ).order_by('-view_count', '-recent_comments')[:5]
+        try:
+            video = Video.objects.get(id=video_id)
+        except Video.DoesNotExist:
+            return {'video_id': video_id, 'status': 'missing', 'comments_generated': 0, 'total_generated': 0}
         
-        total_generated = 0
-        results = []
+        user_comments = [
+            youtube_ai_engine.build_user_comment(video=video)
+            for _ in range(random.randint(1, 3))
+        ]
         
-        for video in popular_videos:
-            comment_count = random.randint(1, 3)
+        with transaction.atomic():
+            for comment in user_comments:
+                comment.populate_defaults()
+            Comment.objects.bulk_create(user_comments)
             
-            for _ in range(comment_count):
-                user_comment = youtube_ai_engine.generate_user_comment(video=video)
-                if user_comment:
-                    total_generated += 1
-                    
-                    # 30% chance to generate a business reply
-                    if random.random() < 0.3:
-                        analysis = youtube_ai_engine.analyze_comment_for_business_opportunity(user_comment)
-                        if analysis['should_reply']:
-                            business_reply = youtube_ai_engine.generate_business_reply(user_comment, analysis)
-                            if business_reply:
-                                total_generated += 1
+            extra_comments = []
+            for user_comment in user_comments:
+                # 30% chance to generate a business reply
+                if random.random() < 0.3:
+                    analysis = youtube_ai_engine.analyze_comment_for_business_opportunity(user_comment)
+                    if analysis['should_reply']:
+                        extra_comments.append(
+                            youtube_ai_engine.build_business_reply(user_comment, analysis)
+                        )
             
             # 20% chance to generate a channel promotional comment
             if random.random() < 0.2:
-                promo_comment = youtube_ai_engine.generate_channel_promotional_comment(
+                extra_comments.append(youtube_ai_engine.build_channel_promotional_comment(
                     video=video, 
                     offer_type=random.choice(['techmaster', 'marketing_bundle'])
-                )
-                if promo_comment:
-                    total_generated += 1
+                ))
             
-            results.append({
-                'video_id': video.id,
-                'video_title': video.title,
-                'comments_generated': comment_count
-            })
+            for comment in extra_comments:
+                comment.populate_defaults()
+            Comment.objects.bulk_create(extra_comments)
+            
+            total_generated = len(user_comments) + len(extra_comments)
+            outbox.record_many('comment', 'created', [
+                (comment.pk, {'video_id': video.id}) for comment in user_comments + extra_comments
+            ])
+            record_event(video, 'comment', quantity=total_generated)
         
         return {
-            'task': 'generate_ai_comments_for_popular_videos',
+            'video_id': video.id,
+            'video_title': video.title,
             'status': 'completed',
-            'total_comments_generated': total_generated,
-            'videos_processed': len(results),
-            'results': results,
-            'timestamp': timezone.now().isoformat()
+            'comments_generated': len(user_comments),
+            'total_generated': total_generated,
         }
-        
     except Exception as exc:
-        self.retry(exc=exc, countdown=60, max_retries=3)
+        # a raised header task would fail the whole chord, and with it every other video
+        logger.exception('AI comment generation failed for video %s', video_id)
+        return {
+            'video_id': video_id, 'status': 'failed', 'error': str(exc),
+            'comments_generated': 0, 'total_generated': 0,
+        }
+    finally:
+        lease.release()
+
+
+@shared_task
+def aggregate_ai_comment_results(results):
+    processed = [result for result in results if result['status'] == 'completed']
+    failed = [result for result in results if result['status'] == 'failed']
+    
+    return {
+        'task': 'generate_ai_comments_for_popular_videos',
+        'status': 'completed',
+        'total_comments_generated': sum(result['total_generated'] for result in processed),
+        'videos_processed': len(processed),
+        'videos_skipped': len(results) - len(processed) - len(failed),
+        'videos_failed': len(failed),
+        'errors': [{'video_id': result['video_id'], 'error': result['error']} for result in failed],
+        'results': [
+            {
+                'video_id': result['video_id'],
+                'video_title': result['video_title'],
+                'comments_generated': result['comments_generated']
+            }
+            for result in processed
+        ],
+        'timestamp': timezone.now().isoformat()
+    }
 
 
 @shared_task(bind=True)
 def analyze_and_reply_to_recent_comments(self):
-    try:
-        recent_threshold = timezone.now() - timedelta(minutes=30)
+    with task_lease('comments.analyze_and_reply_to_recent_comments') as lease:
+        if not lease.acquired:
+            return skipped_run('analyze_and_reply_to_recent_comments')
         
-        recent_comments = Comment.objects.filter(
-            created_at__gte=recent_threshold,
-            is_ai_generated=False,
-            parent_comment__isnull=True,
-            replies__isnull=True
-        ).select_related('video').order_by('-like_count', '-created_at')[:10]
+        try:
+            recent_threshold = timezone.now() - timedelta(minutes=30)
         
-        replies_generated = 0
-        results = []
+            recent_comments = Comment.objects.filter(
+                created_at__gte=recent_threshold,
+                is_ai_generated=False,
+                parent_comment__isnull=True,
+                replies__isnull=True
+            ).select_related('video').order_by('-like_count', '-created_at')[:10]
         
-        for comment in recent_comments:
-            analysis = youtube_ai_engine.analyze_comment_for_business_opportunity(comment)
+            replies_generated = 0
+            results = []
+        
+            for comment in recent_comments:
+                analysis = youtube_ai_engine.analyze_comment_for_business_opportunity(comment)
             
-            if analysis['should_reply']:
-                business_reply = youtube_ai_engine.generate_business_reply(comment, analysis)
-                if business_reply:
-                    replies_generated += 1
-                    results.append({
-                        'original_comment_id': comment.id,
-                        'reply_id': business_reply.id,
-                        'reply_type': analysis['reply_type'],
-                        'video_title': comment.video.title
-                    })
+                if analysis['should_reply']:
+                    business_reply = youtube_ai_engine.generate_business_reply(comment, analysis)
+                    if business_reply:
+                        replies_generated += 1
+                        results.append({
+                            'original_comment_id': comment.id,
+                            'reply_id': business_reply.id,
+                            'reply_type': analysis['reply_type'],
+                            'video_title': comment.video.title
+                        })
         
-        return {
-            'task': 'analyze_and_reply_to_recent_comments',
-            'status': 'completed',
-            'replies_generated': replies_generated,
-            'comments_analyzed': len(recent_comments),
-            'results': results,
-            'timestamp': timezone.now().isoformat()
-        }
+            return {
+                'task': 'analyze_and_reply_to_recent_comments',
+                'status': 'completed',
+                'replies_generated': replies_generated,
+                'comments_analyzed': len(recent_comments),
+                'results': results,
+                'timestamp': timezone.now().isoformat()
+            }
         
-    except Exception as exc:
-        self.retry(exc=exc, countdown=60, max_retries=3)
+        except Exception as exc:
+            self.retry(exc=exc, countdown=60, max_retries=3)
 
 
 @shared_task(bind=True)
 def cleanup_old_ai_comments(self):
-    try:
-        old_threshold = timezone.now() - timedelta(days=30)
+    # the purge stops after time_limit and does not heartbeat, so the lease outlives it
+    time_limit = settings.YOUTUBE_SIMULATION['COMMENT_PURGE_TIME_LIMIT']
+    with task_lease('comments.cleanup_old_ai_comments', ttl=time_limit + 60) as lease:
+        if not lease.acquired:
+            return skipped_run('cleanup_old_ai_comments')
         
-        old_comments = Comment.objects.filter(
-            is_ai_generated=True,
-            created_at__lt=old_threshold
-        )
+        try:
+            old_threshold = timezone.now() - timedelta(days=settings.YOUTUBE_SIMULATION['AI_COMMENT_RETENTION_DAYS'])
         
-        deleted_count = old_comments.count()
-        old_comments.delete()
+            old_comments = Comment.objects.filter(
+                is_ai_generated=True,
+                created_at__lt=old_threshold
+            )
         
-        return {
-            'task': 'cleanup_old_ai_comments',
-            'status': 'completed',
-            'deleted_comments': deleted_count,
-            'timestamp': timezone.now().isoformat()
-        }
+            purge = CommentPurge(
+                'comments.cleanup_old_ai_comments',
+                old_comments,
+                batch_size=settings.YOUTUBE_SIMULATION['COMMENT_PURGE_BATCH_SIZE'],
+            )
+            stats = purge.run(time_limit=time_limit)
         
-    except Exception as exc:
-        self.retry(exc=exc, countdown=60, max_retries=3)
+            return {
+                'task': 'cleanup_old_ai_comments',
+                'status': 'completed' if stats['completed'] else 'partial',
+                **stats,
+                'timestamp': timezone.now().isoformat()
+            }
+        
+        except Exception as exc:
+            self.retry(exc=exc, countdown=60, max_retries=3)
 
 
 @shared_task
@@ -175,4 +283,126 @@ def generate_user_comments_batch(video_id, count=5):
             'error': f'Video with id {video_id} does not exist'
         }
     except Exception as exc:
-        raise exc
\ No newline at end of file
+        raise exc
+
+
+# jobs started from the CommentViewSet AI actions, the Job row carries progress and result
+
+
+@shared_task(bind=True)
+def run_generate_user_comments_job(self, job_id, video_id, count):
+    job = Job.objects.get(pk=job_id)
+    try:
+        video = Video.objects.get(id=video_id)
+        job.start(total=count)
+        
+        generated_comments = []
+        for _ in range(count):
+            generated_comments.append(Comment.generate_user_comment(video=video))
+            job.advance()
+        
+        result = {
+            'message': f'Generated {count} realistic user comments',
+            'comment_type': 'user_simulation',
+            'comments': CommentListSerializer(generated_comments, many=True).data
+        }
+        job.succeed(result)
+        return {'task': 'run_generate_user_comments_job', 'status': 'completed', 'job_id': job_id}
+        
+    except Exception as exc:
+        job.fail(str(exc))
+        return {'task': 'run_generate_user_comments_job', 'status': 'error', 'job_id': job_id, 'error': str(exc)}
+
+
+@shared_task(bind=True)
+def run_analyze_and_reply_job(self, job_id, video_id):
+    job = Job.objects.get(pk=job_id)
+    try:
+        video = Video.objects.get(id=video_id)
+        user_comments = list(Comment.objects.filter(
+            video=video,
+            parent_comment__isnull=True
+        ).order_by('-created_at')[:10])
+        job.start(total=len(user_comments))
+        
+        results = []
+        business_replies = []
+        
+        for comment in user_comments:
+            analysis = Comment.analyze_for_business_opportunity(comment)
+            
+            result = {
+                'comment_id': comment.id,
+                'comment_content': comment.content,
+                'analysis': analysis
+            }
+            
+            if analysis['should_reply']:
+                business_reply = Comment.generate_business_reply(comment, analysis)
+                if business_reply:
+                    result['business_reply'] = {
+                        'id': business_reply.id,
+                        'content': business_reply.content,
+                        'author': business_reply.author_name
+                    }
+                    business_replies.append(business_reply)
+            
+            results.append(result)
+            job.advance()
+        
+        job.succeed({
+            'message': f'Analyzed {len(user_comments)} comments, generated {len(business_replies)} business replies',
+            'techtest_workflow': 'comment_analysis_and_business_engagement',
+            'video_title': video.title,
+            'analysis_results': results
+        })
+        return {'task': 'run_analyze_and_reply_job', 'status': 'completed', 'job_id': job_id}
+        
+    except Exception as exc:
+        job.fail(str(exc))
+        return {'task': 'run_analyze_and_reply_job', 'status': 'error', 'job_id': job_id, 'error': str(exc)}
+
+
+@shared_task(bind=True)
+def run_channel_promotion_job(self, job_id, video_id, offer_type=None):
+    job = Job.objects.get(pk=job_id)
+    try:
+        video = Video.objects.get(id=video_id)
+        job.start(total=1)
+        
+        promo_comment = Comment.generate_channel_promotional_comment(
+            video=video,
+            offer_type=offer_type
+        )
+        job.advance()
+        
+        job.succeed({
+            'message': 'Channel promotional comment generated successfully',
+            'comment_type': 'channel_promotion',
+            'channel_name': video.channel_name,
+            'offer_type': offer_type or 'random',
+            'comment': CommentListSerializer(promo_comment).data
+        })
+        return {'task': 'run_channel_promotion_job', 'status': 'completed', 'job_id': job_id}
+        
+    except Exception as exc:
+        job.fail(str(exc))
+        return {'task': 'run_channel_promotion_job', 'status': 'error', 'job_id': job_id, 'error': str(exc)}
+
+
+@shared_task
+def flush_comment_likes(comment_id):
+    # writes the likes coalesced by apps.comments.likes during the window
+    from .likes import apply_likes, flush_key
+
+    # a like arriving from now on schedules the next flush
+    cache.delete(flush_key(comment_id))
+    likes_applied = apply_likes(comment_id, 0)
+
+    return {
+        'task': 'flush_comment_likes',
+        'status': 'success',
+        'comment_id': comment_id,
+        'likes_applied': likes_applied,
+        'timestamp': timezone.now().isoformat()
+    }
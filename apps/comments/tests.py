@@ -1,3 +1,419 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# test add maybe later
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from kombu.exceptions import OperationalError as BrokerError
+from rest_framework.renderers import JSONRenderer
+
+from apps.comments.ai_engine import youtube_ai_engine
+from apps.comments.likes import like_comment, pending_key
+from apps.comments.models import ArchivedComment, Comment
+from apps.comments.purge import CommentPurge
+from apps.comments.tasks import (
+    flush_comment_likes, generate_ai_comments_for_popular_videos, generate_ai_comments_for_video,
+    run_generate_user_comments_job,
+)
+from apps.comments.serializers import (
+    CommentBatchCreateSerializer, CommentListSerializer, CommentListValuesSerializer
+)
+from apps.core import outbox
+from apps.core.locks import Lease
+from apps.core.models import Job, OutboxEvent, TaskLease, Watermark
+from apps.core.renderers import ORJSONRenderer
+from apps.core.testing import ExplainMixin
+from apps.videos.models import Video
+
+
+class HotQueryIndexTests(ExplainMixin, TestCase):
+    """
+    EXPLAIN the hot comment queries with and without the indexes added in
+    comments.0004 and check the planner switches over to them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.videos = [
+            Video.objects.create(title=f'Index test {number}', channel_name='Indexes', duration=60)
+            for number in range(10)
+        ]
+        comments = []
+        for video in cls.videos:
+            for number in range(100):
+                comments.append(Comment(
+                    video=video,
+                    content=f'comment {number}',
+                    author_name='tester',
+                    is_ai_generated=number % 3 == 0,
+                    is_approved=number % 10 != 0,
+                ))
+        Comment.objects.bulk_create(comments)
+        parents = Comment.objects.filter(video=cls.videos[0])[:20]
+        Comment.objects.bulk_create([
+            Comment(video=parent.video, parent_comment=parent, content='reply', author_name='tester')
+            for parent in parents
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_video_thread_uses_partial_index(self):
+        queryset = Comment.objects.filter(
+            video=self.videos[0],
+            parent_comment__isnull=True,
+            is_approved=True
+        ).order_by('-created_at')[:20]
+        self.assertUsesIndex(queryset, 'comment_video_thread_idx')
+
+    def test_comment_stats_use_covering_index(self):
+        queryset = Comment.objects.filter(
+            video=self.videos[0],
+            is_ai_generated=True,
+            is_approved=True
+        ).order_by().values('video')
+        self.assertUsesIndex(queryset, 'comments_co_video_i_9c5f25_idx')
+
+    def test_recent_user_comments_use_partial_index(self):
+        queryset = Comment.objects.filter(
+            created_at__gte=timezone.now() - timedelta(minutes=30),
+            is_ai_generated=False,
+            parent_comment__isnull=True,
+            replies__isnull=True
+        ).order_by('-like_count', '-created_at')[:10]
+        self.assertUsesIndex(queryset, 'comment_user_recent_idx')
+
+    def test_ai_cleanup_uses_partial_index(self):
+        queryset = Comment.objects.filter(
+            is_ai_generated=True,
+            created_at__lt=timezone.now() - timedelta(days=30)
+        ).order_by()
+        self.assertUsesIndex(queryset, 'comment_ai_created_idx')
+
+
+class CommentListValuesSerializerTests(TestCase):
+    """
+    the values() list serializer and orjson must give the bytes of
+    CommentListSerializer and JSONRenderer
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        video = Video.objects.create(title='Values test', channel_name='Values', duration=60)
+        for number in range(10):
+            Comment.objects.create(
+                video=video,
+                content=f'comment {number} "quoted" \u00fc',
+                author_name='tester',
+                like_count=number,
+                is_ai_generated=number % 2 == 0,
+            )
+
+    def test_same_output_as_model_serializer(self):
+        queryset = Comment.objects.select_related('video').order_by('id')
+        expected = JSONRenderer().render(CommentListSerializer(queryset, many=True).data)
+        rows = queryset.values(*CommentListValuesSerializer.columns())
+        self.assertEqual(ORJSONRenderer().render(CommentListValuesSerializer(rows).data), expected)
+
+
+class CommentLikeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        video = Video.objects.create(title='Likes test', channel_name='Likes', duration=60)
+        cls.comment = Comment.objects.create(video=video, content='like me', author_name='tester')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_add_like_is_one_update_without_recount(self):
+        # UPDATE ... SET like_count = like_count + 1, then read the new count back
+        with self.assertNumQueries(2):
+            self.comment.add_like()
+        self.assertEqual(self.comment.like_count, 1)
+
+    @override_settings(YOUTUBE_SIMULATION={**settings.YOUTUBE_SIMULATION, 'COMMENT_LIKE_WINDOW_SECONDS': 2})
+    def test_per_process_cache_writes_every_like(self):
+        # a worker could not see likes left pending in this process's cache
+        with mock.patch.object(flush_comment_likes, 'apply_async') as schedule:
+            counts = [like_comment(Comment.objects.get(pk=self.comment.pk)) for _ in range(3)]
+        schedule.assert_not_called()
+        self.assertEqual(counts, [1, 2, 3])
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).like_count, 3)
+
+    @override_settings(YOUTUBE_SIMULATION={**settings.YOUTUBE_SIMULATION, 'COMMENT_LIKE_WINDOW_SECONDS': 2})
+    @mock.patch('apps.comments.likes.is_shared', return_value=True)
+    def test_burst_is_coalesced_into_one_update(self, is_shared):
+        with mock.patch.object(flush_comment_likes, 'apply_async') as schedule:
+            counts = [like_comment(Comment.objects.get(pk=self.comment.pk)) for _ in range(10)]
+
+        # the first like is written at once, the other nine wait for one flush
+        schedule.assert_called_once_with((self.comment.pk,), countdown=2)
+        self.assertEqual(counts[-1], 10)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).like_count, 1)
+        self.assertEqual(cache.get(pending_key(self.comment.pk)), 9)
+
+        with self.assertNumQueries(1):
+            flush_comment_likes(self.comment.pk)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).like_count, 10)
+        self.assertEqual(cache.get(pending_key(self.comment.pk)), 0)
+
+
+class CommentBatchCreateTests(TestCase):
+    """
+    POST /api/v1/comments/batch/ validates every item, resolves the videos with one
+    query and creates the comments with one INSERT
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.videos = [
+            Video.objects.create(title=f'Batch test {number}', channel_name='Batch', duration=60)
+            for number in range(3)
+        ]
+
+    def items(self, video_ids):
+        return [
+            {'video_id': video_id, 'content': f'Batch comment {number}', 'author_name': 'Batcher'}
+            for number, video_id in enumerate(video_ids)
+        ]
+
+    def post(self, comments):
+        return self.client.post(
+            '/api/v1/comments/batch/', {'comments': comments}, content_type='application/json', HTTP_HOST='localhost'
+        )
+
+    def test_valid_batch(self):
+        response = self.post(self.items([video.pk for video in self.videos] * 2))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['message'], 'Created 6 comments')
+        self.assertEqual(len(response.json()['comments']), 6)
+        comments = Comment.objects.filter(author_name='Batcher')
+        self.assertEqual(comments.count(), 6)
+        self.assertFalse(comments.filter(is_approved=False).exists())
+        self.assertFalse(comments.filter(is_ai_generated=True).exists())
+        self.assertEqual(OutboxEvent.objects.filter(topic='comment', action='created').count(), 6)
+
+    def test_unknown_video_is_a_per_item_error(self):
+        response = self.post(self.items([self.videos[0].pk, 987654, self.videos[1].pk]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['comments'], [
+            {}, {'video_id': ['Invalid pk "987654" - object does not exist.']}, {}
+        ])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_batch_size_is_capped(self):
+        limit = settings.YOUTUBE_SIMULATION['COMMENT_BATCH_MAX_SIZE']
+        response = self.post(self.items([self.videos[0].pk] * (limit + 1)))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()['comments']['non_field_errors'], [f'Ensure this field has no more than {limit} elements.']
+        )
+        self.assertEqual(self.post(self.items([self.videos[0].pk] * limit)).status_code, 201)
+
+    def test_empty_batch_is_rejected(self):
+        response = self.post([])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('comments', response.json())
+
+    def test_videos_are_resolved_in_one_query(self):
+        serializer = CommentBatchCreateSerializer(data={'comments': self.items([video.pk for video in self.videos] * 5)})
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(
+            {item['video'] for item in serializer.validated_data['comments']}, set(self.videos)
+        )
+
+
+class CommentPurgeTests(TestCase):
+    """
+    CommentPurge deletes in id-range batches with their reply threads, resumes from
+    its watermark, and leaves the comment counts to the outbox
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.video = Video.objects.create(title='Purge test', channel_name='Purge', duration=60)
+        cls.other = Video.objects.create(title='Purge kept', channel_name='Purge', duration=60)
+        cls.old = Comment.objects.bulk_create([
+            Comment(video=cls.video, content=f'old {number}', author_name='bot', is_ai_generated=True)
+            for number in range(25)
+        ])
+        # a user reply to an old AI comment, and a reply to that reply
+        cls.reply = Comment.objects.create(
+            video=cls.video, parent_comment=cls.old[0], content='reply', author_name='tester'
+        )
+        cls.nested = Comment.objects.create(
+            video=cls.video, parent_comment=cls.reply, content='nested', author_name='tester'
+        )
+        cls.kept = Comment.objects.create(video=cls.other, content='kept', author_name='tester')
+        outbox.drain()
+
+    def purge(self, **kwargs):
+        return CommentPurge('tests.purge', Comment.objects.filter(is_ai_generated=True), **kwargs)
+
+    def test_batches_and_reply_threads(self):
+        stats = self.purge(batch_size=10).run()
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(stats['deleted_comments'], 27)
+        self.assertEqual(stats['videos_affected'], 1)
+        self.assertTrue(stats['completed'])
+        self.assertEqual(list(Comment.objects.values_list('pk', flat=True)), [self.kept.pk])
+        # a finished pass starts over next time
+        self.assertEqual(Watermark.objects.get(name='tests.purge').value, 0)
+
+    def test_time_limit_checkpoints_and_resumes(self):
+        # started, the check before the first batch, then past the limit
+        with mock.patch('apps.comments.purge.time.perf_counter', side_effect=[0, 0, 100, 100]):
+            stats = self.purge(batch_size=10).run(time_limit=5)
+        self.assertEqual(stats['batches'], 1)
+        self.assertFalse(stats['completed'])
+        self.assertEqual(Watermark.objects.get(name='tests.purge').value, self.old[9].pk)
+        self.assertFalse(Comment.objects.filter(pk__in=[self.reply.pk, self.nested.pk]).exists())
+
+        stats = self.purge(batch_size=10).run()
+        self.assertEqual(stats['resumed_from_id'], self.old[9].pk)
+        self.assertEqual(stats['deleted_comments'], 15)
+        self.assertTrue(stats['completed'])
+
+    def test_zero_time_limit_deletes_nothing(self):
+        stats = self.purge().run(time_limit=0)
+        self.assertEqual(stats['batches'], 0)
+        self.assertFalse(stats['completed'])
+        self.assertEqual(Comment.objects.count(), 28)
+
+    def test_counts_are_repaired_through_the_outbox(self):
+        self.assertEqual(Video.objects.get(pk=self.video.pk).comment_count, 27)
+        self.purge(batch_size=10).run()
+        # one event per video and batch
+        self.assertEqual(
+            list(OutboxEvent.objects.filter(action='purged').values_list('object_id', flat=True)),
+            [self.video.pk] * 3
+        )
+        self.assertEqual(Video.objects.get(pk=self.video.pk).comment_count, 27)
+        outbox.drain()
+        self.assertEqual(Video.objects.get(pk=self.video.pk).comment_count, 0)
+        self.assertEqual(Video.objects.get(pk=self.other.pk).comment_count, 1)
+
+    def test_wide_reply_levels_are_chunked(self):
+        Comment.objects.bulk_create([
+            Comment(video=self.other, parent_comment=self.old[1], content=f'wide {number}', author_name='tester')
+            for number in range(7)
+        ])
+        stats = self.purge(batch_size=3).run()
+        self.assertEqual(stats['deleted_comments'], 34)
+        self.assertEqual(stats['videos_affected'], 2)
+        self.assertEqual(list(Comment.objects.values_list('pk', flat=True)), [self.kept.pk])
+        outbox.drain()
+        self.assertEqual(Video.objects.get(pk=self.other.pk).comment_count, 1)
+
+    def test_archive_copies_before_deleting(self):
+        self.purge(archive=True).run()
+        self.assertEqual(ArchivedComment.objects.count(), 27)
+        self.assertTrue(ArchivedComment.objects.filter(pk=self.nested.pk, parent_comment_id=self.reply.pk).exists())
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class AICommentFanOutTests(TestCase):
+    """
+    the chord of per-video generation tasks, run inline as with CELERY_ALWAYS_EAGER
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.videos = [
+            Video.objects.create(
+                title=f'Fan out {number}',
+                channel_name='Fan out',
+                duration=60,
+                status='published',
+                published_at=timezone.now() - timedelta(days=1),
+                view_count=1000 - number,
+            )
+            for number in range(3)
+        ]
+
+    def test_chord_aggregates_every_video(self):
+        result = generate_ai_comments_for_popular_videos.apply().get()
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual(result['videos_processed'], 3)
+        self.assertEqual(result['videos_skipped'], 0)
+        self.assertEqual(result['total_comments_generated'], Comment.objects.count())
+        self.assertEqual({row['video_id'] for row in result['results']}, {video.pk for video in self.videos})
+        # the per-video leases are gone again, not left behind as one row per video
+        self.assertFalse(TaskLease.objects.filter(name__startswith='comments.ai_comments.video.').exists())
+
+    def test_failed_video_does_not_fail_the_chord(self):
+        build = youtube_ai_engine.build_user_comment
+
+        def flaky(video):
+            if video.pk == self.videos[1].pk:
+                raise RuntimeError('engine down')
+            return build(video=video)
+
+        with mock.patch.object(youtube_ai_engine, 'build_user_comment', side_effect=flaky):
+            result = generate_ai_comments_for_popular_videos.apply().get()
+        self.assertEqual(result['videos_processed'], 2)
+        self.assertEqual(result['videos_failed'], 1)
+        self.assertEqual(result['videos_skipped'], 0)
+        self.assertEqual(result['errors'], [{'video_id': self.videos[1].pk, 'error': 'engine down'}])
+        self.assertFalse(TaskLease.objects.filter(name__startswith='comments.ai_comments.video.').exists())
+
+    def test_video_held_by_another_run_is_skipped(self):
+        held = Lease(f'comments.ai_comments.video.{self.videos[0].pk}', 60)
+        self.assertTrue(held.acquire())
+        result = generate_ai_comments_for_popular_videos.apply().get()
+        self.assertEqual(result['videos_processed'], 2)
+        self.assertEqual(result['videos_skipped'], 1)
+        self.assertFalse(Comment.objects.filter(video=self.videos[0]).exists())
+        held.release()
+
+        self.assertEqual(generate_ai_comments_for_video.apply((self.videos[0].pk,)).get()['status'], 'completed')
+
+    def test_missing_video(self):
+        result = generate_ai_comments_for_video.apply((0,)).get()
+        self.assertEqual(result['status'], 'missing')
+
+
+class CommentJobTests(TestCase):
+    """
+    the generation endpoints queue a Job and answer 202, or 503 with the job
+    failed when the broker cannot take the task
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.video = Video.objects.create(title='Job test', channel_name='Jobs', duration=60)
+
+    def post(self):
+        return self.client.post(
+            '/api/v1/comments/generate_user_comments/',
+            {'video_id': self.video.pk, 'count': 2},
+            content_type='application/json',
+            HTTP_HOST='localhost',
+        )
+
+    @mock.patch.object(run_generate_user_comments_job, 'apply_async')
+    def test_queued_job_is_pending(self, apply_async):
+        response = self.post()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'pending')
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['task_id'], response.json()['id'])
+
+    @mock.patch.object(run_generate_user_comments_job, 'apply_async', side_effect=BrokerError('Connection refused'))
+    def test_broker_down_fails_the_job(self, apply_async):
+        response = self.post()
+        self.assertEqual(response.status_code, 503)
+        job = Job.objects.get(pk=response.json()['id'])
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Connection refused', job.error)
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_eager_mode_answers_with_the_finished_job(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'succeeded')
+        self.assertEqual(Comment.objects.filter(video=self.video).count(), 2)
@@ -2,25 +2,50 @@
 views for the comments API
 """
 
+import logging
+
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db.models import Count, Q, Prefetch
+from django.db.models import Count, Max, Q, Prefetch, Sum
+from django.urls import reverse
+from kombu.exceptions import OperationalError as BrokerError
 
+from .likes import like_comment
 from .models import Comment
 from .serializers import (
-    CommentListSerializer, CommentDetailSerializer, CommentCreateSerializer,
-    AICommentGenerationSerializer, CommentAnalysisSerializer,
-    ChannelPromotionalCommentSerializer
+    CommentListSerializer, CommentListValuesSerializer, CommentDetailSerializer,
+    CommentCreateSerializer, CommentBatchCreateSerializer, AICommentGenerationSerializer,
+    CommentAnalysisSerializer, ChannelPromotionalCommentSerializer
+)
+from .tasks import (
+    run_generate_user_comments_job, run_analyze_and_reply_job,
+    run_channel_promotion_job
 )
+from apps.core.conditional import ConditionalGetMixin
+from apps.core.fastserializers import ValuesListMixin
+from apps.core.models import Job
+from apps.core.serializers import JobSerializer
 from apps.videos.models import Video
 
+logger = logging.getLogger(__name__)
+
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(ConditionalGetMixin, ValuesListMixin, viewsets.ModelViewSet):
     # viewset for comments with full CRUD operations and custom actions
     permission_classes = [permissions.AllowAny]
+    values_serializer_class = CommentListValuesSerializer
+    validator_aggregates = {
+        'updated_at': Max('updated_at'),
+        'likes': Sum('like_count'),
+        'video_updated_at': Max('video__updated_at'),
+    }
+    detail_validator_aggregates = {
+        'replies_updated_at': Max('replies__updated_at'),
+        'replies': Count('replies'),
+    }
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     search_fields = ['content', 'author_name']
     filterset_fields = ['video', 'author_name', 'is_ai_generated', 'is_approved']
@@ -51,6 +76,8 @@ class CommentViewSet(viewsets.ModelViewSet):
             return CommentListSerializer
         elif self.action == 'create':
             return CommentCreateSerializer
+        elif self.action == 'batch_create':
+            return CommentBatchCreateSerializer
         elif self.action == 'generate_ai':
             return AICommentGenerationSerializer
         elif self.action == 'analyze_and_reply':
@@ -62,14 +89,27 @@ class CommentViewSet(viewsets.ModelViewSet):
         response = super().create(request, *args, **kwargs)
         return response
 
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch_create(self, request):
+        serializer = CommentBatchCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        comments = serializer.save()
+        
+        return Response({
+            'message': f'Created {len(comments)} comments',
+            'comments': CommentListSerializer(comments, many=True).data
+        }, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         comment = self.get_object()
-        comment.add_like()
+        like_count = like_comment(comment)
         
         return Response({
             'message': 'Comment liked successfully',
-            'like_count': comment.like_count
+            'like_count': like_count
         })
 
     @action(detail=False, methods=['post'])
@@ -79,18 +119,12 @@ class CommentViewSet(viewsets.ModelViewSet):
             video = serializer.validated_data['video_id']
             count = serializer.validated_data['count']
             
-            generated_comments = []
-            for _ in range(count):
-                comment = Comment.generate_user_comment(video=video)
-                generated_comments.append(comment)
-            
-            response_data = CommentListSerializer(generated_comments, many=True).data
-            
-            return Response({
-                'message': f'Generated {count} realistic user comments',
-                'comment_type': 'user_simulation',
-                'comments': response_data
-            }, status=status.HTTP_201_CREATED)
+            return self.enqueue_job(
+                request,
+                'generate_user_comments',
+                run_generate_user_comments_job,
+                {'video_id': video.id, 'count': count}
+            )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['post'])
@@ -100,41 +134,12 @@ class CommentViewSet(viewsets.ModelViewSet):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         video = serializer.validated_data['video_id']
-        user_comments = Comment.objects.filter(
-            video=video,
-            parent_comment__isnull=True
-        ).order_by('-created_at')[:10]
-        
-        results = []
-        business_replies = []
-        
-        for comment in user_comments:
-            analysis = Comment.analyze_for_business_opportunity(comment)
-            
-            result = {
-                'comment_id': comment.id,
-                'comment_content': comment.content,
-                'analysis': analysis
-            }
-            
-            if analysis['should_reply']:
-                business_reply = Comment.generate_business_reply(comment)
-                if business_reply:
-                    result['business_reply'] = {
-                        'id': business_reply.id,
-                        'content': business_reply.content,
-                        'author': business_reply.author_name
-                    }
-                    business_replies.append(business_reply)
-            
-            results.append(result)
-        
-        return Response({
-            'message': f'Analyzed {len(user_comments)} comments, generated {len(business_replies)} business replies',
-            'techtest_workflow': 'comment_analysis_and_business_engagement',
-            'video_title': video.title,
-            'analysis_results': results
-        }, status=status.HTTP_200_OK)
+        return self.enqueue_job(
+            request,
+            'analyze_and_reply',
+            run_analyze_and_reply_job,
+            {'video_id': video.id}
+        )
 
     @action(detail=False, methods=['post'])
     def generate_business_engagement(self, request):
@@ -177,26 +182,36 @@ class CommentViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'])
     def generate_channel_promotion(self, request):
-        from .serializers import ChannelPromotionalCommentSerializer
-        
         serializer = ChannelPromotionalCommentSerializer(data=request.data)
         if serializer.is_valid():
             video = serializer.validated_data['video_id']
             offer_type = serializer.validated_data.get('offer_type')
             
-            promo_comment = Comment.generate_channel_promotional_comment(
-                video=video,
-                offer_type=offer_type
+            return self.enqueue_job(
+                request,
+                'generate_channel_promotion',
+                run_channel_promotion_job,
+                {'video_id': video.id, 'offer_type': offer_type}
             )
-            
-            response_data = CommentListSerializer(promo_comment).data
-            
-            return Response({
-                'message': 'Channel promotional comment generated successfully',
-                'comment_type': 'channel_promotion',
-                'channel_name': video.channel_name,
-                'offer_type': offer_type or 'random',
-                'comment': response_data
-            }, status=status.HTTP_201_CREATED)
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def enqueue_job(self, request, job_type, task, params):
+        # generation runs in a Celery worker, the client polls /api/v1/jobs/<id>/
+        job = Job.objects.create(job_type=job_type, params=params)
+        response_status = status.HTTP_202_ACCEPTED
+        try:
+            task.apply_async(kwargs={'job_id': str(job.id), **params}, task_id=str(job.id))
+        except BrokerError as exc:
+            # the broker is unreachable: no worker will ever pick the job up, so it fails now
+            logger.exception('could not queue %s job %s', job_type, job.id)
+            job.fail(f'Could not queue the job: {exc}')
+            response_status = status.HTTP_503_SERVICE_UNAVAILABLE
+        
+        # in eager mode the task has already finished at this point
+        job.refresh_from_db()
+        data = JobSerializer(job).data
+        data['status_url'] = request.build_absolute_uri(
+            reverse('core_api:job-detail', args=[job.id])
+        )
+        return Response(data, status=response_status)
@@ -0,0 +1,81 @@
+"""
+helpers for async views: run independent ORM queries at the same time.
+django's async ORM (aget, acount, ...) hands every query to the one thread of the
+request, one after another, so queries that should overlap go to a small pool of
+threads instead, each with its own database connection. the request's execute
+wrappers (apps.core.querywrappers) follow the queries onto the pool threads
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.paginator import Page
+from django.db import close_old_connections
+
+from .pagination import EstimatedCountPaginator, count_rows
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_READS['DB_THREADS'],
+            thread_name_prefix='db-read',
+        )
+    return _executor
+
+
+def run_query(fn):
+    # same connection lifecycle as a request (CONN_MAX_AGE, health checks)
+    close_old_connections()
+    try:
+        return fn()
+    finally:
+        close_old_connections()
+
+
+async def gather(*fns):
+    """
+    Runs the callables (each doing its own queries) in the pool and returns their
+    results in order. Querysets must be evaluated inside them, e.g. list(queryset).
+    """
+    # each call gets a copy of the request's context, and with it the request's query wrappers
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(
+        loop.run_in_executor(executor(), contextvars.copy_context().run, run_query, fn)
+        for fn in fns
+    ))
+
+
+def page_bounds(page_number, per_page):
+    try:
+        number = max(int(page_number), 1)
+    except (TypeError, ValueError):
+        number = 1
+    return number, (number - 1) * per_page
+
+
+async def get_page(queryset, per_page, page_number, *extra, count_queryset=None):
+    """
+    EstimatedCountPaginator(queryset, per_page).get_page(page_number) with the count
+    and the rows fetched at the same time, plus any extra callables run alongside
+    them. Returns the page followed by the results of the extra callables.
+    """
+    number, bottom = page_bounds(page_number, per_page)
+    (count, count_kind), rows, *results = await gather(
+        lambda: count_rows(queryset if count_queryset is None else count_queryset),
+        lambda: list(queryset[bottom:bottom + per_page]),
+        *extra,
+    )
+
+    paginator = EstimatedCountPaginator(queryset, per_page, count_queryset=count_queryset)
+    paginator.count, paginator.count_kind = count, count_kind
+    if number > paginator.num_pages:
+        # past the end, get_page() falls back to the last page
+        number, bottom = paginator.num_pages, (paginator.num_pages - 1) * per_page
+        rows, = await gather(lambda: list(queryset[bottom:bottom + per_page]))
+    return [Page(rows, number, paginator), *results]
@@ -0,0 +1,17 @@
+"""
+API URL config for core resources
+"""
+
+from django.urls import path, include
+from rest_framework.routers import SimpleRouter
+
+from .api_views import JobViewSet
+
+app_name = 'core_api'
+
+router = SimpleRouter()
+router.register(r'', JobViewSet, basename='job')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
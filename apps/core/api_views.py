@@ -0,0 +1,11 @@
+from rest_framework import mixins, permissions, viewsets
+
+from .models import Job
+from .serializers import JobSerializer
+
+
+class JobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    # status polling for background jobs, only by id so jobs cannot be enumerated
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [permissions.AllowAny]
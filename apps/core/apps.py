@@ -1,7 +1,24 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
-    verbose_name = 'Core'
\ No newline at end of file
+    verbose_name = 'Core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .querywrappers import install_dispatcher
+        connection_created.connect(install_dispatcher, dispatch_uid='apps.core.querywrappers')
+
+        from .taskruns import connect_celery_signals as connect_task_run_signals
+        connect_task_run_signals()
+
+        if settings.QUERY_STATS['ENABLED']:
+            from .querystats import connect_celery_signals
+            connect_celery_signals()
+
+        if settings.METRICS['ENABLED']:
+            from .metrics import connect_celery_signals as connect_metrics_signals
+            connect_metrics_signals()
@@ -0,0 +1,46 @@
+"""
+cache backends that count hits and misses for /api/metrics/
+"""
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends import dummy, locmem, redis
+
+from .metrics import record_cache
+
+_missing = object()
+
+
+class MetricsCacheMixin:
+    # get_or_set() and the default get_many() end up here as well
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        if value is _missing:
+            record_cache(self.metrics_name, 0, 1)
+            return default
+        record_cache(self.metrics_name, 1, 0)
+        return value
+
+
+class LocMemCache(MetricsCacheMixin, locmem.LocMemCache):
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.metrics_name = name or 'locmem'
+
+
+class RedisCache(MetricsCacheMixin, redis.RedisCache):
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self.metrics_name = 'redis'
+
+    def get_many(self, keys, version=None):
+        # BaseCache.get_many() goes through get(), the redis backend fetches in one round trip
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        record_cache(self.metrics_name, len(found), len(keys) - len(found))
+        return found
+
+
+def is_shared(alias=DEFAULT_CACHE_ALIAS):
+    # whether other processes (web workers, Celery) see the same entries
+    return not isinstance(caches[alias], (locmem.LocMemCache, dummy.DummyCache))
@@ -0,0 +1,142 @@
+"""
+conditional GET: ETag and Last-Modified computed from cheap validator queries
+(updated_at, counters, related timestamps), so a matching If-None-Match or
+If-Modified-Since gets a 304 before anything is serialized or rendered
+"""
+
+import asyncio
+import functools
+import hashlib
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db.models import Count
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_validators(values, *salt):
+    # every value goes into the (weak) ETag, the newest timestamp is Last-Modified
+    digest = hashlib.md5(repr((sorted(values.items()), salt)).encode()).hexdigest()
+    stamps = [value for value in values.values() if isinstance(value, datetime)]
+    return f'W/"{digest}"', max(stamps) if stamps else None
+
+
+def set_validators(response, etag, last_modified, vary=()):
+    # vary: the request headers the representation depends on, for shared caches
+    if vary:
+        patch_vary_headers(response, vary)
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def not_modified(request, etag, last_modified, vary=()):
+    # 304 (or 412 for a failed If-Match) when the request's validators match, otherwise None
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified, vary)
+    return response
+
+
+def conditional(validator, dated=True):
+    """
+    View decorator for the template views. validator(request, *args, **kwargs) runs
+    the validator query and returns its values, or None to skip (e.g. for a 404).
+    dated=False leaves out Last-Modified, for pages a delete can change: the newest
+    timestamp does not move then, so If-Modified-Since would answer 304.
+    Works on sync and async views; django's condition() needs two callables and
+    does not take async views before Django 5.0.
+    """
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                values = await sync_to_async(validator)(request, *args, **kwargs)
+                if values is None:
+                    return await view(request, *args, **kwargs)
+                etag, last_modified = make_validators(values)
+                if not dated:
+                    last_modified = None
+                response = not_modified(request, etag, last_modified)
+                if response is None:
+                    response = set_validators(await view(request, *args, **kwargs), etag, last_modified)
+                return response
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                values = validator(request, *args, **kwargs)
+                if values is None:
+                    return view(request, *args, **kwargs)
+                etag, last_modified = make_validators(values)
+                if not dated:
+                    last_modified = None
+                response = not_modified(request, etag, last_modified)
+                if response is None:
+                    response = set_validators(view(request, *args, **kwargs), etag, last_modified)
+                return response
+        return wrapper
+
+    return decorator
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified for list and retrieve of a DRF viewset. Both are validated by
+    validator_aggregates, a list over its filtered queryset plus list_validator_aggregates,
+    one object over its row plus detail_validator_aggregates and anything
+    retrieve_validators() adds. Staff may see other rows (drafts), so whether the
+    user is staff goes into the ETag and the responses vary on the credentials.
+    """
+
+    validator_aggregates = {}
+    # the row count moves when rows go away, by whichever delete path
+    list_validator_aggregates = {'count': Count('pk')}
+    detail_validator_aggregates = {}
+    validator_vary = ('Cookie', 'Authorization')
+
+    def list(self, request, *args, **kwargs):
+        values = self.list_validators(self.filter_queryset(self.get_queryset()))
+        etag, _ = make_validators(values, *self.validator_salt(request))
+        # a delete does not move the newest updated_at, so a list has no Last-Modified
+        return self.conditional(request, etag, None, super().list, *args, **kwargs)
+
+    def list_validators(self, queryset):
+        return queryset.order_by().aggregate(**self.validator_aggregates, **self.list_validator_aggregates)
+
+    def validator_salt(self, request):
+        # JSON and the browsable API are different representations of the same data
+        return type(self).__name__, request.accepted_renderer.format, request.user.is_staff
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            )
+            values = self.retrieve_validators(queryset)
+        except (TypeError, ValueError, ValidationError):
+            values = {}
+        if all(value is None for value in values.values()):
+            # no such object, let get_object() answer the 404
+            return super().retrieve(request, *args, **kwargs)
+        etag, last_modified = make_validators(values, *self.validator_salt(request))
+        return self.conditional(request, etag, last_modified, super().retrieve, *args, **kwargs)
+
+    def retrieve_validators(self, queryset):
+        # override to add what the representation reads from outside the row
+        return queryset.order_by().aggregate(**self.validator_aggregates, **self.detail_validator_aggregates)
+
+    def conditional(self, request, etag, last_modified, handler, *args, **kwargs):
+        response = not_modified(request._request, etag, last_modified, self.validator_vary)
+        if response is None:
+            response = set_validators(handler(request, *args, **kwargs), etag, last_modified, self.validator_vary)
+        return response
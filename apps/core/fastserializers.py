@@ -0,0 +1,248 @@
+"""
+read-only list serializers over queryset.values() rows. The fields of a DRF
+serializer are turned once into a getter per field building the dicts straight
+from the rows, so a list page needs neither model instances nor
+Field.to_representation, and gives the same output
+"""
+
+import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import models
+from django.utils import timezone
+from rest_framework import fields
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from apps.core.timing import span
+
+
+class ValuesSerializer:
+    """
+    ValuesSerializer(rows).data is serializer_class(rows, many=True).data for rows
+    of queryset.values(*Subclass.columns()). Fields whose source is not a column
+    (model properties) go in derived: {name: (columns, function)}, where
+    function(*values of the columns) returns what the property would.
+    """
+
+    serializer_class = None
+    derived = {}
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def columns(cls):
+        return cls.compile()[0]
+
+    @classmethod
+    def compile(cls):
+        # once per subclass, on first use (the serializer fields need the app registry)
+        if '_compiled' not in cls.__dict__:
+            cls._compiled = cls.build()
+        return cls._compiled
+
+    @classmethod
+    def build(cls):
+        """
+        Returns the values() columns and a function building the list from the rows:
+        one dict per row from a getter per field, a plain row[column] lookup with a
+        conversion only where the column's python value is not already what the
+        serializer field would return.
+        """
+        model = cls.serializer_class.Meta.model
+        columns, getters = [], []
+
+        for name, field in cls.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            convert = representation(cls, name, field)
+
+            if name in cls.derived:
+                sources, function = cls.derived[name]
+                columns.extend(sources)
+                getters.append((name, derived_getter(sources, function, convert)))
+                continue
+
+            model_field, nullable = resolve(model, field.source_attrs)
+            if model_field is None:
+                raise ImproperlyConfigured(
+                    f'{cls.__name__}: {name} ({field.source}) is not a column of {model.__name__}, add it to derived'
+                )
+            path = '__'.join(field.source_attrs)
+            columns.append(path)
+            getter = column_getter(path, None if is_unchanged(field, model_field) else convert, model_field.null)
+
+            # DRF leaves a field out (or sets None with allow_null) when a relation
+            # on the way is null, so nullable foreign keys of the path are fetched as well
+            guards = ['__'.join(field.source_attrs[:depth]) for depth in nullable]
+            columns.extend(guards)
+            if guards:
+                getter = guarded_getter(getter, guards, field.allow_null)
+            getters.append((name, getter))
+
+        return list(dict.fromkeys(columns)), list_builder(getters)
+
+    @property
+    def data(self):
+        with span('serializer'):
+            return self.compile()[1](self.rows, timezone.get_current_timezone() if settings.USE_TZ else None)
+
+
+class ValuesListMixin:
+    """
+    list() from values() rows through values_serializer_class instead of the
+    model serializer. Other actions and the browsable API forms are unchanged.
+    """
+
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        serializer_class = self.values_serializer_class
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = values_rows(queryset, serializer_class)
+
+        if self.paginator is not None:
+            # counting the rows would keep the joins for related columns (video__title),
+            # the model queryset counts without them
+            page = self.paginator.paginate_queryset(rows, request, view=self, count_queryset=queryset)
+            if page is not None:
+                return self.get_paginated_response(serializer_class(page).data)
+        return Response(serializer_class(rows).data)
+
+
+def values_rows(queryset, serializer_class):
+    return queryset.prefetch_related(None).values(*serializer_class.columns())
+
+
+# returned by a getter for a field DRF leaves out of the row
+OMIT = object()
+
+
+def column_getter(path, convert, null):
+    if convert is None:
+        return lambda row, tz: row[path]
+    # datetimes also get the current timezone, looked up once per page
+    takes_timezone = getattr(convert, 'takes_timezone', False)
+
+    def getter(row, tz):
+        value = row[path]
+        if value is None and null:
+            return None
+        return convert(value, tz) if takes_timezone else convert(value)
+    return getter
+
+
+def derived_getter(sources, function, convert):
+    takes_timezone = getattr(convert, 'takes_timezone', False)
+
+    def getter(row, tz):
+        value = function(*[row[source] for source in sources])
+        if value is None:
+            return None
+        return convert(value, tz) if takes_timezone else convert(value)
+    return getter
+
+
+def guarded_getter(getter, guards, allow_null):
+    def guarded(row, tz):
+        for guard in guards:
+            if row[guard] is None:
+                return None if allow_null else OMIT
+        return getter(row, tz)
+    return guarded
+
+
+def list_builder(getters):
+    getters = tuple(getters)
+
+    def serialize(rows, tz):
+        data = []
+        for row in rows:
+            item = {}
+            for name, getter in getters:
+                value = getter(row, tz)
+                if value is not OMIT:
+                    item[name] = value
+            data.append(item)
+        return data
+    return serialize
+
+
+def resolve(model, attrs):
+    # the model field at the end of a source path (None if it is not a column)
+    # and the depths on the path that follow a nullable foreign key
+    field, nullable = None, []
+    for depth, attr in enumerate(attrs, 1):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None, nullable
+        if field.many_to_many or field.one_to_many:
+            return None, nullable
+        if depth < len(attrs):
+            if not field.is_relation:
+                return None, nullable
+            if field.null:
+                nullable.append(depth)
+            model = field.related_model
+    return field, nullable
+
+
+def is_unchanged(field, model_field):
+    # the database value already is what field.to_representation returns
+    if isinstance(field, fields.BooleanField):
+        return isinstance(model_field, models.BooleanField)
+    if isinstance(field, fields.BigIntegerField) and getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING):
+        return False
+    if isinstance(field, fields.IntegerField):
+        return isinstance(model_field, (models.IntegerField, models.AutoField))
+    if isinstance(field, fields.FloatField):
+        return isinstance(model_field, models.FloatField)
+    if isinstance(field, fields.ChoiceField):
+        return isinstance(model_field, (models.CharField, models.TextField)) and all(
+            isinstance(key, str) for key in field.choice_strings_to_values.values()
+        )
+    if isinstance(field, fields.CharField):
+        return isinstance(model_field, (models.CharField, models.TextField))
+    return type(field) is fields.ReadOnlyField
+
+
+def representation(cls, name, field):
+    # what field.to_representation does for a non-null value, per field class
+    if isinstance(field, fields.BooleanField):
+        return bool
+    if isinstance(field, fields.BigIntegerField) and getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING):
+        return str
+    if isinstance(field, fields.IntegerField):
+        return int
+    if isinstance(field, fields.FloatField):
+        return float
+    if isinstance(field, fields.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: value if value == '' else choices.get(str(value), value)
+    if isinstance(field, fields.CharField):
+        return str
+    if isinstance(field, fields.DateTimeField) and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == fields.ISO_8601:
+        return iso_datetime(field)
+    if type(field) is fields.ReadOnlyField:
+        return lambda value: value
+    raise ImproperlyConfigured(f'{cls.__name__}: no values() representation for {type(field).__name__} {name}')
+
+
+def iso_datetime(field):
+    # DateTimeField.to_representation with the ISO 8601 format; tz is the current
+    # timezone (DateTimeField.default_timezone()) unless the field has its own
+    def convert(value, tz):
+        field_timezone = field.timezone if hasattr(field, 'timezone') else tz
+        if field_timezone is not None:
+            value = value.astimezone(field_timezone) if timezone.is_aware(value) else timezone.make_aware(value, field_timezone)
+        elif timezone.is_aware(value):
+            value = timezone.make_naive(value, datetime.timezone.utc)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    convert.takes_timezone = True
+    return convert
@@ -0,0 +1,147 @@
+"""
+locks for Celery tasks: cache_lock backed by the Django cache, and task_lease,
+database leases with heartbeats that keep runs of a periodic task from overlapping
+"""
+
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .metrics import record_lease
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def cache_lock(key, timeout):
+    # cache.add only succeeds when the key is missing, so one holder at a time.
+    # this is only distributed when CACHES points at a shared backend (Redis, Memcached)
+    token = uuid.uuid4().hex
+    acquired = cache.add(key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        # do not release a lock that expired and was taken over by someone else
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+class Lease:
+    """
+    One attempt at a TaskLease row. The row is taken with a conditional UPDATE (free
+    or expired), so exactly one run gets it on any database, and it expires ttl
+    seconds after the last heartbeat, so a run that died frees it by itself.
+
+    transient=True deletes the row on release instead of keeping it, for leases
+    named after objects (one per video) that would otherwise pile up.
+    """
+
+    def __init__(self, name, ttl, transient=False):
+        self.name = name
+        self.ttl = ttl
+        self.transient = transient
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+        self.held = False
+        self.last_heartbeat = 0
+
+    def acquire(self):
+        from .models import TaskLease
+
+        TaskLease.objects.get_or_create(name=self.name)
+        now = timezone.now()
+        self.acquired = self.held = bool(
+            TaskLease.objects.filter(name=self.name).filter(Q(owner='') | Q(expires_at__lt=now)).update(
+                owner=self.token,
+                acquired_at=now,
+                heartbeat_at=now,
+                expires_at=now + timedelta(seconds=self.ttl),
+                rerun_requested=False,
+            )
+        )
+        self.last_heartbeat = time.monotonic()
+        return self.acquired
+
+    def heartbeat(self):
+        """
+        Extends the lease; cheap enough for every iteration of a loop, it only writes
+        every ttl / 3 seconds. Returns False once the lease is lost (it expired and
+        another run took it), and the caller should stop.
+        """
+        from .models import TaskLease
+
+        if not self.held:
+            return False
+        if time.monotonic() - self.last_heartbeat < self.ttl / 3:
+            return True
+        now = timezone.now()
+        if not TaskLease.objects.filter(name=self.name, owner=self.token).update(
+            heartbeat_at=now, expires_at=now + timedelta(seconds=self.ttl)
+        ):
+            self.held = False
+            record_lease(self.name, 'lost')
+            logger.warning('lease %s expired while running, stopping this run', self.name)
+            return False
+        self.last_heartbeat = time.monotonic()
+        return True
+
+    def request_rerun(self):
+        from .models import TaskLease
+        TaskLease.objects.filter(name=self.name).exclude(owner='').update(rerun_requested=True)
+
+    def release(self):
+        # True when a skipped run asked for a follow-up while this one held the lease
+        from .models import TaskLease
+
+        if not self.held:
+            return False
+        self.held = False
+        if self.transient:
+            # a run that created the row again in between finds it gone and skips
+            TaskLease.objects.filter(name=self.name, owner=self.token).delete()
+            return False
+        TaskLease.objects.filter(name=self.name, owner=self.token).update(owner='', expires_at=None)
+        return bool(TaskLease.objects.filter(name=self.name, rerun_requested=True).update(rerun_requested=False))
+
+
+@contextmanager
+def task_lease(name, ttl=None, rerun=None):
+    """
+    At most one run of a periodic task at a time, across all workers. Yields the
+    Lease; when lease.acquired is False another run holds it and the caller returns
+    skipped_run(). Long runs call lease.heartbeat() as they go.
+
+    With rerun (a task), overlapping runs are coalesced instead of dropped: they ask
+    the holder for one follow-up run, which it sends when it finishes.
+    """
+    lease = Lease(name, ttl or settings.TASK_LEASES['TTL'])
+    if not lease.acquire():
+        if rerun is not None:
+            lease.request_rerun()
+        record_lease(name, 'skipped' if rerun is None else 'coalesced')
+        logger.info('lease %s is held by another run, skipping', name)
+        yield lease
+        return
+
+    record_lease(name, 'acquired')
+    try:
+        yield lease
+    finally:
+        if lease.release() and rerun is not None:
+            rerun.apply_async()
+
+
+def skipped_run(task_name):
+    return {
+        'task': task_name,
+        'status': 'skipped',
+        'reason': 'another run holds the lease',
+        'timestamp': timezone.now().isoformat()
+    }
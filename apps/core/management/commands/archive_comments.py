@@ -0,0 +1,123 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.comments.archive import (
+    add_months, archive_partition, create_partition, is_partitioned, month_start, monthly_partitions,
+)
+from apps.comments.models import Comment
+from apps.comments.purge import CommentPurge
+from apps.videos.models import Video
+
+# python manage.py archive_comments --months 6
+# run it monthly, it also creates the upcoming monthly partitions on PostgreSQL
+
+
+class Command(BaseCommand):
+    help = 'Move comments older than N months into the archive table, by partition on PostgreSQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=settings.YOUTUBE_SIMULATION['COMMENT_ARCHIVE_AFTER_MONTHS'],
+            help='Archive comments created before the start of the month N months ago',
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=settings.YOUTUBE_SIMULATION['COMMENT_PARTITION_MONTHS_AHEAD'],
+            help='Monthly partitions to keep ready ahead of the current month (PostgreSQL only)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.YOUTUBE_SIMULATION['COMMENT_PURGE_BATCH_SIZE'],
+            help='Comments moved per transaction when archiving row by row',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be archived',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        cutoff = add_months(month_start(timezone.now()), -options['months'])
+        self.stdout.write(f'Archiving comments created before {cutoff:%Y-%m-%d}...')
+
+        if is_partitioned():
+            archived = self.archive_partitions(cutoff, options)
+        else:
+            archived = self.archive_rows(cutoff, options)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{"Would archive" if options["dry_run"] else "Archived"} {archived} comments '
+                f'in {elapsed:.2f}s'
+            )
+        )
+
+    def archive_rows(self, cutoff, options):
+        old_comments = Comment.objects.filter(created_at__lt=cutoff)
+        if options['dry_run']:
+            return old_comments.count()
+
+        stats = CommentPurge(
+            'comments.archive_comments', old_comments, batch_size=options['batch_size'], archive=True
+        ).run()
+        self.stdout.write(
+            f'{stats["batches"]} batches, {stats["rows_per_second"]:,} rows/s, '
+            f'comment counts of {stats["videos_affected"]} videos queued for refresh'
+        )
+        return stats['deleted_comments']
+
+    def archive_partitions(self, cutoff, options):
+        current = month_start(timezone.now())
+        with connection.cursor() as cursor:
+            partitions = monthly_partitions(cursor)
+
+        upcoming = [
+            add_months(current, offset) for offset in range(options['months_ahead'] + 1)
+            if add_months(current, offset) not in partitions
+        ]
+        expired = [
+            (month, name) for month, name in partitions.items() if add_months(month, 1) <= cutoff
+        ]
+
+        # replies written after the cutoff to comments in an expired partition would be
+        # left pointing at archived rows, so their threads move to the archive first
+        crossing = Comment.objects.filter(created_at__gte=cutoff, parent_comment__created_at__lt=cutoff)
+
+        if options['dry_run']:
+            for month in upcoming:
+                self.stdout.write(f'Would create partition for {month:%Y-%m}')
+            for month, name in expired:
+                self.stdout.write(f'Would archive partition {name}')
+            return crossing.count() + Comment.objects.filter(created_at__lt=cutoff).count()
+
+        for month in upcoming:
+            with transaction.atomic(), connection.cursor() as cursor:
+                self.stdout.write(f'Created partition {create_partition(cursor, month)}')
+
+        archived = 0
+        if expired:
+            archived += CommentPurge(
+                'comments.archive_comments', crossing, batch_size=options['batch_size'], archive=True
+            ).run()['deleted_comments']
+
+        video_ids = set()
+        for month, name in expired:
+            with transaction.atomic(), connection.cursor() as cursor:
+                rows, partition_video_ids = archive_partition(cursor, name)
+            archived += rows
+            video_ids.update(partition_video_ids)
+            self.stdout.write(f'Archived partition {name} ({rows} comments)')
+
+        if video_ids:
+            Video.objects.refresh_comment_counts(video_ids)
+        return archived
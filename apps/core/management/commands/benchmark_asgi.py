@@ -0,0 +1,173 @@
+import http.client
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.timing import percentile
+from apps.videos.models import Video
+
+# python manage.py benchmark_asgi --concurrency 16 --requests 400
+# python manage.py benchmark_asgi --path /videos/{video_id}/ --concurrency 32
+
+DEFAULT_PATHS = ['/videos/', '/videos/{video_id}/', '/api/v1/videos/']
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync views on WSGI (runserver) with the async views on ASGI (uvicorn) under concurrent clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help=f'Path to load, repeatable; {{video_id}} is the most commented video (default: {" ".join(DEFAULT_PATHS)})',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=16,
+            help='Concurrent clients (default: 16)',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Requests per path and server (default: 200)',
+        )
+        parser.add_argument(
+            '--server',
+            choices=['sync', 'async', 'both'],
+            default='both',
+            help='Which server to benchmark (default: both)',
+        )
+
+    def handle(self, *args, **options):
+        video_id = Video.objects.filter(status='published').order_by('-comment_count').values_list('id', flat=True).first()
+        if video_id is None:
+            raise CommandError('No published videos, run generate_videos first')
+        paths = [path.format(video_id=video_id) for path in options['paths'] or DEFAULT_PATHS]
+
+        servers = {
+            'sync': [sys.executable, 'manage.py', 'runserver', '--noreload'],
+            'async': [sys.executable, '-m', 'uvicorn', 'config.asgi:application', '--no-access-log', '--log-level', 'warning'],
+        }
+        results = {}
+        for name, command in servers.items():
+            if options['server'] not in (name, 'both'):
+                continue
+            port = free_port()
+            if name == 'sync':
+                command = command + [f'127.0.0.1:{port}']
+            else:
+                command = command + ['--host', '127.0.0.1', '--port', str(port)]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {" ".join(command[1:])}'))
+            with Server(command, port) as server:
+                for path in paths:
+                    server.load(path, 5, 5)  # warm up connections and caches
+                    results[(name, path)] = server.load(path, options['requests'], options['concurrency'])
+                    self.report(path, results[(name, path)])
+
+        if options['server'] == 'both':
+            self.stdout.write(self.style.MIGRATE_HEADING('async vs sync throughput'))
+            for path in paths:
+                sync, async_ = results[('sync', path)], results[('async', path)]
+                self.stdout.write(f'  {path}: {async_["rps"] / sync["rps"]:.2f}x')
+
+    def report(self, path, result):
+        latencies = result['latencies']
+        self.stdout.write(
+            f'  {path}: {result["rps"]:.1f} req/s, '
+            + ', '.join(f'p{int(fraction * 100)} {percentile(latencies, fraction):.1f}' for fraction in (0.5, 0.95, 0.99))
+            + f' ms, {result["errors"]} errors'
+        )
+        if result['errors']:
+            self.stdout.write(self.style.ERROR(f'  first error: {result["first_error"]}'))
+
+
+class Server:
+    # one server process, DEBUG off so neither side keeps every query in memory
+
+    def __init__(self, command, port):
+        self.command = command
+        self.port = port
+        self.process = None
+
+    def __enter__(self):
+        env = {**os.environ, 'DEBUG': 'False'}
+        self.process = subprocess.Popen(
+            self.command, cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f'{self.command[1]} exited with {self.process.returncode}')
+            try:
+                if self.request('/api/health/') == 200:
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'{self.command[1]} did not start within 30 seconds')
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+    def request(self, path):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            conn.request('GET', path, headers={'Host': 'localhost', 'Accept': 'application/json, text/html'})
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    def load(self, path, requests, concurrency):
+        pending = queue.Queue()
+        for _ in range(requests):
+            pending.put(None)
+        latencies, errors = [], []
+
+        def client():
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    return
+                started = time.perf_counter()
+                try:
+                    status = self.request(path)
+                    if status != 200:
+                        errors.append(f'HTTP {status}')
+                except OSError as exc:
+                    errors.append(str(exc))
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'rps': requests / elapsed,
+            'latencies': sorted(latencies),
+            'errors': len(errors),
+            'first_error': errors[0] if errors else None,
+        }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,112 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from apps.comments.views import CommentViewSet
+from apps.core.renderers import ORJSONRenderer
+from apps.core.timing import percentile
+from apps.videos.api_views import VideoViewSet
+
+# python manage.py benchmark_serialization --iterations 200
+# python manage.py benchmark_serialization --page /api/v1/comments/?video=1
+
+PAGES = {
+    '/api/v1/videos/': VideoViewSet,
+    '/api/v1/comments/': CommentViewSet,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Time serializing and JSON-encoding the video and comment list pages: '
+        'model serializer vs values() serializer, stock JSONRenderer vs orjson'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page',
+            action='append',
+            dest='pages',
+            help=f'List page to benchmark, repeatable, query string allowed (default: {" ".join(PAGES)})',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=100,
+            help='Timed runs per page and step (default: 100)',
+        )
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        for page in options['pages'] or PAGES:
+            path = page.split('?')[0]
+            if path not in PAGES:
+                raise CommandError(f'Unknown page {path}, expected one of: {", ".join(PAGES)}')
+            self.benchmark(page, PAGES[path], factory.get(page, HTTP_HOST='localhost'), options['iterations'])
+
+    def benchmark(self, page, viewset, request, iterations):
+        # the rows are fetched once, only serialization and rendering are timed
+        view = viewset(action='list', action_map={'get': 'list'}, args=(), kwargs={}, format_kwarg=None)
+        view.request = view.initialize_request(request)
+        view.headers = {}
+        view.initial(view.request)
+        queryset = view.filter_queryset(view.get_queryset())
+        values_serializer = view.values_serializer_class
+        instances = view.paginate_queryset(queryset)
+        rows = list(view.paginate_queryset(queryset.prefetch_related(None).values(*values_serializer.columns())))
+        if not rows:
+            self.stdout.write(self.style.WARNING(f'{page}: no rows, nothing to benchmark'))
+            return
+
+        def serialize():
+            return view.get_serializer(instances, many=True).data
+
+        def serialize_values():
+            return values_serializer(rows).data
+
+        # the page envelope (count, next, previous) is the same for both and not timed
+        with CaptureQueriesContext(connection) as queries:
+            data = view.get_paginated_response(serialize()).data
+        stock = JSONRenderer().render(data)
+        fast = ORJSONRenderer().render(view.get_paginated_response(serialize_values()).data)
+
+        timings = {
+            'serializer': self.time(serialize, iterations),
+            'values': self.time(serialize_values, iterations),
+            'JSONRenderer': self.time(lambda: JSONRenderer().render(data), iterations),
+            'ORJSONRenderer': self.time(lambda: ORJSONRenderer().render(data), iterations),
+        }
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{page}: {len(rows)} rows, {len(stock)} bytes, {len(queries)} queries while serializing'
+        ))
+        for step, latencies in timings.items():
+            self.stdout.write(
+                f'  {step:<15} ' + ', '.join(
+                    f'p{int(fraction * 100)} {percentile(latencies, fraction):.2f}' for fraction in (0.5, 0.95)
+                ) + ' ms'
+            )
+        p50 = {step: percentile(latencies, 0.5) for step, latencies in timings.items()}
+        before = p50['serializer'] + p50['JSONRenderer']
+        after = p50['values'] + p50['ORJSONRenderer']
+        self.stdout.write(
+            f'  serializer {p50["serializer"] / p50["values"]:.1f}x faster from values(), '
+            f'encoding {p50["JSONRenderer"] / p50["ORJSONRenderer"]:.1f}x faster with orjson, '
+            f'{before:.2f} -> {after:.2f} ms per page'
+        )
+        if stock == fast:
+            self.stdout.write(self.style.SUCCESS('  output identical'))
+        else:
+            self.stdout.write(self.style.ERROR('  output differs from the model serializer with JSONRenderer'))
+
+    def time(self, fn, iterations):
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            fn()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return sorted(latencies)
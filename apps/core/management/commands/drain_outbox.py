@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core import outbox
+from apps.core.locks import task_lease
+from apps.core.models import OutboxEvent
+
+# python manage.py drain_outbox
+# applies pending video and comment changes to the projections without a Celery worker,
+# e.g. after ingest or in development; it takes the drain_outbox task's lease
+
+
+class Command(BaseCommand):
+    help = 'Hand the pending outbox events to the projections (comment counts, leaderboards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Events per batch (default: OUTBOX_BATCH_SIZE)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self.stdout.write(f'{OutboxEvent.objects.count()} events pending...')
+        with task_lease('core.drain_outbox') as lease:
+            if not lease.acquired:
+                raise CommandError('drain_outbox is running in a worker, try again later')
+            stats = outbox.drain(batch_size=options['batch_size'], lease=lease)
+
+        for topic, count in sorted(stats['by_topic'].items()):
+            self.stdout.write(f'  {topic}: {count} events')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Drained {stats["events"]} events in {stats["batches"]} batches '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
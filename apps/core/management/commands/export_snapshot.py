@@ -0,0 +1,314 @@
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from apps.comments.models import Comment
+from apps.videos.models import Video
+
+# python manage.py export_snapshot --output snapshots --format parquet
+
+STATE_FILE = '_state.json'
+
+VIDEO_COLUMNS = [
+    ('id', 'int64'),
+    ('title', 'string'),
+    ('slug', 'string'),
+    ('category_id', 'int64'),
+    ('channel_name', 'string'),
+    ('status', 'string'),
+    ('duration', 'int64'),
+    ('view_count', 'int64'),
+    ('like_count', 'int64'),
+    ('dislike_count', 'int64'),
+    ('comment_count', 'int64'),
+    ('language', 'string'),
+    ('tags', 'tags'),
+    ('published_at', 'timestamp'),
+    ('created_at', 'timestamp'),
+    ('updated_at', 'timestamp'),
+    ('deleted_at', 'timestamp'),
+]
+
+COMMENT_COLUMNS = [
+    ('id', 'int64'),
+    ('video_id', 'int64'),
+    ('parent_comment_id', 'int64'),
+    ('author_name', 'string'),
+    ('content', 'string'),
+    ('like_count', 'int64'),
+    ('is_approved', 'bool'),
+    ('is_ai_generated', 'bool'),
+    ('ai_model_used', 'string'),
+    ('created_at', 'timestamp'),
+    ('updated_at', 'timestamp'),
+]
+
+REACTION_COLUMNS = [
+    ('video_id', 'int64'),
+    ('category_id', 'int64'),
+    ('channel_name', 'string'),
+    ('view_count', 'int64'),
+    ('like_count', 'int64'),
+    ('dislike_count', 'int64'),
+    ('comment_count', 'int64'),
+    ('approved_comments', 'int64'),
+    ('ai_comments', 'int64'),
+    ('reply_comments', 'int64'),
+    ('comment_likes', 'int64'),
+    ('snapshot_at', 'timestamp'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Export videos, comments and reaction aggregates as partitioned Parquet/Arrow files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=str(settings.BASE_DIR / 'snapshots'),
+            help='Snapshot root directory (default: <project>/snapshots)',
+        )
+        parser.add_argument(
+            '--format',
+            type=str,
+            choices=['parquet', 'arrow'],
+            default='parquet',
+            help='parquet for compressed files, arrow for memory-mapped IPC reads (default: parquet)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Rows fetched from the database per chunk (default: 5000)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Drop previous snapshot files and export every row again',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise CommandError('pyarrow is required for snapshots: pip install pyarrow')
+
+        self.pa = pa
+        self.file_format = options['format']
+        self.chunk_size = options['chunk_size']
+        self.root = Path(options['output'])
+        self.run_id = timezone.now().strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:8]
+
+        if options['full'] and self.root.exists():
+            self.stdout.write(f'Removing previous snapshot in {self.root}...')
+            for table in ('videos', 'comments', 'video_reactions'):
+                shutil.rmtree(self.root / table, ignore_errors=True)
+            (self.root / STATE_FILE).unlink(missing_ok=True)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        state = self.load_state()
+        self.finished_files = []
+
+        try:
+            videos_last_id, videos_written = self.export_table(
+                'videos',
+                Video.all_objects.all(),
+                VIDEO_COLUMNS,
+                state.get('videos', {}).get('last_id', 0),
+            )
+            comments_last_id, comments_written = self.export_table(
+                'comments',
+                Comment.objects.all(),
+                COMMENT_COLUMNS,
+                state.get('comments', {}).get('last_id', 0),
+            )
+            reactions_written = self.export_reactions()
+        except BaseException:
+            for tmp_path, _ in self.finished_files:
+                tmp_path.unlink(missing_ok=True)
+            raise
+
+        # files only become visible together with the new watermarks
+        for tmp_path, final_path in self.finished_files:
+            os.replace(tmp_path, final_path)
+
+        state['videos'] = {'last_id': videos_last_id}
+        state['comments'] = {'last_id': comments_last_id}
+        state.setdefault('runs', []).append({
+            'run_id': self.run_id,
+            'format': self.file_format,
+            'finished_at': timezone.now().isoformat(),
+            'videos': videos_written,
+            'comments': comments_written,
+            'video_reactions': reactions_written,
+        })
+        self.save_state(state)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Snapshot {self.run_id} written to {self.root}: '
+                f'{videos_written} videos, {comments_written} comments, '
+                f'{reactions_written} reaction rows'
+            )
+        )
+
+    # state handling
+
+    def load_state(self):
+        path = self.root / STATE_FILE
+        if not path.exists():
+            return {}
+        with open(path) as fh:
+            return json.load(fh)
+
+    def save_state(self, state):
+        # write-then-rename so an interrupted run never leaves a half written state file
+        tmp_path = self.root / f'{STATE_FILE}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(state, fh, indent=2)
+        os.replace(tmp_path, self.root / STATE_FILE)
+
+    # export helpers
+
+    def export_table(self, table, queryset, columns, last_id):
+        # keyset pagination on id so memory stays bounded by chunk size,
+        # and the highest id seen becomes the watermark for the next append
+        names = [name for name, _ in columns]
+        created_at_index = names.index('created_at')
+        schema = self.build_schema(columns)
+        writers = {}
+        written = 0
+
+        self.stdout.write(f'Exporting {table} with id > {last_id}...')
+        try:
+            while True:
+                rows = list(
+                    queryset.filter(id__gt=last_id).order_by('id').values_list(*names)[:self.chunk_size]
+                )
+                if not rows:
+                    break
+
+                partitions = {}
+                for row in rows:
+                    partitions.setdefault(row[created_at_index].strftime('%Y-%m'), []).append(row)
+
+                for month, partition_rows in partitions.items():
+                    writer = writers.get(month)
+                    if writer is None:
+                        writer = self.open_writer(table, f'created_month={month}', schema)
+                        writers[month] = writer
+                    writer[0].write_batch(self.build_batch(partition_rows, names, columns, schema))
+
+                written += len(rows)
+                last_id = rows[-1][0]
+        finally:
+            self.close_writers(writers.values())
+
+        return last_id, written
+
+    def export_reactions(self):
+        # reaction aggregates are tiny (one row per video) but change constantly,
+        # so every run writes a complete dated snapshot instead of appending
+        names = [name for name, _ in REACTION_COLUMNS]
+        schema = self.build_schema(REACTION_COLUMNS)
+        snapshot_at = timezone.now()
+        writer = None
+        written = 0
+        last_id = 0
+
+        self.stdout.write('Exporting video reaction aggregates...')
+        try:
+            while True:
+                videos = list(
+                    Video.all_objects.filter(id__gt=last_id).order_by('id').values_list(
+                        'id', 'category_id', 'channel_name', 'view_count',
+                        'like_count', 'dislike_count', 'comment_count'
+                    )[:self.chunk_size]
+                )
+                if not videos:
+                    break
+
+                comment_stats = {
+                    row['video_id']: row
+                    for row in Comment.objects.filter(
+                        video_id__in=[video[0] for video in videos]
+                    ).order_by().values('video_id').annotate(
+                        approved_comments=Count('id', filter=Q(is_approved=True)),
+                        ai_comments=Count('id', filter=Q(is_ai_generated=True)),
+                        reply_comments=Count('id', filter=Q(parent_comment__isnull=False)),
+                        comment_likes=Sum('like_count'),
+                    )
+                }
+
+                rows = []
+                for video in videos:
+                    stats = comment_stats.get(video[0], {})
+                    rows.append(video + (
+                        stats.get('approved_comments', 0),
+                        stats.get('ai_comments', 0),
+                        stats.get('reply_comments', 0),
+                        stats.get('comment_likes') or 0,
+                        snapshot_at,
+                    ))
+
+                if writer is None:
+                    writer = self.open_writer(
+                        'video_reactions', f'snapshot_date={snapshot_at.date().isoformat()}', schema
+                    )
+                writer[0].write_batch(self.build_batch(rows, names, REACTION_COLUMNS, schema))
+
+                written += len(rows)
+                last_id = videos[-1][0]
+        finally:
+            self.close_writers([writer] if writer else [])
+
+        return written
+
+    def build_schema(self, columns):
+        pa = self.pa
+        types = {
+            'int64': pa.int64(),
+            'string': pa.string(),
+            'bool': pa.bool_(),
+            'timestamp': pa.timestamp('us', tz='UTC'),
+            'tags': pa.list_(pa.string()),
+        }
+        return pa.schema([(name, types[kind]) for name, kind in columns])
+
+    def build_batch(self, rows, names, columns, schema):
+        arrays = []
+        for index, (name, kind) in enumerate(columns):
+            values = [row[index] for row in rows]
+            if kind == 'tags':
+                values = [[str(tag) for tag in value] if isinstance(value, list) else [] for value in values]
+            arrays.append(self.pa.array(values, type=schema.field(name).type))
+        return self.pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def open_writer(self, table, partition, schema):
+        directory = self.root / table / partition
+        directory.mkdir(parents=True, exist_ok=True)
+        extension = 'parquet' if self.file_format == 'parquet' else 'arrow'
+        final_path = directory / f'part-{self.run_id}.{extension}'
+        tmp_path = directory / f'.part-{self.run_id}.{extension}.tmp'
+
+        if self.file_format == 'parquet':
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(str(tmp_path), schema, compression='zstd')
+        else:
+            import pyarrow.ipc as ipc
+            writer = ipc.new_file(str(tmp_path), schema)
+
+        return writer, tmp_path, final_path
+
+    def close_writers(self, writers):
+        for writer, tmp_path, final_path in writers:
+            writer.close()
+            self.finished_files.append((tmp_path, final_path))
@@ -0,0 +1,225 @@
+import re
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from apps.core.models import QueryFingerprint
+from apps.core.querystats import histogram_percentile, paused, query_stats
+
+# QUERY_STATS_ENABLED=1 python manage.py runserver   (collect for a while)
+# python manage.py index_advisor --top 10
+
+COLUMN_RE = r'"{table}"\."(\w+)"'
+PREDICATE_RE = r'"{table}"\."(\w+)" (=|IN|IS|<=|>=|<|>|LIKE)'
+NOT_RE = re.compile(r'\bNOT \([^()]*\)')
+ORDER_BY_RE = re.compile(r'\bORDER BY (.+?)(?: LIMIT\b| OFFSET\b|$)', re.IGNORECASE)
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the most expensive recorded query fingerprints and suggest missing indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Number of fingerprints to analyse, by total time (default: 10)',
+        )
+        parser.add_argument(
+            '--source',
+            type=str,
+            help='Only fingerprints recorded under views/tasks containing this text',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Delete the recorded fingerprints after the report',
+        )
+
+    def handle(self, *args, **options):
+        # include whatever this process has not written yet
+        query_stats.flush()
+        token = paused.set(True)
+        try:
+            self.report(options)
+        finally:
+            paused.reset(token)
+
+        if options['reset']:
+            deleted, _ = QueryFingerprint.objects.all().delete()
+            self.stdout.write(f'Deleted {deleted} fingerprint rows')
+
+    def report(self, options):
+        rows = QueryFingerprint.objects.all()
+        if options['source']:
+            rows = rows.filter(source__icontains=options['source'])
+
+        top = list(
+            rows.values('fingerprint').annotate(
+                calls=Sum('calls'), total_ms=Sum('total_ms')
+            ).order_by('-total_ms')[:options['top']]
+        )
+        if not top:
+            self.stdout.write('No query fingerprints recorded yet, run with QUERY_STATS_ENABLED=1 first')
+            return
+
+        by_fingerprint = {}
+        for row in rows.filter(fingerprint__in=[item['fingerprint'] for item in top]):
+            by_fingerprint.setdefault(row.fingerprint, []).append(row)
+
+        self.tables = {model._meta.db_table: model for model in apps.get_models()}
+        suggestions = 0
+        for rank, item in enumerate(top, start=1):
+            sources = sorted(by_fingerprint[item['fingerprint']], key=lambda row: -row.total_ms)
+            histogram = [sum(counts) for counts in zip(*(row.histogram for row in sources))]
+            sample = max(sources, key=lambda row: row.max_ms)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'#{rank} {item["calls"]} calls, {item["total_ms"]:,.1f} ms total, '
+                f'p95 <= {histogram_percentile(histogram, 0.95)} ms, max {sample.max_ms:,.1f} ms'
+            ))
+            self.stdout.write('  from: ' + ', '.join(f'{row.source} ({row.calls})' for row in sources[:5]))
+            self.stdout.write(f'  sql:  {sample.sql[:300]}')
+            suggestions += self.advise(sample)
+
+        self.stdout.write(self.style.SUCCESS(f'{suggestions} index suggestions'))
+
+    def advise(self, sample):
+        verb = sample.sql.split(' ', 1)[0].upper()
+        if verb not in ('SELECT', 'UPDATE', 'DELETE') or not sample.sample_sql:
+            self.stdout.write('  plan: not explained')
+            return 0
+
+        try:
+            problems = self.explain(sample.sample_sql, sample.sample_params)
+        except Exception as exc:
+            self.stdout.write(f'  plan: EXPLAIN failed ({exc})')
+            return 0
+        if not problems:
+            self.stdout.write('  plan: uses indexes')
+            return 0
+
+        suggestions = 0
+        for table, problem in problems:
+            self.stdout.write(f'  plan: {problem}')
+            equality, tail = self.index_columns(sample.sample_sql, table, sort=problem.startswith('sort'))
+            columns = equality + tail
+            if not columns:
+                continue
+            existing = self.matching_index(table, equality, [column.lstrip('-') for column in tail])
+            model = self.tables.get(table)
+            if existing:
+                self.stdout.write(f'  note: {existing} already starts with these columns, check the table statistics')
+            elif model is None:
+                self.stdout.write(f'  suggest: CREATE INDEX ON {table} ({", ".join(columns)})')
+                suggestions += 1
+            else:
+                fields = [self.field_name(model, column) for column in columns]
+                self.stdout.write(self.style.WARNING(
+                    f'  suggest: {model.__name__}.Meta.indexes += [models.Index(fields={fields!r})]'
+                ))
+                suggestions += 1
+        return suggestions
+
+    # plans
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+                return self.postgres_problems(plan[0]['Plan'], sql)
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return self.sqlite_problems(cursor.fetchall(), sql)
+
+    def sqlite_problems(self, rows, sql):
+        problems = []
+        for row in rows:
+            detail = row[-1]
+            match = re.match(r'SCAN (\w+)', detail)
+            if match and 'USING' not in detail:
+                table = self.resolve_alias(match.group(1), sql)
+                problems.append((table, f'full scan of {table}'))
+            elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+                table = self.order_by_table(sql)
+                if table:
+                    problems.append((table, f'sort of {table} rows without an index'))
+        return problems
+
+    def postgres_problems(self, node, sql):
+        problems = []
+        if node['Node Type'] == 'Seq Scan' and 'Filter' in node:
+            problems.append((node['Relation Name'], f'full scan of {node["Relation Name"]} ({node["Filter"]})'))
+        elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+            table = self.order_by_table(sql)
+            if table:
+                problems.append((table, f'sort of {table} rows without an index'))
+        for child in node.get('Plans', []):
+            problems.extend(self.postgres_problems(child, sql))
+        return problems
+
+    def resolve_alias(self, name, sql):
+        # SQLite reports joined tables by alias (T3), map it back to the table
+        match = re.search(rf'"(\w+)" {re.escape(name)}\b', sql)
+        return match.group(1) if match else name
+
+    def order_by_table(self, sql):
+        match = ORDER_BY_RE.search(sql)
+        if not match:
+            return None
+        column = re.search(r'"(\w+)"\."\w+"', match.group(1))
+        return column.group(1) if column else None
+
+    # suggestions
+
+    def index_columns(self, sql, table, sort=False):
+        # equality columns first, then one range column, then the ORDER BY columns
+        where = re.split(r'\bWHERE\b', sql, maxsplit=1)
+        equality, ranges = [], []
+        if len(where) == 2:
+            clause = ORDER_BY_RE.split(where[1])[0]
+            # negated predicates (exclude()) cannot use an index seek
+            clause = NOT_RE.sub('', clause)
+            for column, operator in re.findall(PREDICATE_RE.format(table=table), clause):
+                target = equality if operator in ('=', 'IN', 'IS') else ranges
+                if column not in equality and column not in ranges:
+                    target.append(column)
+
+        ordering = []
+        order_by = ORDER_BY_RE.search(sql)
+        if sort and order_by:
+            for expression in order_by.group(1).split(','):
+                column = re.search(COLUMN_RE.format(table=table), expression)
+                if column and column.group(1) not in equality + ranges[:1]:
+                    descending = expression.strip().upper().endswith('DESC')
+                    ordering.append(('-' if descending else '') + column.group(1))
+
+        return equality, ranges[:1] + ordering
+
+    def matching_index(self, table, equality, tail):
+        # an index fits when it starts with equality columns and continues with the tail;
+        # partial indexes fold some equality columns into their WHERE, so not all need to appear
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        for name, constraint in constraints.items():
+            if not constraint['index']:
+                continue
+            columns = constraint['columns']
+            prefix = 0
+            while prefix < len(columns) and columns[prefix] in equality:
+                prefix += 1
+            if tail and (prefix or not equality) and columns[prefix:prefix + len(tail)] == tail:
+                return name
+            if not tail and prefix == len(equality):
+                return name
+        return None
+
+    def field_name(self, model, column):
+        descending = column.startswith('-')
+        column = column.lstrip('-')
+        for field in model._meta.concrete_fields:
+            if field.column == column:
+                return ('-' if descending else '') + field.name
+        return ('-' if descending else '') + column
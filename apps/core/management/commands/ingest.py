@@ -0,0 +1,404 @@
+import csv
+import datetime
+import io
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from apps.comments.archive import is_partitioned
+from apps.comments.models import Comment
+from apps.core import outbox
+from apps.videos.models import Video, VideoCategory
+
+# python manage.py ingest videos videos.ndjson
+# python manage.py ingest comments comments.csv --batch-size 5000
+
+VIDEO_FIELDS = {
+    'title': str,
+    'description': str,
+    'duration': int,
+    'video_url': str,
+    'thumbnail_url': str,
+    'status': str,
+    'published_at': 'datetime',
+    'channel_name': str,
+    'channel_avatar_url': str,
+    'view_count': int,
+    'like_count': int,
+    'dislike_count': int,
+    'tags': 'tags',
+    'language': str,
+}
+
+# columns without a usable default, required when a row creates a video
+NEW_VIDEO_FIELDS = ['title', 'channel_name', 'duration']
+
+VIDEO_STATUSES = {value for value, _ in Video.STATUS_CHOICES}
+
+COMMENT_FIELDS = {
+    'content': str,
+    'author_name': str,
+    'author_avatar_url': str,
+    'like_count': int,
+    'is_approved': 'bool',
+    'is_ai_generated': 'bool',
+    'ai_model_used': str,
+}
+
+
+class Command(BaseCommand):
+    help = 'Stream NDJSON/CSV dumps of videos or comments into the database with batched upserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'model',
+            choices=['videos', 'comments'],
+            help='What the dump contains',
+        )
+        parser.add_argument(
+            'path',
+            help='Path to the dump file, or - to read from stdin',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['auto', 'ndjson', 'csv'],
+            default='auto',
+            help='Input format (default: guessed from the file extension)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk upsert (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.rejected = 0
+        self.explicit_comment_ids = False
+        self.touched_video_ids = set()
+        self.ingested_at = timezone.now()
+
+        # slug -> id map, so foreign keys never need a query per row
+        self.video_ids = dict(Video.all_objects.values_list('slug', 'id'))
+        self.known_video_ids = set(self.video_ids.values())
+
+        started = time.perf_counter()
+        with self.open_dump(options['path'], options['format']) as records:
+            if options['model'] == 'videos':
+                self.categories = self.load_categories()
+                processed = self.run_batches(records, self.build_video, self.write_videos)
+            else:
+                self.partitioned = is_partitioned()
+                processed = self.run_batches(records, self.build_comment, self.write_comments)
+                if self.explicit_comment_ids:
+                    self.reset_comment_sequence()
+                # the outbox drain would get there too, but the counts are right when the command returns
+                if self.touched_video_ids:
+                    self.stdout.write(f'Reconciling comment counts for {len(self.touched_video_ids)} videos...')
+                    Video.objects.refresh_comment_counts(self.touched_video_ids)
+
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Ingested {processed} {options["model"]} in {elapsed:.2f}s '
+                f'({rate:,.0f} rows/s), rejected {self.rejected}'
+            )
+        )
+
+    # reading
+
+    def open_dump(self, path, file_format):
+        if file_format == 'auto':
+            file_format = 'csv' if path.endswith('.csv') else 'ndjson'
+
+        if path == '-':
+            handle = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        else:
+            try:
+                handle = open(path, encoding='utf-8', newline='')
+            except OSError as exc:
+                raise CommandError(f'Cannot open {path}: {exc}')
+
+        return DumpReader(handle, file_format)
+
+    def run_batches(self, records, build, write):
+        processed = 0
+        batch = []
+
+        for line_number, record in records:
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                item = build(record)
+            except (KeyError, TypeError, ValueError) as exc:
+                self.rejected += 1
+                self.stderr.write(f'Line {line_number}: skipped ({exc})')
+                continue
+            if item is None:
+                self.rejected += 1
+                continue
+
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                processed += write(batch)
+                batch = []
+                self.stdout.write(f'{processed} rows written...')
+
+        if batch:
+            processed += write(batch)
+        return processed
+
+    # videos
+
+    def load_categories(self):
+        categories = {}
+        for category_id, name, slug in VideoCategory.objects.values_list('id', 'name', 'slug'):
+            categories[name.lower()] = category_id
+            categories[slug] = category_id
+        return categories
+
+    def build_video(self, record):
+        values = convert_fields(record, VIDEO_FIELDS)
+        slug = record.get('slug') or slugify(values.get('title', ''))
+        if not slug:
+            raise ValueError('video needs a slug or a title')
+
+        # an existing slug only gets the columns the row provides, a new one needs a full row
+        if slug not in self.video_ids:
+            missing = [name for name in NEW_VIDEO_FIELDS if not values.get(name)]
+            if missing:
+                raise ValueError(f'new video needs {", ".join(missing)}')
+        if 'duration' in values and not 1 <= values['duration'] <= 86400:
+            raise ValueError(f'duration {values["duration"]} out of range')
+        if 'status' in values and values['status'] not in VIDEO_STATUSES:
+            raise ValueError(f'unknown status {values["status"]!r}')
+
+        category = record.get('category')
+        if category:
+            category_id = self.categories.get(str(category).lower())
+            if category_id is None:
+                raise ValueError(f'unknown category {category!r}')
+            values['category_id'] = category_id
+
+        video = Video(slug=slug, **values)
+        video._ingest_fields = values.keys()
+        return video
+
+    def write_videos(self, batch):
+        # last row wins when a slug repeats inside one batch
+        batch = list({video.slug: video for video in batch}.values())
+        new = [video for video in batch if video.slug not in self.video_ids]
+        existing = [video for video in batch if video.slug in self.video_ids]
+
+        # existing slugs: one UPDATE per set of provided columns, the other columns stay as they are
+        by_fields = {}
+        now = timezone.now()
+        for video in existing:
+            video.pk = self.video_ids[video.slug]
+            video.updated_at = now
+            fields = tuple(sorted('category' if name == 'category_id' else name for name in video._ingest_fields))
+            by_fields.setdefault(fields, []).append(video)
+
+        with transaction.atomic():
+            for video in new:
+                video.populate_defaults()
+            Video.all_objects.bulk_create(new)
+            for fields, videos in by_fields.items():
+                Video.all_objects.bulk_update(videos, list(fields) + ['updated_at'])
+
+            # newly inserted videos have ids we have not seen yet; keep them for later comment dumps
+            for video in new:
+                self.video_ids[video.slug] = video.pk
+                self.known_video_ids.add(video.pk)
+
+            outbox.record_many('video', 'created', [(video.pk, {}) for video in new])
+            for fields, videos in by_fields.items():
+                outbox.record_many('video', 'updated', [(video.pk, {'fields': list(fields)}) for video in videos])
+        return len(batch)
+
+    # comments
+
+    def build_comment(self, record):
+        values = convert_fields(record, COMMENT_FIELDS)
+        if not values.get('content') or not values.get('author_name'):
+            raise ValueError('comment needs content and author_name')
+
+        if record.get('video_slug'):
+            video_id = self.video_ids.get(record['video_slug'])
+        else:
+            video_id = int(record['video_id'])
+            if video_id not in self.known_video_ids:
+                video_id = None
+        if video_id is None:
+            raise ValueError('unknown video')
+
+        comment = Comment(video_id=video_id, **values)
+        comment._ingest_fields = values.keys()
+        if record.get('id'):
+            comment.id = int(record['id'])
+        if record.get('parent_id'):
+            comment.parent_comment_id = int(record['parent_id'])
+        if record.get('created_at'):
+            comment.created_at = parse_timestamp(record['created_at'])
+        else:
+            comment.created_at = self.ingested_at
+        comment.populate_defaults()
+        return comment
+
+    def write_comments(self, batch):
+        batch = self.drop_orphan_replies(batch)
+        with_ids = list({comment.id: comment for comment in batch if comment.id is not None}.values())
+        without_ids = [comment for comment in batch if comment.id is None]
+
+        with transaction.atomic():
+            existing = {}
+            if with_ids:
+                self.explicit_comment_ids = True
+                # an upsert can move a comment to another video, whose count drops then
+                existing = {
+                    comment_id: (video_id, created_at)
+                    for comment_id, video_id, created_at in Comment.objects.filter(
+                        id__in=[comment.id for comment in with_ids]
+                    ).values_list('id', 'video_id', 'created_at')
+                }
+                update_fields = {'video', 'parent_comment', 'updated_at'}
+                for comment in with_ids:
+                    update_fields.update(comment._ingest_fields)
+                Comment.objects.bulk_create(
+                    with_ids,
+                    update_conflicts=True,
+                    unique_fields=self.comment_conflict_fields(with_ids, existing),
+                    update_fields=sorted(update_fields),
+                )
+            if without_ids:
+                Comment.objects.bulk_create(without_ids)
+
+            # upserts may have inserted or updated, the projections treat both the same
+            updated = []
+            for comment in with_ids:
+                payload = {'video_id': comment.video_id}
+                previous_video_id = existing.get(comment.id, (comment.video_id,))[0]
+                if previous_video_id != comment.video_id:
+                    payload['previous_video_id'] = previous_video_id
+                    self.touched_video_ids.add(previous_video_id)
+                updated.append((comment.pk, payload))
+            outbox.record_many('comment', 'updated', updated)
+            outbox.record_many('comment', 'created', [
+                (comment.pk, {'video_id': comment.video_id}) for comment in without_ids
+            ])
+        self.touched_video_ids.update(comment.video_id for comment in batch)
+        return len(with_ids) + len(without_ids)
+
+    def comment_conflict_fields(self, comments, existing):
+        if not self.partitioned:
+            return ['id']
+        # the partitioned table is only unique on (id, created_at); an upsert never
+        # changes created_at, so existing rows keep theirs and still hit the conflict
+        for comment in comments:
+            if comment.id in existing:
+                comment.created_at = existing[comment.id][1]
+        return ['id', 'created_at']
+
+    def drop_orphan_replies(self, batch):
+        parent_ids = {comment.parent_comment_id for comment in batch if comment.parent_comment_id}
+        if not parent_ids:
+            return batch
+
+        in_batch = {comment.id for comment in batch if comment.id is not None}
+        missing = parent_ids - in_batch
+        existing = set(Comment.objects.filter(id__in=missing).values_list('id', flat=True)) if missing else set()
+        valid_parents = in_batch | existing
+
+        kept = []
+        for comment in batch:
+            if comment.parent_comment_id and comment.parent_comment_id not in valid_parents:
+                self.rejected += 1
+                continue
+            kept.append(comment)
+        return kept
+
+    def reset_comment_sequence(self):
+        # explicit ids bypass the sequence on PostgreSQL, move it past the highest id
+        statements = connection.ops.sequence_reset_sql(no_style(), [Comment])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+
+class DumpReader:
+    """
+    Yields (line_number, record) pairs one at a time so memory does not grow with the file size.
+    """
+
+    def __init__(self, handle, file_format):
+        self.handle = handle
+        self.file_format = file_format
+
+    def __enter__(self):
+        if self.file_format == 'csv':
+            return self.read_csv()
+        return self.read_ndjson()
+
+    def __exit__(self, *exc_info):
+        self.handle.close()
+
+    def read_ndjson(self):
+        for line_number, line in enumerate(self.handle, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            # an unreadable line is handed on as the error, and rejected like any other bad row
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield line_number, ValueError(f'invalid JSON: {exc}')
+                continue
+            if not isinstance(record, dict):
+                yield line_number, ValueError('not a JSON object')
+                continue
+            yield line_number, record
+
+    def read_csv(self):
+        reader = csv.DictReader(self.handle)
+        for record in reader:
+            yield reader.line_num, {key: value for key, value in record.items() if value != ''}
+
+
+def convert_fields(record, fields):
+    values = {}
+    for name, kind in fields.items():
+        if name not in record or record[name] is None:
+            continue
+        value = record[name]
+        if kind == 'datetime':
+            value = parse_timestamp(value)
+        elif kind == 'bool':
+            value = value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+        elif kind == 'tags':
+            if isinstance(value, str):
+                value = json.loads(value) if value.startswith('[') else [
+                    tag.strip() for tag in value.split(',') if tag.strip()
+                ]
+        else:
+            value = kind(value)
+        values[name] = value
+    return values
+
+
+def parse_timestamp(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'invalid datetime {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.comments.archive import is_partitioned, partition_table, unpartition_table
+
+# python manage.py partition_comments
+# converts comments_comment to monthly partitions on a database migrated with
+# COMMENT_PARTITIONING off; it copies the table, so run it in a maintenance window
+
+
+class Command(BaseCommand):
+    help = 'Convert comments_comment to monthly range partitions on created_at (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--undo',
+            action='store_true',
+            help='Convert the partitioned table back to a plain table',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Comment partitioning needs PostgreSQL')
+        if options['undo'] and not is_partitioned():
+            raise CommandError('comments_comment is not partitioned')
+        if not options['undo'] and is_partitioned():
+            raise CommandError('comments_comment is already partitioned')
+
+        started = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options['undo']:
+                unpartition_table(cursor)
+            else:
+                partition_table(cursor, settings.YOUTUBE_SIMULATION['COMMENT_PARTITION_MONTHS_AHEAD'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Unpartitioned" if options["undo"] else "Partitioned"} comments_comment '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
@@ -1,4 +1,9 @@
+import queue
+import threading
+import time
+
 from django.core.management.base import BaseCommand
+from django.db import connections
 from django.utils import timezone
 
 from apps.comments.tasks import (
@@ -6,11 +11,24 @@ from apps.comments.tasks import (
     analyze_and_reply_to_recent_comments,
     generate_user_comments_batch
 )
+from apps.core.taskruns import finished_runs
+from apps.core.tasks import drain_outbox
+from apps.core.timing import percentile
 from apps.videos.tasks import (
     update_video_statistics,
     generate_new_video_content
 )
 
+# python manage.py test_celery_tasks --task video_stats --iterations 20 --concurrency 4
+# python manage.py test_celery_tasks --task ai_comments --iterations 50 --concurrency 8 --async   (needs a worker)
+
+TASKS = {
+    'ai_comments': ('AI Comment Generation', generate_ai_comments_for_popular_videos),
+    'reply_comments': ('Comment Analysis & Reply', analyze_and_reply_to_recent_comments),
+    'video_stats': ('Video Statistics Update', update_video_statistics),
+    'drain_outbox': ('Outbox Drain', drain_outbox),
+}
+
 
 class Command(BaseCommand):
     help = 'Test Celery tasks'
@@ -24,6 +42,7 @@ class Command(BaseCommand):
                 'ai_comments',
                 'reply_comments',
                 'video_stats',
+                'drain_outbox',
                 'all'
             ],
             default='all'
@@ -33,44 +52,47 @@ class Command(BaseCommand):
             action='store_true',
             help='Run tasks asynchronously (requires Celery worker)'
         )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            help='Benchmark: run each task this many times and report throughput and latency'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Benchmark: number of runs in flight at once (default: 1)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=600,
+            help='Benchmark with --async: seconds to wait for each result (default: 600)'
+        )
 
     def handle(self, *args, **options):
         task_name = options['task']
         run_async = options['async']
-        
+
         self.stdout.write(
             self.style.SUCCESS(f'Testing Celery tasks - Mode: {"Async" if run_async else "Sync"}')
         )
-        
-        if task_name in ['ai_comments', 'all']:
-            self.run_task(
-                'AI Comment Generation',
-                generate_ai_comments_for_popular_videos,
-                run_async
-            )
-        
-        if task_name in ['reply_comments', 'all']:
-            self.run_task(
-                'Comment Analysis & Reply',
-                analyze_and_reply_to_recent_comments,
-                run_async
-            )
-        
-        if task_name in ['video_stats', 'all']:
-            self.run_task(
-                'Video Statistics Update',
-                update_video_statistics,
-                run_async
-            )
-        
-        
+
+        for key, (label, task_func) in TASKS.items():
+            if task_name not in [key, 'all']:
+                continue
+            if options['iterations']:
+                self.benchmark(label, task_func, options)
+            else:
+                self.run_task(label, task_func, run_async)
+
         self.stdout.write(
             self.style.SUCCESS('All requested tasks completed!')
         )
 
     def run_task(self, task_name, task_func, run_async):
         self.stdout.write(f'\nRunning: {task_name}')
-        
+
         try:
             if run_async:
                 result = task_func.delay()
@@ -81,11 +103,11 @@ class Command(BaseCommand):
                 result = task_func()
                 end_time = timezone.now()
                 duration = (end_time - start_time).total_seconds()
-                
+
                 if isinstance(result, dict):
                     # maybe add more details later, idk
                     self.stdout.write(f'Status: {result.get("status", "Unknown")}')
-                    
+
                     if 'total_comments_generated' in result:
                         self.stdout.write(f'Comments Generated: {result["total_comments_generated"]}')
                     if 'videos_updated' in result:
@@ -96,12 +118,99 @@ class Command(BaseCommand):
                         self.stdout.write(f'   Analytics Created: {result["analytics_created"]}')
                 else:
                     self.stdout.write(f'Result: {result}')
-                
+
                 self.stdout.write(f'Duration: {duration:.2f}s')
-            
+
             self.stdout.write(self.style.SUCCESS(f'{task_name} completed'))
-            
+
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'{task_name} failed: {str(e)}')
-            )
\ No newline at end of file
+            )
+
+    # benchmark
+
+    def benchmark(self, task_name, task_func, options):
+        iterations = options['iterations']
+        concurrency = max(1, min(options['concurrency'], iterations))
+        mode = 'broker' if options['async'] else 'eager'
+        self.stdout.write(f'\nBenchmarking: {task_name} ({iterations} runs, concurrency {concurrency}, {mode})')
+
+        pending = queue.Queue()
+        for _ in range(iterations):
+            pending.put(None)
+        outcomes = []
+        threads = [
+            threading.Thread(target=self.worker, args=(task_func, pending, outcomes, options))
+            for _ in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.report(outcomes, elapsed, options['async'])
+
+    def worker(self, task_func, pending, outcomes, options):
+        # one thread per concurrent run; eager runs use this thread's own DB connection
+        try:
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    return
+                outcomes.append(self.timed_run(task_func, options))
+        finally:
+            connections.close_all()
+
+    def timed_run(self, task_func, options):
+        started = time.perf_counter()
+        try:
+            if options['async']:
+                result = task_func.delay()
+                result.get(timeout=options['timeout'], propagate=False)
+            else:
+                result = task_func.apply()
+        except Exception as exc:
+            return {'id': None, 'ok': False, 'error': str(exc), 'ms': (time.perf_counter() - started) * 1000}
+        return {
+            'id': result.id,
+            'ok': result.successful(),
+            'error': None if result.successful() else str(result.result),
+            'status': result.result.get('status') if isinstance(result.result, dict) else None,
+            'ms': (time.perf_counter() - started) * 1000,
+        }
+
+    def report(self, outcomes, elapsed, run_async):
+        failed = [outcome for outcome in outcomes if not outcome['ok']]
+        latencies = sorted(outcome['ms'] for outcome in outcomes)
+        self.stdout.write(
+            f'Runs: {len(outcomes)} ({len(outcomes) - len(failed)} ok, {len(failed)} failed) '
+            f'in {elapsed:.2f}s, {len(outcomes) / elapsed:.2f} runs/s'
+        )
+        self.stdout.write(
+            'Latency ms: ' + ', '.join(
+                f'p{int(fraction * 100)} {percentile(latencies, fraction):.1f}'
+                for fraction in (0.5, 0.9, 0.95, 0.99)
+            ) + f', max {latencies[-1]:.1f}'
+        )
+        if failed:
+            self.stdout.write(self.style.ERROR(f'First failure: {failed[0]["error"]}'))
+        skipped = sum(outcome.get('status') == 'skipped' for outcome in outcomes)
+        if skipped:
+            # periodic tasks hold a lease, runs overlapping one in progress return at once
+            self.stdout.write(self.style.WARNING(f'Skipped: {skipped} run(s) found the task lease held by another run'))
+
+        if run_async:
+            self.stdout.write('Per-run queries and rows are logged by the worker ("event": "task_run")')
+            return
+        ids = {outcome['id'] for outcome in outcomes}
+        runs = [run for run in list(finished_runs) if run.task_id in ids]
+        if runs:
+            self.stdout.write(
+                f'Per run: {sum(run.queries for run in runs) / len(runs):.1f} queries, '
+                f'{sum(run.db_ms for run in runs) / len(runs):.1f} ms DB, '
+                f'{sum(run.rows_written for run in runs) / len(runs):.1f} rows written'
+            )
@@ -0,0 +1,225 @@
+"""
+prometheus metrics for requests, queries, the cache and celery tasks.
+with PROMETHEUS_MULTIPROC_DIR set, every process (runserver/gunicorn workers,
+celery pool processes) writes its samples to files in that directory and
+/api/metrics/ adds them up, so the directory must be shared and emptied on deploy
+"""
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .querywrappers import active_wrappers
+
+logger = logging.getLogger(__name__)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Request latency by route (view name)',
+    ['method', 'route', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries',
+    'SQL statements run per request',
+    ['route'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds',
+    'SQL statement duration by route or task, _count is the number of queries',
+    ['source'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'Cache lookups by result, hit ratio = hit / (hit + miss)',
+    ['cache', 'result'],
+)
+TASK_DURATION = Histogram(
+    'celery_task_duration_seconds',
+    'Celery task run time',
+    ['task'],
+    buckets=(0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+TASK_QUERIES = Histogram(
+    'celery_task_db_queries',
+    'SQL statements run per task run',
+    ['task'],
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000),
+)
+TASK_ROWS_WRITTEN = Counter(
+    'celery_task_rows_written_total',
+    'Rows inserted, updated or deleted by task runs',
+    ['task'],
+)
+TASK_RESULTS = Counter(
+    'celery_tasks_total',
+    'Finished Celery task runs by outcome (success, failure, retry)',
+    ['task', 'state'],
+)
+TASK_LEASES = Counter(
+    'celery_task_leases_total',
+    'Periodic task lease attempts by outcome (acquired, skipped, coalesced, lost)',
+    ['task', 'outcome'],
+)
+OUTBOX_EVENTS = Counter(
+    'outbox_events_drained_total',
+    'Outbox events handed to the projections, by topic and action',
+    ['topic', 'action'],
+)
+
+
+class QueryRecorder:
+    # execute wrapper that times every statement and counts them for the request or task;
+    # the queries of an async request run on several threads at once
+    def __init__(self, source):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.set_source(source)
+
+    def set_source(self, source):
+        self.source = source
+        self.histogram = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            with self.lock:
+                self.queries += 1
+                if self.histogram is None:
+                    self.histogram = DB_QUERY_DURATION.labels(self.source)
+                histogram = self.histogram
+            histogram.observe(duration)
+
+
+def is_recording():
+    # eager subtasks run inside their caller, whose recorder already counts their queries
+    return any(isinstance(wrapper, QueryRecorder) for wrapper in active_wrappers(connection))
+
+
+def record_cache(cache, hits, misses):
+    if hits:
+        CACHE_REQUESTS.labels(cache, 'hit').inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(cache, 'miss').inc(misses)
+
+
+def record_lease(task, outcome):
+    TASK_LEASES.labels(task, outcome).inc()
+
+
+def record_outbox(counts):
+    # counts maps (topic, action) -> events drained
+    for (topic, action), count in counts.items():
+        OUTBOX_EVENTS.labels(topic, action).inc(count)
+
+
+class QueueLengthCollector:
+    """
+    Reads the broker queue lengths when scraped instead of tracking them,
+    since messages are added and removed by processes we do not run.
+    """
+
+    def collect(self):
+        gauge = GaugeMetricFamily('celery_queue_length', 'Messages waiting in the broker queue', labels=['queue'])
+        if settings.CELERY_TASK_ALWAYS_EAGER:
+            yield gauge
+            return
+
+        from config.celery import app
+
+        try:
+            with app.connection_for_read(connect_timeout=1) as conn:
+                conn.ensure_connection(max_retries=0)
+                channel = conn.default_channel
+                for queue in settings.METRICS['QUEUES']:
+                    gauge.add_metric([queue], queue_length(channel, queue))
+        except Exception as exc:
+            logger.warning(f'Could not read the Celery queue lengths: {exc}')
+        yield gauge
+
+
+def queue_length(channel, queue):
+    from kombu.exceptions import ChannelError
+
+    try:
+        return channel.queue_declare(queue=queue, passive=True).message_count
+    except ChannelError:
+        # the redis transport deletes the list key of an empty queue
+        return 0
+
+
+queue_collector = QueueLengthCollector()
+
+
+def render_metrics():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    queues = CollectorRegistry()
+    queues.register(queue_collector)
+    return generate_latest(registry) + generate_latest(queues), CONTENT_TYPE_LATEST
+
+
+# Celery wiring, connected from CoreConfig.ready() when METRICS is enabled
+
+_task_state = {}
+
+
+def start_task_metrics(task_id=None, task=None, **kwargs):
+    recorder = None
+    if not is_recording():
+        recorder = QueryRecorder(f'task {task.name}')
+        connection.execute_wrappers.append(recorder)
+    _task_state[task_id] = (time.perf_counter(), recorder)
+
+
+def stop_task_metrics(task_id=None, task=None, **kwargs):
+    state = _task_state.pop(task_id, None)
+    if state is None:
+        return
+    started, recorder = state
+    TASK_DURATION.labels(task.name).observe(time.perf_counter() - started)
+    if recorder is not None:
+        connection.execute_wrappers.remove(recorder)
+
+
+def count_success(sender=None, **kwargs):
+    TASK_RESULTS.labels(sender.name, 'success').inc()
+
+
+def count_failure(sender=None, **kwargs):
+    TASK_RESULTS.labels(sender.name, 'failure').inc()
+
+
+def count_retry(sender=None, **kwargs):
+    TASK_RESULTS.labels(sender.name, 'retry').inc()
+
+
+def connect_celery_signals():
+    from celery.signals import task_failure, task_postrun, task_prerun, task_retry, task_success
+
+    task_prerun.connect(start_task_metrics, weak=False)
+    task_postrun.connect(stop_task_metrics, weak=False)
+    task_success.connect(count_success, weak=False)
+    task_failure.connect(count_failure, weak=False)
+    task_retry.connect(count_retry, weak=False)
@@ -0,0 +1,209 @@
+"""
+request middleware shared by all apps. every class here runs sync or async,
+whichever the rest of the chain is, so the async views under ASGI are not
+pushed back onto a thread by one sync-only middleware
+"""
+
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import REQUEST_LATENCY, REQUEST_QUERIES, QueryRecorder
+from .profiling import aprofile_request, profile_request, requested_mode
+from .querystats import current_source, query_stats
+from .querywrappers import query_wrapper
+from .timing import RequestTimer, current_timer
+
+timing_logger = logging.getLogger('apps.core.timing')
+
+
+class HybridMiddleware:
+    """
+    Base for middleware with a sync __call__ and an async __acall__, picked by the
+    mode of get_response like django's MiddlewareMixin. process_view does no I/O,
+    so in async mode it runs on the event loop instead of through sync_to_async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            if hasattr(self, 'process_view'):
+                self.process_view = self.async_hook(self.process_view)
+
+    @staticmethod
+    def async_hook(method):
+        async def hook(*args):
+            return method(*args)
+        return hook
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+class QueryStatsMiddleware(HybridMiddleware):
+    # times every query of the request and files it under the resolved view name;
+    # the aggregates are written by the background thread of query_stats
+    def __init__(self, get_response):
+        if not settings.QUERY_STATS['ENABLED']:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        token = current_source.set(f'{request.method} unresolved')
+        try:
+            with query_wrapper(query_stats):
+                response = self.get_response(request)
+        finally:
+            current_source.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        token = current_source.set(f'{request.method} unresolved')
+        try:
+            with query_wrapper(query_stats):
+                response = await self.get_response(request)
+        finally:
+            current_source.reset(token)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_source.set(f'{request.method} {request.resolver_match.view_name}')
+
+
+class MetricsMiddleware(HybridMiddleware):
+    # request latency and query metrics per route (view name) for /api/metrics/
+    def __init__(self, get_response):
+        if not settings.METRICS['ENABLED']:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        started = time.perf_counter()
+        request.query_recorder = recorder = QueryRecorder('unresolved')
+        with query_wrapper(recorder):
+            response = self.get_response(request)
+        return self.observe(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        request.query_recorder = recorder = QueryRecorder('unresolved')
+        with query_wrapper(recorder):
+            response = await self.get_response(request)
+        return self.observe(request, response, recorder, started)
+
+    def observe(self, request, response, recorder, started):
+        route = recorder.source
+        REQUEST_LATENCY.labels(request.method, route, f'{response.status_code // 100}xx').observe(
+            time.perf_counter() - started
+        )
+        REQUEST_QUERIES.labels(route).observe(recorder.queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_recorder.set_source(request.resolver_match.view_name)
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """
+    Profiles the rest of the request when a staff user asks for it with ?profile=
+    or an X-Profile header (sample or cprofile). Other requests only pay for the
+    two lookups; must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING['ENABLED']:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        mode = requested_mode(request)
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+        return profile_request(request, self.get_response, mode)
+
+    async def __acall__(self, request):
+        mode = requested_mode(request)
+        # request.user loads the session and the user, which only sync code may do
+        if mode is None or not await sync_to_async(lambda: request.user.is_staff)():
+            return await self.get_response(request)
+        return await aprofile_request(request, self.get_response, mode)
+
+
+class RequestTimingMiddleware(HybridMiddleware):
+    """
+    Times a random REQUEST_TIMING['SAMPLE_RATE'] share of requests (query count, DB,
+    serializer, template, view and total time), returns the numbers in a Server-Timing
+    header and logs them as one JSON line. Other requests pass straight through.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING['SAMPLE_RATE']:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        if random.random() >= settings.REQUEST_TIMING['SAMPLE_RATE']:
+            return self.get_response(request)
+
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        try:
+            with query_wrapper(timer):
+                response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+
+        self.report(request, response, timer)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= settings.REQUEST_TIMING['SAMPLE_RATE']:
+            return await self.get_response(request)
+
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        try:
+            with query_wrapper(timer):
+                response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+
+        self.report(request, response, timer)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = current_timer.get()
+        if timer is not None:
+            timer.start_view(request.resolver_match.view_name)
+
+    def report(self, request, response, timer):
+        timings = {f'{name}_ms': round(value, 2) for name, value in timer.spans.items()}
+        if timer.view_started is not None:
+            timings['view_ms'] = round(timer.elapsed_ms(timer.view_started), 2)
+        timings['total_ms'] = round(timer.elapsed_ms(), 2)
+
+        # spans overlap: serializer and template time include the queries they trigger
+        entries = [f'db;dur={timings["db_ms"]};desc="{timer.queries} queries"']
+        entries += [f'{name[:-3]};dur={value}' for name, value in timings.items() if name != 'db_ms']
+        response['Server-Timing'] = ', '.join(entries)
+
+        timing_logger.info(json.dumps({
+            'event': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'view': timer.view_name,
+            'status': response.status_code,
+            'queries': timer.queries,
+            **timings,
+        }))
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+# entries of the two beat schedules that were merged into CELERY_BEAT_SCHEDULE; the
+# database scheduler only adds and updates entries, so these would keep firing
+STALE_ENTRIES = [
+    'generate-ai-comments-every-10-minutes',
+    'update-video-statistics-every-15-minutes',
+    'analyze-and-reply-every-15-minutes',
+    'generate-trending-videos-daily',
+]
+
+
+def remove_stale_entries(apps, schema_editor):
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+    PeriodicTask.objects.filter(name__in=STALE_ENTRIES).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_tasklease'),
+        ('django_celery_beat', '0018_improve_crontab_helptext'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_stale_entries, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,8 @@
 core models
 """
 
+import uuid
+
 from django.db import models
 from django.utils import timezone
 
@@ -30,15 +32,178 @@ class SoftDeleteModel(TimeStampedModel):
 
     def delete(self, using=None, keep_parents=False):
         self.deleted_at = timezone.now()
-        self.save(using=using, update_fields=['deleted_at'])
+        self.save(using=using, update_fields=['deleted_at', 'updated_at'])
 
     def hard_delete(self, using=None, keep_parents=False):
         super().delete(using=using, keep_parents=keep_parents)
 
     def restore(self):
         self.deleted_at = None
-        self.save(update_fields=['deleted_at'])
+        self.save(update_fields=['deleted_at', 'updated_at'])
 
     @property
     def is_deleted(self):
-        return self.deleted_at is not None
\ No newline at end of file
+        return self.deleted_at is not None
+
+
+class Job(TimeStampedModel):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    # the id doubles as the Celery task id
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job_type = models.CharField(max_length=50, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    params = models.JSONField(default=dict, blank=True)
+    progress_current = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.job_type} ({self.status})"
+
+    # state changes go through update() so a worker never overwrites fields it did not touch
+
+    def start(self, total):
+        Job.objects.filter(pk=self.pk).update(
+            status='running',
+            progress_total=total,
+            started_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+
+    def advance(self, step=1):
+        Job.objects.filter(pk=self.pk).update(
+            progress_current=models.F('progress_current') + step,
+            updated_at=timezone.now()
+        )
+
+    def succeed(self, result):
+        Job.objects.filter(pk=self.pk).update(
+            status='succeeded',
+            result=result,
+            finished_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+
+    def fail(self, error):
+        Job.objects.filter(pk=self.pk).update(
+            status='failed',
+            error=error,
+            finished_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+
+    @property
+    def progress_percent(self):
+        if self.progress_total == 0:
+            return 100 if self.status == 'succeeded' else 0
+        return round(self.progress_current / self.progress_total * 100, 1)
+
+
+class Watermark(models.Model):
+    # high-water marks for incremental jobs, e.g. the last event id a rollup has consumed
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @classmethod
+    def lock(cls, name):
+        # must run inside transaction.atomic(); concurrent runs of the same job queue up here
+        cls.objects.get_or_create(name=name)
+        return cls.objects.select_for_update().get(name=name)
+
+
+class TaskLease(models.Model):
+    # the run of a periodic task that currently holds it, see apps.core.locks.task_lease
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=64, blank=True)
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # a run was skipped while the lease was held and wants a follow-up run
+    rerun_requested = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.name}: {self.owner or 'free'}"
+
+    @property
+    def is_held(self):
+        return bool(self.owner) and self.expires_at is not None and self.expires_at > timezone.now()
+
+
+class QueryFingerprint(models.Model):
+    # timings of one normalised SQL statement issued by one view or task, see apps.core.querystats
+    fingerprint = models.CharField(max_length=16, db_index=True)
+    source = models.CharField(max_length=200)
+    sql = models.TextField()
+    sample_sql = models.TextField(blank=True)
+    sample_params = models.JSONField(null=True, blank=True)
+    calls = models.BigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    histogram = models.JSONField(default=list, blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-total_ms']
+        constraints = [
+            models.UniqueConstraint(fields=['fingerprint', 'source'], name='unique_query_fingerprint_source'),
+        ]
+
+    def __str__(self):
+        return f"{self.source}: {self.sql[:80]}"
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.calls if self.calls else 0
+
+    @property
+    def p95_ms(self):
+        from .querystats import histogram_percentile
+        return histogram_percentile(self.histogram, 0.95)
+
+
+class OutboxEvent(models.Model):
+    # a video or comment change, written in the transaction that makes it and deleted
+    # once apps.core.outbox.drain has handed it to the projections
+    TOPIC_CHOICES = [
+        ('video', 'Video'),
+        ('comment', 'Comment'),
+    ]
+    ACTION_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+        # a batch of comments of one video deleted in bulk, object_id is the video
+        ('purged', 'Purged'),
+    ]
+
+    topic = models.CharField(max_length=20, choices=TOPIC_CHOICES)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    object_id = models.BigIntegerField()
+    # fields: the saved fields of an update (absent: all of them), video_id: a comment's video,
+    # previous_video_id: the video an upserted comment was moved away from,
+    # previous: the (category_id, channel_name) a video was ranked under before the change
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.topic} {self.object_id} {self.action}"
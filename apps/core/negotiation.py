@@ -0,0 +1,20 @@
+"""
+content negotiation that only picks the browsable API when asked for with
+?format=api (or a .api suffix), so browsers and clients sending text/html get JSON
+"""
+
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BrowsableAPIRenderer
+
+
+class ExplicitBrowsableAPINegotiation(DefaultContentNegotiation):
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query_param = self.settings.URL_FORMAT_OVERRIDE
+        format = format_suffix or request.query_params.get(format_query_param)
+        if format != 'api':
+            renderers = [
+                renderer for renderer in renderers
+                if not isinstance(renderer, BrowsableAPIRenderer)
+            ] or renderers
+        return super().select_renderer(request, renderers, format_suffix)
@@ -0,0 +1,76 @@
+"""
+transactional outbox for video and comment changes. Every write path records an
+OutboxEvent in the transaction that makes the change (record, record_many), so an
+event exists exactly when its change committed. drain hands the events to the
+projections in OUTBOX['HANDLERS'] in id order, a batch at a time, and deletes them
+once every handler is done with the batch.
+
+Delivery is at least once: a drain that fails part way leaves its batch for the next
+one, so handlers recompute from the database instead of applying deltas.
+"""
+
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .metrics import record_outbox
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 1000
+
+
+def record(topic, action, object_id, **payload):
+    # call inside the transaction.atomic() block of the write it describes
+    OutboxEvent.objects.create(topic=topic, action=action, object_id=object_id, payload=payload)
+
+
+def record_many(topic, action, items):
+    # (object_id, payload) pairs of a bulk write, inside its transaction
+    events = [
+        OutboxEvent(topic=topic, action=action, object_id=object_id, payload=payload)
+        for object_id, payload in items
+    ]
+    OutboxEvent.objects.bulk_create(events, batch_size=BULK_BATCH_SIZE)
+    return len(events)
+
+
+def get_handlers():
+    return [import_string(path) for path in settings.OUTBOX['HANDLERS']]
+
+
+def drain(batch_size=None, lease=None):
+    """
+    Hands pending events to the handlers, oldest first, until none are left (or the
+    lease is lost). Rows are deleted rather than tracked with a watermark: an event
+    whose transaction commits after a higher id was drained is still picked up.
+    """
+    batch_size = batch_size or settings.OUTBOX['BATCH_SIZE']
+    handlers = get_handlers()
+    counts = Counter()
+    batches = 0
+
+    while lease is None or lease.heartbeat():
+        events = list(OutboxEvent.objects.order_by('id')[:batch_size])
+        if not events:
+            break
+        for handler in handlers:
+            handler(events)
+        OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+        counts.update((event.topic, event.action) for event in events)
+        batches += 1
+
+    record_outbox(counts)
+    by_topic = Counter()
+    for (topic, _), count in counts.items():
+        by_topic[topic] += count
+    if counts:
+        logger.info('drained %s outbox events in %s batches', sum(counts.values()), batches)
+    return {
+        'events': sum(counts.values()),
+        'batches': batches,
+        'by_topic': dict(by_topic),
+    }
@@ -0,0 +1,127 @@
+"""
+paginators for tables too big for an exact COUNT(*) on every page: above
+COUNT_ESTIMATES['THRESHOLD'] rows the planner's row estimate, or an exact count
+cached for a while, is used instead. count_kind says which one a page got
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+EXACT, CACHED, ESTIMATED = 'exact', 'cached', 'estimated'
+
+
+def planner_estimate(queryset):
+    """
+    The planner's estimate of the rows the queryset returns, None where the backend
+    has none (SQLite) or the table was never analyzed. An unfiltered table reads
+    pg_class.reltuples, anything else the top node of its EXPLAIN plan.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        if not queryset.query.where and not queryset.query.distinct and queryset.query.low_mark == 0 \
+                and queryset.query.high_mark is None:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            estimate = row[0] if row else None
+        else:
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+    except (DatabaseError, KeyError, IndexError, ValueError):
+        return None
+    # reltuples is -1 until the first VACUUM/ANALYZE
+    return estimate if estimate is not None and estimate >= 0 else None
+
+
+def count_rows(queryset):
+    """
+    (count, kind) of the queryset. The planner estimate when it passes the threshold,
+    else an exact count from an earlier request if one is cached, else COUNT(*); an
+    exact count above the threshold is cached for COUNT_ESTIMATES['CACHE_SECONDS'].
+    """
+    threshold = settings.COUNT_ESTIMATES['THRESHOLD']
+    estimate = planner_estimate(queryset)
+    if estimate is not None and estimate >= threshold:
+        return estimate, ESTIMATED
+
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0, EXACT
+    key = 'rowcount:' + hashlib.md5(repr((queryset.db, sql, params)).encode()).hexdigest()
+    count = cache.get(key)
+    if count is not None:
+        return count, CACHED
+
+    count = queryset.count()
+    if count >= threshold:
+        cache.set(key, count, settings.COUNT_ESTIMATES['CACHE_SECONDS'])
+    return count, EXACT
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting through count_rows(). count_queryset, when given, is counted
+    instead of the object list (the same rows without annotations or joins).
+    """
+
+    count_kind = EXACT
+
+    def __init__(self, object_list, per_page, *args, count_queryset=None, **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        self.count_queryset = count_queryset
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list if self.count_queryset is None else self.count_queryset
+        if not hasattr(queryset, 'query'):
+            return super().count
+        count, self.count_kind = count_rows(queryset)
+        return count
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    # PageNumberPagination with count_kind (exact, cached or estimated) next to count
+
+    count_queryset = None
+
+    def paginate_queryset(self, queryset, request, view=None, count_queryset=None):
+        # count_queryset is counted instead of queryset, as in EstimatedCountPaginator
+        self.count_queryset = count_queryset
+        return super().paginate_queryset(queryset, request, view)
+
+    def django_paginator_class(self, object_list, per_page):
+        # called by PageNumberPagination.paginate_queryset in place of the paginator class
+        return EstimatedCountPaginator(object_list, per_page, count_queryset=self.count_queryset)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_kind': self.page.paginator.count_kind,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_kind'] = {
+            'type': 'string',
+            'enum': [EXACT, CACHED, ESTIMATED],
+            'example': EXACT,
+        }
+        return response_schema
@@ -0,0 +1,224 @@
+"""
+on-demand profiling of single requests for staff users (?profile=sample|cprofile
+or an X-Profile header). the report with the SQL executed is written to
+PROFILING['DIR'] and served back by /api/profiles/<file>
+"""
+
+import cProfile
+import collections
+import io
+import json
+import pstats
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .querywrappers import query_wrapper
+
+MODES = ('sample', 'cprofile')
+FILE_NAME_RE = r'[\w-]+\.(?:json|folded|prof)'
+
+
+class SqlLog:
+    # execute wrapper keeping every statement of the profiled request in order,
+    # from whichever thread runs it
+    def __init__(self, limit):
+        self.lock = threading.Lock()
+        self.limit = limit
+        self.statements = []
+        self.count = 0
+        self.total_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.count += 1
+                self.total_ms += duration_ms
+                if len(self.statements) < self.limit:
+                    self.statements.append({
+                        'sql': sql,
+                        'params': None if many else [str(param) for param in params or ()],
+                        'ms': round(duration_ms, 3),
+                    })
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread from a background thread and counts the
+    stacks in the folded format (root;caller;callee count) that flamegraph.pl
+    and speedscope read. The request thread only pays for the GIL it hands over.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def top(self, limit=30):
+        # functions by the number of samples they were on top of the stack
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [
+            {'function': function, 'samples': count, 'percent': round(count * 100 / total, 1)}
+            for function, count in leaves.most_common(limit)
+        ]
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})'
+
+
+def short_path(filename):
+    for prefix in (str(settings.BASE_DIR) + '/', 'site-packages/'):
+        if prefix in filename:
+            return filename.split(prefix, 1)[1]
+    return filename
+
+
+def cprofile_top(profiler, limit=30):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:limit]
+    return [
+        {
+            'function': f'{name} ({short_path(filename)}:{line})',
+            'calls': calls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3),
+        }
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in rows
+    ]
+
+
+def requested_mode(request):
+    # cheap checks only, everything else happens after one of them matched
+    value = request.GET.get('profile') or request.META.get('HTTP_X_PROFILE')
+    if value is None:
+        return None
+    return value if value in MODES else 'sample'
+
+
+class RequestProfile:
+    """
+    Profiles the current thread while the with block runs and logs the SQL of
+    every thread of the request. In an async request the current thread is the
+    event loop, which other requests share; the queries run on other threads.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.sql_log = SqlLog(settings.PROFILING['MAX_SQL_STATEMENTS'])
+        self.profiler = self.sampler = None
+        self.stack = ExitStack()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.stack.enter_context(query_wrapper(self.sql_log))
+        if self.mode == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            self.stack.callback(self.profiler.disable)
+        else:
+            self.sampler = self.stack.enter_context(
+                StackSampler(threading.get_ident(), settings.PROFILING['SAMPLE_INTERVAL_MS'] / 1000)
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stack.close()
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+
+    def report(self, request, response):
+        # writes the files and points the response at them
+        name = f'{timezone.now():%Y%m%d-%H%M%S}-{secrets.token_hex(4)}'
+        directory = Path(settings.PROFILING['DIR'])
+        directory.mkdir(parents=True, exist_ok=True)
+
+        report = {
+            'id': name,
+            'mode': self.mode,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': request.resolver_match.view_name if request.resolver_match else None,
+            'status': response.status_code,
+            'user': request.user.get_username(),
+            'duration_ms': round(self.duration_ms, 2),
+            'queries': self.sql_log.count,
+            'db_ms': round(self.sql_log.total_ms, 2),
+        }
+        if self.profiler is not None:
+            self.profiler.dump_stats(directory / f'{name}.prof')
+            report['files'] = {'pstats': f'{name}.prof'}
+            report['top'] = cprofile_top(self.profiler)
+        else:
+            (directory / f'{name}.folded').write_text(self.sampler.folded())
+            report['files'] = {'folded': f'{name}.folded'}
+            report['samples'] = sum(self.sampler.stacks.values())
+            report['top'] = self.sampler.top()
+        report['sql'] = self.sql_log.statements
+
+        (directory / f'{name}.json').write_text(json.dumps(report, indent=2))
+        prune(directory, settings.PROFILING['KEEP_REPORTS'])
+        response['X-Profile'] = f'/api/profiles/{name}.json'
+        return response
+
+
+def prune(directory, keep):
+    # the newest reports stay with their stack files; names start with the time
+    reports = {}
+    for path in directory.iterdir():
+        if re.fullmatch(FILE_NAME_RE, path.name):
+            reports.setdefault(path.name.split('.', 1)[0], []).append(path)
+    for name in sorted(reports, reverse=True)[keep:]:
+        for path in reports[name]:
+            path.unlink(missing_ok=True)
+
+
+def profile_request(request, get_response, mode):
+    with RequestProfile(mode) as profile:
+        response = get_response(request)
+    return profile.report(request, response)
+
+
+async def aprofile_request(request, get_response, mode):
+    with RequestProfile(mode) as profile:
+        response = await get_response(request)
+    # the report reads request.user and writes files, both blocking
+    return await sync_to_async(profile.report)(request, response)
@@ -0,0 +1,237 @@
+"""
+query fingerprints: every SQL statement is normalised and timed per view or task,
+then a background thread of each process writes the aggregates to QueryFingerprint
+for index_advisor
+"""
+
+import bisect
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .querywrappers import active_wrappers
+
+# histogram bucket upper bounds in ms, the last bucket is open ended.
+# buckets add up across processes, which a list of raw timings would not
+BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE)
+VALUES_RE = re.compile(r'\bVALUES \([^()]*\)(?:, \([^()]*\))*', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+
+logger = logging.getLogger(__name__)
+
+current_source = contextvars.ContextVar('query_stats_source', default='other')
+paused = contextvars.ContextVar('query_stats_paused', default=False)
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql):
+    # literals and placeholders become ?, IN lists and multi-row VALUES collapse,
+    # so the same ORM query maps to one fingerprint whatever its parameters
+    normalized = SPACE_RE.sub(' ', sql).strip()
+    normalized = STRING_RE.sub('?', normalized)
+    normalized = normalized.replace('%s', '?')
+    normalized = NUMBER_RE.sub('?', normalized)
+    normalized = IN_LIST_RE.sub('IN (...)', normalized)
+    normalized = VALUES_RE.sub('VALUES (...)', normalized)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16], normalized
+
+
+def histogram_percentile(histogram, fraction):
+    # upper bound of the bucket holding the given fraction of calls
+    total = sum(histogram)
+    if not total:
+        return 0
+    threshold = total * fraction
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= threshold:
+            return BUCKETS_MS[index] if index < len(BUCKETS_MS) else float('inf')
+    return float('inf')
+
+
+class QueryStats:
+    """
+    Execute wrapper (connection.execute_wrapper) that aggregates timings in memory.
+    A daemon thread, started with the first query of the process, writes them out
+    every QUERY_STATS['FLUSH_INTERVAL'] seconds, so no request or task waits for it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.flusher = None
+        self.flusher_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def reset(self):
+        self.__init__()
+
+    def __call__(self, execute, sql, params, many, context):
+        if paused.get():
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add(sql, None if many else params, (time.perf_counter() - started) * 1000)
+
+    def add(self, sql, params, duration_ms):
+        if self.flusher is None:
+            self.start_flusher()
+        key, normalized = fingerprint(sql)
+        source = current_source.get()
+        with self.lock:
+            entry = self.entries.get((key, source))
+            if entry is None:
+                entry = self.entries[(key, source)] = {
+                    'sql': normalized,
+                    'calls': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'histogram': [0] * (len(BUCKETS_MS) + 1),
+                }
+            entry['calls'] += 1
+            entry['total_ms'] += duration_ms
+            entry['histogram'][bisect.bisect_left(BUCKETS_MS, duration_ms)] += 1
+            # keep the slowest statement with its parameters, index_advisor EXPLAINs it
+            if duration_ms >= entry['max_ms']:
+                entry['max_ms'] = duration_ms
+                entry['sample_sql'] = sql
+                entry['sample_params'] = params
+
+    def start_flusher(self):
+        with self.flusher_lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.run_flusher, name='query-stats-flush', daemon=True)
+                self.flusher.start()
+
+    def run_flusher(self):
+        while not self.stopped.wait(settings.QUERY_STATS['FLUSH_INTERVAL']):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not write the query stats')
+            finally:
+                # rather than a connection left idle until the next flush
+                connection.close()
+
+    def stop_flusher(self):
+        self.stopped.set()
+        if self.flusher is not None:
+            self.flusher.join()
+
+    def flush(self):
+        # writes what was collected so far; the flusher thread calls it, or a command before its report
+        with self.lock:
+            entries, self.entries = self.entries, {}
+        if not entries:
+            return 0
+
+        token = paused.set(True)
+        try:
+            save_entries(entries)
+        finally:
+            paused.reset(token)
+        return len(entries)
+
+
+def save_entries(entries):
+    from .models import QueryFingerprint
+
+    fingerprints = {key for key, _ in entries}
+    now = timezone.now()
+    with transaction.atomic():
+        QueryFingerprint.objects.bulk_create(
+            [
+                QueryFingerprint(fingerprint=key, source=source, sql=entry['sql'])
+                for (key, source), entry in entries.items()
+            ],
+            ignore_conflicts=True,
+        )
+        rows = {
+            (row.fingerprint, row.source): row
+            for row in QueryFingerprint.objects.select_for_update().filter(fingerprint__in=fingerprints)
+        }
+
+        changed = []
+        for key, entry in entries.items():
+            row = rows[key]
+            row.calls += entry['calls']
+            row.total_ms += entry['total_ms']
+            histogram = row.histogram or [0] * len(entry['histogram'])
+            row.histogram = [old + new for old, new in zip(histogram, entry['histogram'])]
+            if entry['max_ms'] >= row.max_ms:
+                row.max_ms = entry['max_ms']
+                row.sample_sql = entry['sample_sql']
+                row.sample_params = json_safe(entry['sample_params'])
+            row.last_seen = now
+            changed.append(row)
+
+        QueryFingerprint.objects.bulk_update(
+            changed,
+            ['calls', 'total_ms', 'histogram', 'max_ms', 'sample_sql', 'sample_params', 'last_seen'],
+        )
+
+
+def json_safe(params):
+    # datetimes, decimals and uuids become strings, which both backends accept back as literals
+    if params is None:
+        return None
+    return json.loads(json.dumps(list(params), cls=DjangoJSONEncoder))
+
+
+query_stats = QueryStats()
+# a forked child (gunicorn, celery prefork) has the entries of its parent but not its thread
+os.register_at_fork(after_in_child=query_stats.reset)
+
+
+# Celery wiring, connected from CoreConfig.ready() when QUERY_STATS is enabled
+
+_task_state = {}
+
+
+def start_task_recording(task_id=None, task=None, **kwargs):
+    # eager subtasks run inside their caller, which may already be wrapped
+    added = query_stats not in active_wrappers(connection)
+    if added:
+        connection.execute_wrappers.append(query_stats)
+    _task_state[task_id] = (added, current_source.set(f'task {task.name}'))
+
+
+def stop_task_recording(task_id=None, **kwargs):
+    state = _task_state.pop(task_id, None)
+    if state is None:
+        return
+    added, token = state
+    current_source.reset(token)
+    if added:
+        connection.execute_wrappers.remove(query_stats)
+
+
+def flush_on_shutdown(**kwargs):
+    query_stats.flush()
+
+
+def connect_celery_signals():
+    from celery.signals import task_prerun, task_postrun, worker_process_shutdown
+
+    task_prerun.connect(start_task_recording, weak=False)
+    task_postrun.connect(stop_task_recording, weak=False)
+    worker_process_shutdown.connect(flush_on_shutdown, weak=False)
@@ -0,0 +1,47 @@
+"""
+execute wrappers scoped to a request instead of a connection. django keeps
+execute_wrappers per connection, that is per thread, but an async request runs its
+queries on other threads (sync_to_async, the apps.core.aio pool). the wrappers of
+the request live in a ContextVar instead, which follows it onto those threads, and
+one dispatcher installed on every connection runs them
+"""
+
+import contextvars
+import functools
+from contextlib import contextmanager
+
+request_wrappers = contextvars.ContextVar('request_query_wrappers', default=())
+
+
+def dispatch(execute, sql, params, many, context):
+    wrappers = request_wrappers.get()
+    if not wrappers:
+        return execute(sql, params, many, context)
+    # the first one added is the outermost, as with connection.execute_wrapper()
+    for wrapper in reversed(wrappers):
+        execute = functools.partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_dispatcher(sender=None, connection=None, **kwargs):
+    # connection_created fires again on every reconnect of the same wrapper
+    if dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, dispatch)
+
+
+@contextmanager
+def query_wrapper(wrapper):
+    """
+    Like connection.execute_wrapper(wrapper), for every query of the current context
+    whichever thread runs it. The wrapper may be called from several threads at once.
+    """
+    token = request_wrappers.set(request_wrappers.get() + (wrapper,))
+    try:
+        yield wrapper
+    finally:
+        request_wrappers.reset(token)
+
+
+def active_wrappers(connection):
+    # what wraps a query on this connection right now, request scoped or not
+    return [*request_wrappers.get(), *(wrapper for wrapper in connection.execute_wrappers if wrapper is not dispatch)]
@@ -0,0 +1,67 @@
+"""
+serializer base classes for the API, and the serializers for core API endpoints
+"""
+
+from rest_framework import serializers
+from rest_framework.serializers import LIST_SERIALIZER_KWARGS, LIST_SERIALIZER_KWARGS_REMOVE
+
+from .models import Job
+from .timing import span
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with span('serializer'):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """
+    Times .data in the serializer span of sampled requests (apps.core.timing);
+    many=True builds a TimedListSerializer, timed once for the whole list.
+    """
+
+    @property
+    def data(self):
+        with span('serializer'):
+            return super().data
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        # DRF's many_init, with TimedListSerializer unless Meta names a list serializer
+        list_kwargs = {}
+        for key in LIST_SERIALIZER_KWARGS_REMOVE:
+            value = kwargs.pop(key, None)
+            if value is not None:
+                list_kwargs[key] = value
+        list_kwargs['child'] = cls(*args, **kwargs)
+        list_kwargs.update({key: value for key, value in kwargs.items() if key in LIST_SERIALIZER_KWARGS})
+        list_serializer_class = getattr(getattr(cls, 'Meta', None), 'list_serializer_class', TimedListSerializer)
+        return list_serializer_class(*args, **list_kwargs)
+
+
+class TimedSerializer(TimedSerializerMixin, serializers.Serializer):
+    pass
+
+
+class TimedModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    pass
+
+
+class JobSerializer(TimedModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'job_type', 'status', 'params', 'progress',
+            'result', 'error', 'created_at', 'started_at', 'finished_at'
+        ]
+
+    def get_progress(self, obj):
+        return {
+            'current': obj.progress_current,
+            'total': obj.progress_total,
+            'percent': obj.progress_percent,
+        }
@@ -0,0 +1,133 @@
+"""
+sorted sets for leaderboards: Redis when LEADERBOARDS['REDIS_URL'] is set, otherwise
+an in-process stand-in with the same commands (development, tests). Members and
+scores come back as str and float, like redis-py with decode_responses=True
+"""
+
+import threading
+
+from django.conf import settings
+from sortedcontainers import SortedList
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        url = settings.LEADERBOARDS['REDIS_URL']
+        if url:
+            import redis
+            _client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=1, socket_connect_timeout=1)
+        else:
+            _client = MemorySortedSets()
+    return _client
+
+
+class SortedSet:
+    # scores by member plus (score, member) pairs kept sorted like Redis does, so updates
+    # and ranks are O(log N) and equal scores come back in reverse member order from zrevrange
+
+    def __init__(self):
+        self.scores = {}
+        self.order = SortedList()
+
+    def add(self, member, score):
+        old = self.scores.get(member)
+        if old is not None:
+            self.order.remove((old, member))
+        self.scores[member] = score
+        self.order.add((score, member))
+
+    def remove(self, member):
+        score = self.scores.pop(member, None)
+        if score is None:
+            return 0
+        self.order.remove((score, member))
+        return 1
+
+
+class MemorySortedSets:
+    """
+    The subset of redis-py's sorted set commands the leaderboards use. Per process,
+    so a Celery worker and the web process each keep their own copy, and neither
+    sees the other's writes; apps.videos.leaderboards rebuilds it from the database
+    every LEADERBOARDS['LOCAL_MAX_AGE'] seconds for that reason.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self.sets = {}
+        self.lock = threading.Lock()
+
+    def zadd(self, key, mapping):
+        with self.lock:
+            sorted_set = self.sets.setdefault(key, SortedSet())
+            added = sum(member not in sorted_set.scores for member in mapping)
+            for member, score in mapping.items():
+                sorted_set.add(str(member), float(score))
+            return added
+
+    def zincrby(self, key, amount, member):
+        member = str(member)
+        with self.lock:
+            sorted_set = self.sets.setdefault(key, SortedSet())
+            score = sorted_set.scores.get(member, 0.0) + amount
+            sorted_set.add(member, score)
+            return score
+
+    def zrem(self, key, *members):
+        with self.lock:
+            sorted_set = self.sets.get(key)
+            if sorted_set is None:
+                return 0
+            removed = sum(sorted_set.remove(str(member)) for member in members)
+            if not sorted_set.scores:
+                del self.sets[key]
+            return removed
+
+    def zrevrange(self, key, start, end, withscores=False):
+        with self.lock:
+            sorted_set = self.sets.get(key)
+            if sorted_set is None:
+                return []
+            size = len(sorted_set.order)
+            end = size if end == -1 else min(end + 1, size)
+            items = list(sorted_set.order.islice(size - end, size - start, reverse=True)) if start < end else []
+        if withscores:
+            return [(member, score) for score, member in items]
+        return [member for _, member in items]
+
+    def zscore(self, key, member):
+        sorted_set = self.sets.get(key)
+        return None if sorted_set is None else sorted_set.scores.get(str(member))
+
+    def zrevrank(self, key, member):
+        with self.lock:
+            sorted_set = self.sets.get(key)
+            score = None if sorted_set is None else sorted_set.scores.get(str(member))
+            if score is None:
+                return None
+            return len(sorted_set.order) - 1 - sorted_set.order.bisect_left((score, str(member)))
+
+    def zcard(self, key):
+        sorted_set = self.sets.get(key)
+        return 0 if sorted_set is None else len(sorted_set.scores)
+
+    def exists(self, *keys):
+        return sum(key in self.sets for key in keys)
+
+    def delete(self, *keys):
+        with self.lock:
+            return sum(self.sets.pop(key, None) is not None for key in keys)
+
+    def rename(self, source, destination):
+        with self.lock:
+            self.sets[destination] = self.sets.pop(source)
+        return True
+
+    def flushdb(self):
+        with self.lock:
+            self.sets.clear()
+        return True
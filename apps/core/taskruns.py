@@ -0,0 +1,95 @@
+"""
+per-run celery task instrumentation: wall time, queries, DB time and rows written,
+logged as one JSON line per run and kept in memory for test_celery_tasks --iterations
+"""
+
+import collections
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+WRITE_VERBS = ('INSERT', 'UPDATE', 'DELETE')
+
+# the last runs of this process, the benchmark reads its own runs back from here
+finished_runs = collections.deque(maxlen=10000)
+
+
+class TaskRun:
+    """
+    Execute wrapper for the duration of one task run. An eager subtask runs inside
+    its caller, so the caller's numbers include the subtask's queries and rows.
+    """
+
+    def __init__(self, task_name, task_id):
+        self.task_name = task_name
+        self.task_id = task_id
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.rows_written = 0
+        self.state = None
+        self.wall_ms = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - started) * 1000
+            if sql.lstrip()[:6].upper() in WRITE_VERBS:
+                # -1 when the driver does not know, e.g. after a failed statement
+                self.rows_written += max(context['cursor'].rowcount, 0)
+
+    def finish(self, state):
+        self.state = state
+        self.wall_ms = (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self):
+        return {
+            'task': self.task_name,
+            'task_id': self.task_id,
+            'state': self.state,
+            'wall_ms': round(self.wall_ms, 2),
+            'queries': self.queries,
+            'db_ms': round(self.db_ms, 2),
+            'rows_written': self.rows_written,
+        }
+
+
+# Celery wiring, connected from CoreConfig.ready()
+
+_active_runs = {}
+
+
+def start_task_run(task_id=None, task=None, **kwargs):
+    run = TaskRun(task.name, task_id)
+    connection.execute_wrappers.append(run)
+    _active_runs[task_id] = run
+
+
+def finish_task_run(task_id=None, state=None, **kwargs):
+    run = _active_runs.pop(task_id, None)
+    if run is None:
+        return
+    connection.execute_wrappers.remove(run)
+    run.finish(state)
+    finished_runs.append(run)
+
+    logger.info(json.dumps({'event': 'task_run', **run.as_dict()}))
+    if settings.METRICS['ENABLED']:
+        from .metrics import TASK_QUERIES, TASK_ROWS_WRITTEN
+        TASK_QUERIES.labels(run.task_name).observe(run.queries)
+        TASK_ROWS_WRITTEN.labels(run.task_name).inc(run.rows_written)
+
+
+def connect_celery_signals():
+    from celery.signals import task_postrun, task_prerun
+
+    task_prerun.connect(start_task_run, weak=False)
+    task_postrun.connect(finish_task_run, weak=False)
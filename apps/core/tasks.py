@@ -0,0 +1,29 @@
+"""
+Celery tasks for the transactional outbox
+"""
+
+from celery import shared_task
+from django.utils import timezone
+
+from . import outbox
+from .locks import skipped_run, task_lease
+
+
+@shared_task(bind=True)
+def drain_outbox(self):
+    # one consumer at a time, so projections see the events in id order
+    with task_lease('core.drain_outbox') as lease:
+        if not lease.acquired:
+            return skipped_run('drain_outbox')
+        
+        try:
+            stats = outbox.drain(lease=lease)
+            return {
+                'task': 'drain_outbox',
+                'status': 'completed' if lease.held else 'lease_lost',
+                **stats,
+                'timestamp': timezone.now().isoformat()
+            }
+        
+        except Exception as exc:
+            self.retry(exc=exc, countdown=30, max_retries=3)
@@ -0,0 +1,35 @@
+"""
+helpers shared by the app test suites
+"""
+
+from django.db import connection, transaction
+
+
+class ExplainMixin:
+    """
+    EXPLAIN a queryset with and without an index, for TestCase classes that check
+    the planner picks up the indexes a migration adds
+    """
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # a few hundred rows fit in one page, so PostgreSQL would always pick a seq scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def explain_without(self, queryset, index_name):
+        # drop the index in a savepoint and roll it back afterwards
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(index_name)}')
+            plan = self.explain(queryset)
+            transaction.set_rollback(True)
+        return plan
+
+    def assertUsesIndex(self, queryset, index_name):
+        before = self.explain_without(queryset, index_name)
+        after = self.explain(queryset)
+        evidence = f'\nwithout {index_name}:\n{before}\nwith {index_name}:\n{after}'
+        self.assertIn(index_name, after, evidence)
+        self.assertNotEqual(before, after, evidence)
@@ -1 +1,989 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from apps.comments.archive import is_partitioned
+from apps.comments.models import ArchivedComment, Comment
+from apps.comments.purge import CommentPurge
+from apps.core import aio, outbox, pagination
+from apps.core.locks import Lease, task_lease
+from apps.core.metrics import TASK_LEASES, QueryRecorder
+from apps.core.middleware import MetricsMiddleware, ProfilingMiddleware, QueryStatsMiddleware, RequestTimingMiddleware
+from apps.core.models import OutboxEvent, QueryFingerprint, TaskLease
+from apps.core.tasks import drain_outbox
+from apps.core.pagination import EstimatedCountPaginator
+from apps.core.parsers import ORJSONParser
+from apps.core.querystats import BUCKETS_MS, QueryStats, fingerprint, histogram_percentile, query_stats
+from apps.core.querywrappers import query_wrapper
+from apps.core.renderers import ORJSONRenderer
+from apps.core.serializers import TimedListSerializer
+from apps.core.taskruns import finished_runs
+from apps.core.timing import RequestTimer, TimedDjangoTemplates, current_timer
+from apps.videos.models import Video, VideoCategory
+from apps.videos.serializers import VideoCategorySerializer, VideoListSerializer
+
+
+@override_settings(COUNT_ESTIMATES={'THRESHOLD': 1000, 'CACHE_SECONDS': 60})
+class EstimatedCountPaginatorTests(TestCase):
+    """
+    planner estimates above the threshold, exact counts below it or without one,
+    cached exact counts above it
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(5):
+            VideoCategory.objects.create(name=f'Paginator category {number}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_exact_count_without_estimate(self):
+        # SQLite has no planner estimates
+        with mock.patch.object(pagination, 'planner_estimate', return_value=None):
+            paginator = EstimatedCountPaginator(VideoCategory.objects.all(), 2)
+            self.assertEqual(paginator.count, 5)
+        self.assertEqual(paginator.count_kind, 'exact')
+
+    def test_exact_count_below_threshold(self):
+        with mock.patch.object(pagination, 'planner_estimate', return_value=999):
+            paginator = EstimatedCountPaginator(VideoCategory.objects.all(), 2)
+            self.assertEqual(paginator.count, 5)
+        self.assertEqual(paginator.count_kind, 'exact')
+
+    def test_estimate_above_threshold(self):
+        with mock.patch.object(pagination, 'planner_estimate', return_value=2500000):
+            paginator = EstimatedCountPaginator(VideoCategory.objects.all(), 2)
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.count, 2500000)
+        self.assertEqual(paginator.count_kind, 'estimated')
+        self.assertEqual(paginator.num_pages, 1250000)
+
+    def test_exact_count_above_threshold_is_cached(self):
+        with override_settings(COUNT_ESTIMATES={'THRESHOLD': 3, 'CACHE_SECONDS': 60}):
+            paginator = EstimatedCountPaginator(VideoCategory.objects.all(), 2)
+            self.assertEqual((paginator.count, paginator.count_kind), (5, 'exact'))
+            paginator = EstimatedCountPaginator(VideoCategory.objects.all(), 2)
+            with self.assertNumQueries(0):
+                self.assertEqual((paginator.count, paginator.count_kind), (5, 'cached'))
+            # another filter is another count
+            paginator = EstimatedCountPaginator(VideoCategory.objects.filter(is_active=True), 2)
+            self.assertEqual((paginator.count, paginator.count_kind), (5, 'exact'))
+
+    def test_pagination_counts_count_queryset(self):
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+
+        request = Request(APIRequestFactory().get('/', {'page': 2}))
+        paginator = pagination.EstimatedCountPagination()
+        paginator.page_size = 2
+        rows = VideoCategory.objects.order_by('name').values('name')
+        with self.assertNumQueries(2) as queries:
+            page = paginator.paginate_queryset(rows, request, count_queryset=VideoCategory.objects.filter(is_active=True))
+        self.assertEqual([row['name'] for row in page], ['Paginator category 2', 'Paginator category 3'])
+        self.assertIn('"is_active"', queries.captured_queries[0]['sql'])
+        self.assertEqual(paginator.page.paginator.count, 5)
+
+        # without one, the object list itself is counted
+        paginator.paginate_queryset(rows, request)
+        self.assertIsNone(paginator.page.paginator.count_queryset)
+
+    def test_api_reports_count_kind(self):
+        response = self.client.get('/api/v1/videos/categories/', HTTP_HOST='localhost')
+        self.assertEqual(response.json()['count_kind'], 'exact')
+
+
+class TaskLeaseTests(TestCase):
+    """
+    one holder per lease name, expiry without heartbeats, and coalesced reruns
+    """
+
+    def outcomes(self, name, outcome):
+        return TASK_LEASES.labels(name, outcome)._value.get()
+
+    def test_one_holder_at_a_time(self):
+        first, second = Lease('tests.lease', 60), Lease('tests.lease', 60)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertFalse(first.release())
+        self.assertTrue(second.acquire())
+
+    def test_expired_lease_is_taken_over(self):
+        stalled, successor = Lease('tests.expiry', 60), Lease('tests.expiry', 60)
+        stalled.acquire()
+        TaskLease.objects.filter(name='tests.expiry').update(expires_at=timezone.now() - timedelta(seconds=1))
+        lost = self.outcomes('tests.expiry', 'lost')
+        self.assertTrue(successor.acquire())
+
+        # the stalled run finds out on its next heartbeat, and must not free the successor's lease
+        stalled.last_heartbeat = 0
+        self.assertFalse(stalled.heartbeat())
+        self.assertEqual(self.outcomes('tests.expiry', 'lost'), lost + 1)
+        stalled.release()
+        self.assertTrue(TaskLease.objects.get(name='tests.expiry').is_held)
+
+    def test_overlapping_runs_are_skipped_or_coalesced(self):
+        rerun = mock.Mock()
+        skipped = self.outcomes('tests.coalesce', 'coalesced')
+        with task_lease('tests.coalesce', rerun=rerun) as lease:
+            self.assertTrue(lease.acquired)
+            for _ in range(3):
+                with task_lease('tests.coalesce', rerun=rerun) as overlapping:
+                    self.assertFalse(overlapping.acquired)
+            rerun.apply_async.assert_not_called()
+        # three overlapping runs, one follow-up
+        rerun.apply_async.assert_called_once_with()
+        self.assertEqual(self.outcomes('tests.coalesce', 'coalesced'), skipped + 3)
+        self.assertFalse(TaskLease.objects.get(name='tests.coalesce').is_held)
+
+
+def failing_handler(events):
+    raise RuntimeError('projection down')
+
+
+class OutboxTests(TestCase):
+    """
+    events commit or roll back with their write, the bulk paths record one per row,
+    and drain applies them to the comment counts in batches
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.video = Video.objects.create(title='Outbox test', channel_name='Outbox', duration=60)
+
+    def setUp(self):
+        outbox.drain()
+
+    def comment_count(self):
+        return Video.objects.values_list('comment_count', flat=True).get(pk=self.video.pk)
+
+    def test_event_is_written_with_the_change(self):
+        comment = Comment.objects.create(video=self.video, content='First', author_name='Outbox')
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.topic, event.action, event.object_id), ('comment', 'created', comment.pk))
+        self.assertEqual(event.payload, {'video_id': self.video.pk})
+        # the count follows once the outbox is drained
+        self.assertEqual(self.comment_count(), 0)
+        self.assertEqual(outbox.drain()['events'], 1)
+        self.assertEqual(self.comment_count(), 1)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Comment.objects.create(video=self.video, content='Rolled back', author_name='Outbox')
+            raise RuntimeError
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_bulk_paths_record_every_row(self):
+        response = self.client.post('/api/v1/comments/batch/', {
+            'comments': [{'video_id': self.video.pk, 'content': f'Batch {number}', 'author_name': 'Outbox'} for number in range(3)]
+        }, content_type='application/json', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(OutboxEvent.objects.filter(topic='comment', action='created').count(), 3)
+
+        # per batch: read the events, one comment count UPDATE, delete the events; then the empty read
+        with self.assertNumQueries(7):
+            self.assertEqual(outbox.drain(batch_size=2)['batches'], 2)
+        self.assertEqual(self.comment_count(), 3)
+
+        stats = CommentPurge('tests.outbox_purge', Comment.objects.filter(video=self.video)).run()
+        self.assertEqual(stats['deleted_comments'], 3)
+        # one event for the video, not one per comment
+        self.assertEqual(OutboxEvent.objects.filter(action='purged').count(), 1)
+        outbox.drain()
+        self.assertEqual(self.comment_count(), 0)
+
+    def test_failed_batch_is_delivered_again(self):
+        Comment.objects.create(video=self.video, content='Retried', author_name='Outbox')
+        with override_settings(OUTBOX={'BATCH_SIZE': 100, 'HANDLERS': ['apps.core.tests.failing_handler']}):
+            with self.assertRaises(RuntimeError):
+                outbox.drain()
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+        outbox.drain()
+        self.assertEqual(self.comment_count(), 1)
+
+
+class IngestCommandTests(TestCase):
+    """
+    ingest validates rows before they reach the database, rejects the bad ones
+    and only overwrites the columns a row provides
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = VideoCategory.objects.create(name='Ingest category')
+        cls.video = Video.objects.create(
+            title='Existing', slug='existing', channel_name='Ingest', duration=120, view_count=5, description='Kept'
+        )
+
+    def ingest(self, model, lines, suffix='.ndjson'):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as dump:
+            dump.write('\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines) + '\n')
+        self.addCleanup(os.unlink, dump.name)
+        stdout, stderr = StringIO(), StringIO()
+        call_command('ingest', model, dump.name, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_rows_missing_required_columns_are_rejected(self):
+        stdout, stderr = self.ingest('videos', [
+            {'title': 'Complete', 'channel_name': 'Ingest', 'duration': 60, 'category': 'Ingest category'},
+            {'title': 'No duration', 'channel_name': 'Ingest'},
+            {'title': 'Too long', 'channel_name': 'Ingest', 'duration': 10 ** 6},
+        ])
+        self.assertIn('Ingested 1 videos', stdout)
+        self.assertIn('rejected 2', stdout)
+        self.assertIn('new video needs duration', stderr)
+        self.assertEqual(Video.objects.get(slug='complete').category, self.category)
+        self.assertFalse(Video.all_objects.filter(slug__in=['no-duration', 'too-long']).exists())
+
+    def test_existing_slug_only_gets_the_provided_columns(self):
+        stdout, _ = self.ingest('videos', [{'slug': 'existing', 'view_count': 900}])
+        self.assertIn('rejected 0', stdout)
+        video = Video.objects.get(pk=self.video.pk)
+        self.assertEqual((video.view_count, video.title, video.duration, video.description), (900, 'Existing', 120, 'Kept'))
+        self.assertEqual(OutboxEvent.objects.filter(object_id=video.pk, action='updated').last().payload, {'fields': ['view_count']})
+
+    def test_comment_timestamps_come_from_the_dump(self):
+        stdout, _ = self.ingest('comments', [
+            {'video_id': self.video.pk, 'content': 'Old', 'author_name': 'Dump', 'created_at': '2020-01-02T03:04:05Z'},
+            {'video_slug': 'existing', 'content': 'Undated', 'author_name': 'Dump'},
+        ])
+        self.assertIn('Ingested 2 comments', stdout)
+        old = Comment.objects.get(content='Old')
+        self.assertEqual(old.created_at.isoformat(), '2020-01-02T03:04:05+00:00')
+        self.assertGreater(Comment.objects.get(content='Undated').created_at, old.created_at)
+        # comments saved outside the ingest still get the current time
+        fresh = Comment.objects.create(video=self.video, content='Fresh', author_name='Live')
+        self.assertLess(timezone.now() - fresh.created_at, timedelta(minutes=1))
+
+    def test_invalid_json_line_is_rejected(self):
+        stdout, stderr = self.ingest('videos', [
+            {'title': 'Before', 'channel_name': 'Ingest', 'duration': 60},
+            '{"title": "Broken",',
+            '[1, 2]',
+            {'title': 'After', 'channel_name': 'Ingest', 'duration': 60},
+        ])
+        self.assertIn('Ingested 2 videos', stdout)
+        self.assertIn('rejected 2', stdout)
+        self.assertIn('Line 2: skipped (invalid JSON', stderr)
+        self.assertEqual(Video.objects.filter(slug__in=['before', 'after']).count(), 2)
+
+    def test_csv_comments_drop_orphan_replies(self):
+        stdout, _ = self.ingest('comments', [
+            'id,video_id,content,author_name,parent_id',
+            f'900001,{self.video.pk},Parent,Dump,',
+            f'900002,{self.video.pk},Reply,Dump,900001',
+            f'900003,{self.video.pk},Orphan,Dump,123456789',
+        ], suffix='.csv')
+        self.assertIn('Ingested 2 comments', stdout)
+        self.assertIn('rejected 1', stdout)
+        self.assertEqual(Comment.objects.get(pk=900002).parent_comment_id, 900001)
+
+    def test_moved_comment_recounts_both_videos(self):
+        other = Video.objects.create(title='Other', slug='other', channel_name='Ingest', duration=60)
+        self.ingest('comments', [{'id': 900010, 'video_id': self.video.pk, 'content': 'Moving', 'author_name': 'Dump'}])
+        self.assertEqual(Video.objects.get(pk=self.video.pk).comment_count, 1)
+        outbox.drain()
+
+        stdout, _ = self.ingest('comments', [{'id': 900010, 'video_id': other.pk, 'content': 'Moved', 'author_name': 'Dump'}])
+        self.assertIn('Reconciling comment counts for 2 videos', stdout)
+        # reconciled by the command itself, before any outbox drain
+        self.assertEqual(Video.objects.get(pk=self.video.pk).comment_count, 0)
+        self.assertEqual(Video.objects.get(pk=other.pk).comment_count, 1)
+        self.assertEqual(
+            OutboxEvent.objects.filter(object_id=900010, action='updated').last().payload,
+            {'video_id': other.pk, 'previous_video_id': self.video.pk}
+        )
+
+        # the projection recounts the video the comment left as well
+        Video.objects.filter(pk=self.video.pk).update(comment_count=5)
+        outbox.drain()
+        self.assertEqual(Video.objects.get(pk=self.video.pk).comment_count, 0)
+
+
+@skipUnless(pq, 'snapshots need pyarrow')
+class ExportSnapshotTests(TestCase):
+    """
+    export_snapshot reads in id-keyset chunks, writes one file per created_month
+    partition and run, and appends only the rows past the _state.json watermarks
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.videos = [
+            Video.objects.create(title=f'Snapshot {number}', channel_name='Snapshot', duration=60)
+            for number in range(5)
+        ]
+        # three videos in January, two in February
+        for number, video in enumerate(cls.videos):
+            Video.objects.filter(pk=video.pk).update(
+                created_at=datetime(2026, 1 + number // 3, 10, tzinfo=dt_timezone.utc)
+            )
+        cls.comments = [
+            Comment.objects.create(
+                video=cls.videos[0], content=f'Snapshot {number}', author_name='Snapshot',
+                created_at=datetime(2026, 1 + number, 5, tzinfo=dt_timezone.utc),
+            )
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def export(self):
+        stdout = StringIO()
+        call_command('export_snapshot', output=str(self.root), chunk_size=2, stdout=stdout)
+        return stdout.getvalue()
+
+    def rows(self, table, partition='*'):
+        # partition -> ids, over every part file of every run
+        found = {}
+        for path in sorted(self.root.glob(f'{table}/{partition}/part-*.parquet')):
+            found.setdefault(path.parent.name, []).extend(pq.read_table(path).column('id').to_pylist())
+        return found
+
+    def state(self):
+        return json.loads((self.root / '_state.json').read_text())
+
+    def test_first_run_partitions_every_row(self):
+        self.assertIn('5 videos, 2 comments, 5 reaction rows', self.export())
+        self.assertEqual(self.rows('videos'), {
+            'created_month=2026-01': [video.pk for video in self.videos[:3]],
+            'created_month=2026-02': [video.pk for video in self.videos[3:]],
+        })
+        self.assertEqual(self.rows('comments'), {
+            'created_month=2026-01': [self.comments[0].pk],
+            'created_month=2026-02': [self.comments[1].pk],
+        })
+        # chunks of 2 still go to one file per partition and run
+        self.assertEqual(len(list(self.root.glob('videos/created_month=2026-01/part-*.parquet'))), 1)
+        self.assertFalse(list(self.root.glob('**/*.tmp')))
+        self.assertEqual(self.state()['videos'], {'last_id': self.videos[-1].pk})
+        self.assertEqual(self.state()['comments'], {'last_id': self.comments[-1].pk})
+
+    def test_second_run_appends_from_the_watermark(self):
+        self.export()
+        late = Video.objects.create(title='Snapshot late', channel_name='Snapshot', duration=60)
+        Video.objects.filter(pk=late.pk).update(created_at=datetime(2026, 2, 20, tzinfo=dt_timezone.utc))
+        comment = Comment.objects.create(
+            video=late, content='Snapshot late', author_name='Snapshot',
+            created_at=datetime(2026, 3, 1, tzinfo=dt_timezone.utc),
+        )
+        # a change to an exported row is not picked up again by the id watermark
+        Video.objects.filter(pk=self.videos[0].pk).update(title='Renamed')
+
+        self.assertIn('1 videos, 1 comments, 6 reaction rows', self.export())
+        videos = self.rows('videos')
+        # the run ids in the file names are not ordered within a second
+        self.assertEqual(sorted(videos['created_month=2026-02']), [video.pk for video in self.videos[3:]] + [late.pk])
+        self.assertEqual(sum(len(ids) for ids in videos.values()), 6)
+        self.assertEqual(len(list(self.root.glob('videos/created_month=2026-02/part-*.parquet'))), 2)
+        self.assertEqual(self.rows('comments', 'created_month=2026-03'), {'created_month=2026-03': [comment.pk]})
+        self.assertEqual(self.state()['videos'], {'last_id': late.pk})
+        self.assertEqual([run['videos'] for run in self.state()['runs']], [5, 1])
+
+        # nothing new, nothing written but the reaction snapshot
+        self.assertIn('0 videos, 0 comments, 6 reaction rows', self.export())
+        self.assertEqual(sum(len(ids) for ids in self.rows('videos').values()), 6)
+
+
+class ArchiveCommentsTests(TestCase):
+    """
+    archive_comments moves old comments with their reply threads into
+    ArchivedComment: row by row here, by partition on a partitioned PostgreSQL table
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.video = Video.objects.create(title='Archive test', channel_name='Archive', duration=60)
+        old = timezone.now() - timedelta(days=300)
+        cls.old = [
+            Comment.objects.create(video=cls.video, content=f'Old {number}', author_name='Archive', created_at=old)
+            for number in range(3)
+        ]
+        # a recent reply to an old comment moves with its thread
+        cls.reply = Comment.objects.create(
+            video=cls.video, parent_comment=cls.old[0], content='Recent reply', author_name='Archive'
+        )
+        cls.recent = Comment.objects.create(video=cls.video, content='Recent', author_name='Archive')
+        outbox.drain()
+
+    def archive(self, *args):
+        stdout = StringIO()
+        call_command('archive_comments', '--months', '6', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        self.assertIn('Would archive 3 comments', self.archive('--dry-run'))
+        self.assertEqual(Comment.objects.count(), 5)
+        self.assertFalse(ArchivedComment.objects.exists())
+
+    def test_old_threads_are_archived(self):
+        self.assertIn('Archived 4 comments', self.archive('--batch-size', '2'))
+        self.assertEqual(list(Comment.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertEqual(
+            set(ArchivedComment.objects.values_list('pk', flat=True)),
+            {comment.pk for comment in self.old} | {self.reply.pk},
+        )
+        archived = ArchivedComment.objects.get(pk=self.old[1].pk)
+        self.assertEqual(archived.created_at, self.old[1].created_at)
+
+        # the comment count follows through the outbox
+        self.assertEqual(Video.objects.get(pk=self.video.pk).comment_count, 5)
+        outbox.drain()
+        self.assertEqual(Video.objects.get(pk=self.video.pk).comment_count, 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'comment partitions need PostgreSQL')
+    def test_partitioned_round_trip(self):
+        if not is_partitioned():
+            call_command('partition_comments', stdout=StringIO())
+        self.assertTrue(is_partitioned())
+        # the old month got its own partition, which is archived whole
+        self.assertIn('Archived 4 comments', self.archive())
+        self.assertEqual(list(Comment.objects.values_list('pk', flat=True)), [self.recent.pk])
+
+        call_command('partition_comments', '--undo', stdout=StringIO())
+        self.assertFalse(is_partitioned())
+        created = Comment.objects.create(video=self.video, content='After', author_name='Archive')
+        self.assertGreater(created.pk, self.recent.pk)
+
+
+class AsyncReadsTests(TransactionTestCase):
+    """
+    apps.core.aio runs queries on its own threads (and connections, hence committed
+    rows): the request's query wrappers see all of them, get_page pages like the paginator
+    """
+
+    def setUp(self):
+        for number in range(5):
+            VideoCategory.objects.create(name=f'Async category {number}')
+
+    def test_request_wrappers_see_pool_queries(self):
+        timer, recorder = RequestTimer(), QueryRecorder('test')
+
+        async def read():
+            with query_wrapper(timer), query_wrapper(recorder):
+                return await aio.gather(*[lambda: [VideoCategory.objects.count() for _ in range(25)]] * 8)
+
+        results = async_to_sync(read)()
+        self.assertEqual(results, [[5] * 25] * 8)
+        self.assertEqual(timer.queries, 200)
+        self.assertEqual(recorder.queries, 200)
+
+    def test_wrappers_end_with_the_context(self):
+        recorder = QueryRecorder('test')
+
+        async def read():
+            with query_wrapper(recorder):
+                await aio.gather(VideoCategory.objects.count)
+            await aio.gather(VideoCategory.objects.count)
+
+        async_to_sync(read)()
+        self.assertEqual(recorder.queries, 1)
+
+    def test_get_page(self):
+        queryset = VideoCategory.objects.order_by('name')
+        page, names = async_to_sync(aio.get_page)(
+            queryset, 2, 2, lambda: list(queryset.values_list('name', flat=True))
+        )
+        self.assertEqual(page.number, 2)
+        self.assertEqual(list(page.object_list), list(queryset[2:4]))
+        self.assertEqual((page.paginator.count, page.paginator.num_pages), (5, 3))
+        self.assertTrue(page.has_next())
+        self.assertEqual(len(names), 5)
+
+    def test_get_page_past_the_end_is_the_last_page(self):
+        queryset = VideoCategory.objects.order_by('name')
+        page, = async_to_sync(aio.get_page)(queryset, 2, 9)
+        self.assertEqual(page.number, 3)
+        self.assertEqual(list(page.object_list), list(queryset[4:]))
+
+
+@override_settings(
+    QUERY_STATS={'ENABLED': True, 'FLUSH_INTERVAL': 30},
+    METRICS={'ENABLED': True, 'QUEUES': []},
+    PROFILING={'ENABLED': True, 'DIR': tempfile.gettempdir(), 'SAMPLE_INTERVAL_MS': 5, 'MAX_SQL_STATEMENTS': 10},
+    REQUEST_TIMING={'SAMPLE_RATE': 1},
+)
+class HybridMiddlewareTests(SimpleTestCase):
+    """the core middleware takes the mode of the chain, so ASGI keeps the async views on the event loop"""
+
+    middleware_classes = (QueryStatsMiddleware, MetricsMiddleware, ProfilingMiddleware, RequestTimingMiddleware)
+
+    def test_async_chain(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        for middleware_class in self.middleware_classes:
+            with self.subTest(middleware_class.__name__):
+                middleware = middleware_class(get_response)
+                self.assertTrue(iscoroutinefunction(middleware))
+                if hasattr(middleware, 'process_view'):
+                    self.assertTrue(iscoroutinefunction(middleware.process_view))
+
+    def test_sync_chain(self):
+        for middleware_class in self.middleware_classes:
+            with self.subTest(middleware_class.__name__):
+                middleware = middleware_class(lambda request: HttpResponse())
+                self.assertFalse(iscoroutinefunction(middleware))
+                if hasattr(middleware, 'process_view'):
+                    self.assertFalse(iscoroutinefunction(middleware.process_view))
+
+
+class ProfilingTests(TestCase):
+    """
+    staff ask for a profile with ?profile= or X-Profile, get the report back through
+    /api/profiles/<file>, and only the newest reports are kept
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('profiler', password='x', is_staff=True)
+        cls.user = User.objects.create_user('visitor', password='x')
+        Video.objects.create(title='Profiled', channel_name='Profiling', duration=60, status='published')
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+        profiling = override_settings(PROFILING={
+            'ENABLED': True, 'DIR': str(self.directory), 'SAMPLE_INTERVAL_MS': 5,
+            'MAX_SQL_STATEMENTS': 100, 'KEEP_REPORTS': 2,
+        })
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+
+    def get(self, url, **extra):
+        return self.client.get(url, HTTP_HOST='localhost', **extra)
+
+    def test_staff_get_a_cprofile_report(self):
+        self.client.force_login(self.staff)
+        response = self.get('/api/v1/videos/?profile=cprofile')
+        self.assertEqual(response.status_code, 200)
+        report = self.get(response['X-Profile'])
+        self.assertEqual(report.status_code, 200)
+        self.assertEqual(report['Content-Type'], 'application/json')
+        data = json.loads(b''.join(report.streaming_content))
+        self.assertEqual((data['mode'], data['user'], data['status']), ('cprofile', 'profiler', 200))
+        self.assertEqual(data['queries'], len(data['sql']))
+        self.assertGreater(data['queries'], 0)
+        self.assertTrue((self.directory / data['files']['pstats']).is_file())
+
+    def test_header_asks_for_stack_samples(self):
+        self.client.force_login(self.staff)
+        response = self.get('/api/v1/videos/', HTTP_X_PROFILE='anything')
+        name = response['X-Profile'].rsplit('/', 1)[1]
+        data = json.loads((self.directory / name).read_text())
+        self.assertEqual(data['mode'], 'sample')
+        folded = self.get(f'/api/profiles/{data["files"]["folded"]}')
+        self.assertEqual(folded['Content-Type'], 'application/octet-stream')
+        self.assertIn('attachment', folded['Content-Disposition'])
+
+    def test_other_users_are_not_profiled(self):
+        self.assertNotIn('X-Profile', self.get('/api/v1/videos/?profile=sample'))
+        self.client.force_login(self.user)
+        self.assertNotIn('X-Profile', self.get('/api/v1/videos/?profile=sample'))
+        self.assertFalse(list(self.directory.iterdir()))
+
+    def test_files_are_staff_only(self):
+        (self.directory / 'report.json').write_text('{}')
+        self.assertEqual(self.get('/api/profiles/report.json').status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.get('/api/profiles/report.json').status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.get('/api/profiles/report.json').status_code, 200)
+        self.assertEqual(self.get('/api/profiles/missing.json').status_code, 404)
+
+    def test_file_names_are_validated(self):
+        self.client.force_login(self.staff)
+        (self.directory / 'notes.txt').write_text('secret')
+        for url in ('/api/profiles/notes.txt', '/api/profiles/..%2Fsettings.json', '/api/profiles/a.b.json'):
+            with self.subTest(url):
+                self.assertEqual(self.get(url).status_code, 404)
+
+    def test_old_reports_are_pruned(self):
+        self.client.force_login(self.staff)
+        names = [self.get('/api/v1/videos/?profile=cprofile')['X-Profile'].rsplit('/', 1)[1] for _ in range(3)]
+        # the report and its pstats dump, for the two newest
+        kept = sorted(path.name for path in self.directory.iterdir())
+        self.assertEqual(len(kept), 4)
+        self.assertEqual(sorted(name for name in kept if name.endswith('.json')), sorted(names)[1:])
+
+
+class RequestTimingTests(TestCase):
+    """
+    serializer and template time come from the repo's serializer bases and template
+    backend, without patching DRF or Django
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = VideoCategory.objects.create(name='Timing category')
+        for number in range(3):
+            Video.objects.create(title=f'Timing test {number}', channel_name='Timing', duration=60, category=category)
+
+    def timed(self, fn):
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        try:
+            fn()
+        finally:
+            current_timer.reset(token)
+        return timer
+
+    def test_serializer_span(self):
+        serializer = VideoListSerializer(Video.objects.all(), many=True)
+        self.assertIsInstance(serializer, TimedListSerializer)
+        timer = self.timed(lambda: serializer.data)
+        self.assertGreater(timer.spans['serializer'], 0)
+        self.assertEqual(timer.spans['template'], 0)
+
+        timer = self.timed(lambda: VideoCategorySerializer(VideoCategory.objects.get()).data)
+        self.assertGreater(timer.spans['serializer'], 0)
+
+    def test_many_keeps_list_serializer_kwargs(self):
+        serializer = VideoListSerializer(Video.objects.all(), many=True, allow_empty=False, context={'a': 1})
+        self.assertFalse(serializer.allow_empty)
+        self.assertEqual(serializer.child.context, {'a': 1})
+        self.assertEqual(len(serializer.data), 3)
+
+    def test_template_span(self):
+        self.assertIsInstance(engines['django'], TimedDjangoTemplates)
+        timer = self.timed(lambda: render_to_string('home.html', {}))
+        self.assertGreater(timer.spans['template'], 0)
+        self.assertEqual(timer.spans['serializer'], 0)
+
+    def test_outside_sampled_requests_nothing_is_timed(self):
+        self.assertEqual(len(VideoListSerializer(Video.objects.all(), many=True).data), 3)
+        self.assertTrue(render_to_string('home.html', {}))
+
+    def test_drf_and_django_are_not_patched(self):
+        from django.template.backends.django import Template
+        from rest_framework import serializers
+
+        for prop in (serializers.Serializer.data, serializers.ListSerializer.data):
+            self.assertEqual(prop.fget.__module__, 'rest_framework.serializers')
+        self.assertEqual(Template.render.__module__, 'django.template.backends.django')
+
+    @override_settings(REQUEST_TIMING={'SAMPLE_RATE': 1})
+    def test_server_timing_header(self):
+        response = self.client.get('/api/v1/videos/categories/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        entries = dict(entry.split(';')[:2] for entry in response['Server-Timing'].split(', '))
+        self.assertEqual(list(entries), ['db', 'serializer', 'template', 'view', 'total'])
+        self.assertGreater(float(entries['serializer'][len('dur='):]), 0)
+
+
+class QueryStatsTests(TestCase):
+    """
+    fingerprints, histogram percentiles, the writes of the aggregates (never in a
+    request) and the index_advisor report
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(20):
+            Video.objects.create(title=f'Stats test {number}', channel_name='Stats', duration=number)
+
+    def setUp(self):
+        # the flusher thread would write outside the test transaction
+        patcher = mock.patch.object(QueryStats, 'start_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, stats, fn):
+        with connection.execute_wrapper(stats):
+            fn()
+
+    def test_fingerprint_ignores_literals_and_list_lengths(self):
+        key, normalized = fingerprint("SELECT * FROM t WHERE a = 1 AND b = 'x''y' AND c IN (%s, %s, %s)")
+        self.assertEqual(normalized, 'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)')
+        self.assertEqual(fingerprint("SELECT  *\nFROM t WHERE a = 22 AND b = 'z' AND c IN (%s)")[0], key)
+        self.assertNotEqual(fingerprint('SELECT * FROM t WHERE a = 1')[0], key)
+        self.assertEqual(
+            fingerprint('INSERT INTO t ("a", "b") VALUES (%s, %s), (%s, %s)')[1],
+            'INSERT INTO t ("a", "b") VALUES (...)',
+        )
+        # digits inside quoted identifiers are not literals
+        self.assertIn('"t2"."col1"', fingerprint('SELECT "t2"."col1" FROM "t2"')[1])
+
+    def test_histogram_percentile(self):
+        histogram = [0] * (len(BUCKETS_MS) + 1)
+        self.assertEqual(histogram_percentile(histogram, 0.95), 0)
+        histogram[0], histogram[3], histogram[6] = 90, 5, 5
+        self.assertEqual(histogram_percentile(histogram, 0.5), BUCKETS_MS[0])
+        self.assertEqual(histogram_percentile(histogram, 0.95), BUCKETS_MS[3])
+        self.assertEqual(histogram_percentile(histogram, 0.99), BUCKETS_MS[6])
+        histogram[-1] = 100
+        self.assertEqual(histogram_percentile(histogram, 0.99), float('inf'))
+
+    def test_flush_merges_into_existing_rows(self):
+        stats = QueryStats()
+        self.record(stats, lambda: [Video.objects.filter(duration=number).count() for number in range(3)])
+        self.assertEqual(stats.flush(), 1)
+        self.assertEqual(stats.flush(), 0)
+        self.record(stats, lambda: Video.objects.filter(duration=7).count())
+        stats.flush()
+
+        row = QueryFingerprint.objects.get()
+        self.assertEqual(row.source, 'other')
+        self.assertEqual(row.calls, 4)
+        self.assertEqual(sum(row.histogram), 4)
+        self.assertIn('"duration" = ?', row.sql)
+        self.assertIsNotNone(row.sample_params)
+
+    @override_settings(QUERY_STATS={'ENABLED': True, 'FLUSH_INTERVAL': 30})
+    def test_requests_do_not_write(self):
+        query_stats.entries.clear()
+        self.addCleanup(query_stats.entries.clear)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/videos/categories/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(QueryFingerprint._meta.db_table, ' '.join(query['sql'] for query in queries))
+        self.assertEqual({source for _, source in query_stats.entries}, {'GET videos_api:videocategory-list'})
+
+    def test_index_advisor_suggests_an_index_for_a_scan(self):
+        stats = QueryStats()
+        self.record(stats, lambda: list(Video.all_objects.filter(duration=5).order_by()))
+        self.record(stats, lambda: list(Video.all_objects.filter(channel_name='Stats').order_by()))
+        stats.flush()
+
+        out = StringIO()
+        call_command('index_advisor', '--top', '5', stdout=out)
+        report = out.getvalue()
+        self.assertIn("suggest: Video.Meta.indexes += [models.Index(fields=['duration'])]", report)
+        self.assertIn('plan: uses indexes', report)
+        self.assertIn('1 index suggestions', report)
+
+        call_command('index_advisor', '--reset', stdout=StringIO())
+        self.assertFalse(QueryFingerprint.objects.exists())
+
+
+@override_settings(QUERY_STATS={'ENABLED': True, 'FLUSH_INTERVAL': 0.01})
+class QueryStatsFlusherTests(TransactionTestCase):
+    """the aggregates are written by a background thread of the process"""
+
+    def test_flusher_thread_writes_the_aggregates(self):
+        stats = QueryStats()
+        self.addCleanup(stats.stop_flusher)
+        with connection.execute_wrapper(stats):
+            self.assertFalse(Video.objects.exists())
+        self.assertTrue(stats.flusher.is_alive())
+        self.assertNotEqual(stats.flusher.ident, threading.get_ident())
+
+        deadline = time.monotonic() + 5
+        while stats.entries and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # let the write in progress finish, SQLite's shared cache does not wait for table locks
+        stats.stop_flusher()
+        self.assertEqual(QueryFingerprint.objects.get().calls, 1)
+
+
+class ORJSONTests(SimpleTestCase):
+    """
+    the orjson parser and renderer behave like DRF's JSONParser and JSONRenderer,
+    falling back to them where orjson cannot
+    """
+
+    def parse(self, body, encoding='utf-8'):
+        return ORJSONParser().parse(io.BytesIO(body), 'application/json', {'encoding': encoding})
+
+    def assertRendersLikeDRF(self, data, media_type=None):
+        rendered = ORJSONRenderer().render(data, media_type)
+        self.assertEqual(rendered, JSONRenderer().render(data, media_type))
+        return rendered
+
+    def test_invalid_json_is_a_parse_error(self):
+        for body in (b'{"title": ', b'[1, 2,]', b'\xff'):
+            with self.subTest(body):
+                with self.assertRaisesRegex(ParseError, 'JSON parse error'):
+                    self.parse(body)
+
+    def test_other_encodings_are_decoded_first(self):
+        body = '{"author_name": "Ren\u00e9e"}'.encode('latin-1')
+        self.assertEqual(self.parse(body, 'ISO-8859-1'), {'author_name': 'Ren\u00e9e'})
+        with self.assertRaises(ParseError):
+            self.parse(body)
+
+    def test_line_separators_are_escaped(self):
+        rendered = self.assertRendersLikeDRF({'title': 'one\u2028two\u2029three \u00e9'})
+        self.assertEqual(rendered, '{"title":"one\\u2028two\\u2029three \u00e9"}'.encode())
+
+    def test_wide_integers_fall_back_to_the_stdlib(self):
+        self.assertEqual(self.assertRendersLikeDRF({'views': 2 ** 70}), b'{"views":1180591620717411303424}')
+
+    def test_indent_falls_back_to_the_stdlib(self):
+        rendered = self.assertRendersLikeDRF({'a': [1]}, 'application/json; indent=4')
+        self.assertIn(b'\n    "a"', rendered)
+
+    def test_none_renders_empty(self):
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+
+class ExplicitBrowsableAPITests(TestCase):
+    """browsers get JSON like any client; the browsable API only with ?format=api"""
+
+    def get(self, url):
+        return self.client.get(url, HTTP_HOST='localhost', HTTP_ACCEPT='text/html,application/xhtml+xml,*/*;q=0.8')
+
+    def test_html_accept_gets_json(self):
+        response = self.get('/api/v1/videos/categories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_format_api_gets_the_browsable_api(self):
+        response = self.get('/api/v1/videos/categories/?format=api')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+
+class BenchmarkSerializationTests(TestCase):
+    """benchmark_serialization times both list pages and checks the fast path's bytes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = VideoCategory.objects.create(name='Benchmark category')
+        for number in range(3):
+            video = Video.objects.create(
+                title=f'Benchmark {number}', channel_name='Benchmark', duration=60,
+                category=category, status='published', published_at=timezone.now(),
+            )
+            Comment.objects.create(video=video, content=f'Benchmark {number}', author_name='Benchmark')
+
+    def benchmark(self, *args):
+        stdout = StringIO()
+        call_command('benchmark_serialization', *args, iterations=2, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_both_pages_are_identical(self):
+        output = self.benchmark()
+        self.assertIn('/api/v1/videos/: 3 rows', output)
+        self.assertIn('/api/v1/comments/: 3 rows', output)
+        self.assertEqual(output.count('output identical'), 2)
+        self.assertIn('ORJSONRenderer', output)
+
+    def test_page_with_query_string(self):
+        output = self.benchmark('--page', '/api/v1/videos/?search=Benchmark 1')
+        self.assertIn('1 rows', output)
+        self.assertNotIn('/api/v1/comments/', output)
+
+    def test_empty_page_is_reported(self):
+        self.assertIn('no rows', self.benchmark('--page', '/api/v1/videos/?search=nothing'))
+
+    def test_unknown_page(self):
+        with self.assertRaisesRegex(CommandError, 'Unknown page /api/v1/jobs/'):
+            self.benchmark('--page', '/api/v1/jobs/')
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class MetricsTests(TestCase):
+    """/api/metrics/ exposes request, query, cache and Celery task metrics in the Prometheus format"""
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_and_their_queries_are_recorded(self):
+        labels = {'method': 'GET', 'route': 'videos_api:videocategory-list', 'status': '2xx'}
+        before = self.sample('http_request_duration_seconds_count', **labels)
+        queries = self.sample('db_query_duration_seconds_count', source='videos_api:videocategory-list')
+        self.assertEqual(self.client.get('/api/v1/videos/categories/', HTTP_HOST='localhost').status_code, 200)
+        self.assertEqual(self.sample('http_request_duration_seconds_count', **labels), before + 1)
+        self.assertGreater(self.sample('db_query_duration_seconds_count', source='videos_api:videocategory-list'), queries)
+
+        response = self.client.get('/api/metrics/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="videos_api:videocategory-list"', body)
+        self.assertIn('# TYPE http_request_db_queries histogram', body)
+        # eager mode has no broker to ask
+        self.assertIn('# TYPE celery_queue_length gauge', body)
+
+    def test_cache_hits_and_misses(self):
+        name = cache.metrics_name
+        hits = self.sample('cache_requests_total', cache=name, result='hit')
+        misses = self.sample('cache_requests_total', cache=name, result='miss')
+        cache.delete('metrics-test')
+        self.assertIsNone(cache.get('metrics-test'))
+        cache.set('metrics-test', 1)
+        self.assertEqual(cache.get('metrics-test'), 1)
+        self.assertEqual(self.sample('cache_requests_total', cache=name, result='hit'), hits + 1)
+        self.assertEqual(self.sample('cache_requests_total', cache=name, result='miss'), misses + 1)
+
+    def test_task_runs_are_recorded(self):
+        name = drain_outbox.name
+        runs = self.sample('celery_task_duration_seconds_count', task=name)
+        successes = self.sample('celery_tasks_total', task=name, state='success')
+        drain_outbox.apply().get()
+        self.assertEqual(self.sample('celery_task_duration_seconds_count', task=name), runs + 1)
+        self.assertEqual(self.sample('celery_tasks_total', task=name, state='success'), successes + 1)
+        self.assertGreater(self.sample('db_query_duration_seconds_count', source=f'task {name}'), 0)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class TaskRunTests(TestCase):
+    """every task run is measured (queries, DB time, rows written) and kept for the benchmark"""
+
+    def test_run_counts_queries_and_rows(self):
+        video = Video.objects.create(title='Task run', channel_name='Task run', duration=60)
+        Comment.objects.create(video=video, content='Task run', author_name='Task run')
+        result = drain_outbox.apply()
+        run = next(run for run in finished_runs if run.task_id == result.id)
+        self.assertEqual(run.state, 'SUCCESS')
+        self.assertGreater(run.queries, 0)
+        # at least the comment count UPDATE and the DELETE of the two drained events
+        self.assertGreaterEqual(run.rows_written, 3)
+        self.assertEqual(run.as_dict()['task'], drain_outbox.name)
+        # the wrapper is gone with the run
+        self.assertNotIn(run, connection.execute_wrappers)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class CeleryTaskBenchmarkTests(TransactionTestCase):
+    """test_celery_tasks --iterations runs a task from worker threads and reports on the runs"""
+
+    def run_command(self, *args):
+        stdout = StringIO()
+        call_command('test_celery_tasks', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_benchmark_reports_runs(self):
+        output = self.run_command('--task', 'drain_outbox', '--iterations', '3')
+        self.assertIn('Benchmarking: Outbox Drain (3 runs, concurrency 1, eager)', output)
+        self.assertIn('Runs: 3 (3 ok, 0 failed)', output)
+        self.assertIn('Latency ms: p50', output)
+        # read back from the runs the worker threads recorded
+        self.assertIn('Per run:', output)
+        self.assertIn('rows written', output)
+
+    def test_single_run(self):
+        output = self.run_command('--task', 'drain_outbox')
+        self.assertIn('Outbox Drain completed', output)
+        self.assertIn('All requested tasks completed!', output)
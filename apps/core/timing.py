@@ -0,0 +1,90 @@
+"""
+per-request timing spans (database, serializer, template) for sampled requests.
+the serializer span comes from the API serializer base classes (apps.core.serializers,
+ValuesSerializer), the template span from the TimedDjangoTemplates backend
+"""
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.template.backends.django import DjangoTemplates, Template
+
+current_timer = contextvars.ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    """
+    Collects the timings of one request. Doubles as the execute wrapper that
+    counts queries, so only sampled requests pay for it; an async request runs
+    queries on several threads at once, hence the lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_name = None
+        self.queries = 0
+        self.spans = {'db': 0.0, 'serializer': 0.0, 'template': 0.0}
+        self.active = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.queries += 1
+                self.spans['db'] += duration_ms
+
+    def start_view(self, view_name):
+        self.view_started = time.perf_counter()
+        self.view_name = view_name
+
+    def elapsed_ms(self, since=None):
+        return (time.perf_counter() - (since or self.started)) * 1000
+
+
+@contextmanager
+def span(name):
+    timer = current_timer.get()
+    # nested spans of the same kind (a template including a template) count once
+    if timer is None or name in timer.active:
+        yield
+        return
+
+    timer.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.active.discard(name)
+        timer.spans[name] += (time.perf_counter() - started) * 1000
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with span('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The DjangoTemplates backend (settings.TEMPLATES) with render() timed in the
+    template span of sampled requests; outside them it costs one ContextVar lookup.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def percentile(values, fraction):
+    # nearest rank on sorted values, for the benchmark commands
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
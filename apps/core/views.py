@@ -2,13 +2,23 @@
 core views
 """
 
-from django.http import JsonResponse
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Sum
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from apps.videos import leaderboards
 from apps.videos.models import Video, VideoCategory
 from apps.comments.models import Comment
+from .metrics import render_metrics
+
+
+HOME_LEADERBOARD_SIZE = 5
 
 
 def home_view(request):
@@ -23,6 +33,9 @@ def home_view(request):
         'title': 'Youtube Integration Simulation',
         'description': 'Small Django project that simulates a Youtube integration',
         'stats': stats,
+        'most_viewed': top_videos('views', ['-view_count', '-like_count']),
+        'most_liked': top_videos('likes', ['-like_count']),
+        'top_channels': top_channels(),
         'api_endpoints': [
             {
                 'name': 'Videos',
@@ -46,6 +59,26 @@ def home_view(request):
     return render(request, 'home.html', context)
 
 
+# the home page rankings come from the leaderboards, the ORDER BY is only a fallback
+
+def top_videos(board, ordering):
+    videos = leaderboards.top_videos(board, HOME_LEADERBOARD_SIZE)
+    if videos is None:
+        videos = list(Video.objects.published().order_by(*ordering)[:HOME_LEADERBOARD_SIZE])
+    return videos
+
+
+def top_channels():
+    entries = leaderboards.top('channels', HOME_LEADERBOARD_SIZE)
+    if entries is None:
+        return list(
+            Video.objects.published().values('channel_name').annotate(
+                views=Sum('view_count')
+            ).order_by('-views')[:HOME_LEADERBOARD_SIZE]
+        )
+    return [{'channel_name': channel, 'views': int(views)} for channel, views in entries]
+
+
 @api_view(['GET'])
 def api_status(request):
     stats = {
@@ -75,4 +108,20 @@ def health_check(request):
     return Response({
         'status': 'healthy',
         'timestamp': request.META.get('HTTP_DATE', 'unknown')
-    })
\ No newline at end of file
+    })
+
+
+def metrics_view(request):
+    # Prometheus text format, plain Django view so content negotiation stays out of the way
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
+
+@staff_member_required
+def profile_file(request, name):
+    # reports (.json), folded stacks for flame graphs (.folded) and pstats dumps (.prof)
+    path = Path(settings.PROFILING['DIR']) / name
+    if not path.is_file():
+        raise Http404('Unknown profile')
+    content_type = 'application/json' if path.suffix == '.json' else 'application/octet-stream'
+    return FileResponse(path.open('rb'), content_type=content_type, as_attachment=path.suffix != '.json')
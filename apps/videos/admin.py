@@ -3,10 +3,16 @@ Django admin config for videos
 """
 
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 
+from apps.core import outbox
+from apps.core.pagination import EstimatedCountPaginator
 from .models import Video, VideoCategory
 
 
@@ -17,14 +23,25 @@ class VideoCategoryAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ['created_at', 'updated_at']
+
+    def get_queryset(self, request):
+        # a correlated count per row of the page (video_live_category_idx) instead of a
+        # query per category; the changelist COUNT(*) leaves the unused subquery out
+        published_videos = Video.objects.published().filter(
+            category=OuterRef('pk')
+        ).order_by().values('category').annotate(total=Count('pk')).values('total')
+        return super().get_queryset(request).annotate(
+            published_video_count=Coalesce(Subquery(published_videos), 0)
+        )
     
     def video_count(self, obj):
-        count = obj.videos.filter(status='published').count()
+        count = obj.published_video_count
         if count > 0:
             url = reverse('admin:videos_video_changelist') + f'?category__id__exact={obj.id}'
             return format_html('<a href="{}">{} videos</a>', url, count)
         return '0 videos'
     video_count.short_description = 'Published Videos'
+    video_count.admin_order_field = 'published_video_count'
 
 
 @admin.register(Video)
@@ -35,14 +52,19 @@ class VideoAdmin(admin.ModelAdmin):
         'engagement_rate_display', 'published_at'
     ]
     list_filter = [
-        'status', 'category', 'language', 'created_at', 'published_at'
+        'status', 'category', 'language', 'created_at', 'published_at', 'deleted_at'
     ]
     search_fields = ['title', 'description', 'channel_name', 'tags']
+    list_select_related = ['category']
+    autocomplete_fields = ['category']
+    # no COUNT(*) of the whole table next to a filtered one, estimates for big listings
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     prepopulated_fields = {'slug': ('title',)}
     readonly_fields = [
         'view_count', 'like_count', 'dislike_count', 
         'comment_count', 'engagement_rate', 'like_ratio',
-        'created_at', 'updated_at', 'video_url', 'thumbnail_url'
+        'created_at', 'updated_at', 'deleted_at', 'video_url', 'thumbnail_url'
     ]
     fieldsets = (
         ('Basic Information', {
@@ -65,13 +87,21 @@ class VideoAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'updated_at'),
+            'fields': ('created_at', 'updated_at', 'deleted_at'),
             'classes': ('collapse',)
         }),
     )
     
     actions = ['mark_as_published', 'mark_as_draft', 'update_comment_counts']
     
+    def get_queryset(self, request):
+        # Video.objects hides soft-deleted rows; the admin lists them too, filter on deleted_at
+        queryset = Video.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+    
     def engagement_rate_display(self, obj):
         rate = obj.engagement_rate
         if rate > 5:
@@ -89,7 +119,10 @@ class VideoAdmin(admin.ModelAdmin):
     engagement_rate_display.admin_order_field = 'engagement_rate'
     
     def mark_as_published(self, request, queryset):
-        count = queryset.update(status='published')
+        now = timezone.now()
+        count = self.update_with_events(
+            queryset, status='published', published_at=Coalesce('published_at', now), updated_at=now
+        )
         self.message_user(
             request, 
             f'{count} video(s) marked as published.'
@@ -97,18 +130,24 @@ class VideoAdmin(admin.ModelAdmin):
     mark_as_published.short_description = 'Mark selected videos as published'
     
     def mark_as_draft(self, request, queryset):
-        count = queryset.update(status='draft')
+        count = self.update_with_events(queryset, status='draft', updated_at=timezone.now())
         self.message_user(
             request, 
             f'{count} video(s) marked as draft.'
         )
     mark_as_draft.short_description = 'Mark selected videos as draft'
     
+    def update_with_events(self, queryset, **values):
+        # the UPDATE and its outbox events in one transaction; the leaderboards follow from those
+        with transaction.atomic():
+            video_ids = list(queryset.values_list('pk', flat=True))
+            count = queryset.update(**values)
+            outbox.record_many('video', 'updated', [(pk, {'fields': sorted(values)}) for pk in video_ids])
+        return count
+    
     def update_comment_counts(self, request, queryset):
-        count = 0
-        for video in queryset:
-            video.update_comment_count()
-            count += 1
+        # one UPDATE ... SET comment_count = (subquery) per batch of ids, not a query per video
+        count = Video.objects.refresh_comment_counts(queryset.values_list('pk', flat=True))
         self.message_user(
             request, 
             f'Updated comment counts for {count} video(s).'
@@ -2,12 +2,16 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.db.models import Count, Max, Q, Sum
 
+from apps.core.conditional import ConditionalGetMixin
+from apps.core.fastserializers import ValuesListMixin
+
+from . import leaderboards
 from .models import Video, VideoCategory
 from .serializers import (
-    VideoListSerializer, VideoDetailSerializer, VideoCreateSerializer,
-    VideoCategorySerializer
+    VideoListSerializer, VideoListValuesSerializer, VideoDetailSerializer,
+    VideoCreateSerializer, VideoCategorySerializer
 )
 
 
@@ -20,8 +24,21 @@ class VideoCategoryViewSet(viewsets.ModelViewSet):
     ordering = ['name']
 
 
-class VideoViewSet(viewsets.ModelViewSet):
+class VideoViewSet(ConditionalGetMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Video.objects.select_related('category').prefetch_related('comments')
+    values_serializer_class = VideoListValuesSerializer
+    # counters are updated in place, so they join updated_at in the ETag
+    validator_aggregates = {
+        'updated_at': Max('updated_at'),
+        'views': Sum('view_count'),
+        'likes': Sum('like_count'),
+        'dislikes': Sum('dislike_count'),
+        'comments': Sum('comment_count'),
+        'category_updated_at': Max('category__updated_at'),
+    }
+    # a deleted category nulls video.category without touching the videos
+    list_validator_aggregates = {'count': Count('pk'), 'categorised': Count('category')}
+    detail_validator_aggregates = {'id': Max('id')}
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'description', 'channel_name']
     filterset_fields = ['category', 'status', 'language']
@@ -36,6 +53,13 @@ class VideoViewSet(viewsets.ModelViewSet):
         else:
             return VideoDetailSerializer
 
+    def retrieve_validators(self, queryset):
+        values = super().retrieve_validators(queryset)
+        if values['id'] is not None:
+            # is_trending follows the views leaderboard, which moves without touching the row
+            values['trending'] = leaderboards.is_trending(values['id'])
+        return values
+
     def get_queryset(self):
         queryset = super().get_queryset()
         
@@ -48,8 +72,7 @@ class VideoViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def toggle_like(self, request, pk=None):
         video = self.get_object()
-        video.like_count += 1
-        video.save(update_fields=['like_count'])
+        video.add_like()
         
         return Response({
             'message': 'Video liked successfully',
@@ -59,8 +82,7 @@ class VideoViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def toggle_dislike(self, request, pk=None):
         video = self.get_object()
-        video.dislike_count += 1
-        video.save(update_fields=['dislike_count'])
+        video.add_dislike()
         
         return Response({
             'message': 'Video disliked',
@@ -69,9 +91,11 @@ class VideoViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def trending(self, request):
-        trending_videos = self.get_queryset().filter(
-            status='published'
-        ).order_by('-view_count', '-like_count')[:10]
+        queryset = self.get_queryset().filter(status='published')
+        # top-K from the views leaderboard, the ORDER BY only while it is unavailable
+        trending_videos = leaderboards.top_videos('views', leaderboards.TRENDING_SIZE, queryset)
+        if trending_videos is None:
+            trending_videos = queryset.order_by('-view_count', '-like_count')[:leaderboards.TRENDING_SIZE]
         
         serializer = self.get_serializer(trending_videos, many=True)
         return Response({
@@ -0,0 +1,14 @@
+"""
+API URL configuration for videos on ASGI: the list is async, the rest as in api_urls
+"""
+
+from django.urls import path
+
+from .api_urls import urlpatterns as sync_urlpatterns
+from .async_views import video_list_api
+
+app_name = 'videos_api'
+
+urlpatterns = [
+    path('', video_list_api, name='video-list'),
+] + sync_urlpatterns
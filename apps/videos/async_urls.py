@@ -0,0 +1,14 @@
+"""
+URL configuration for the async video UI views, used by config.asgi_urls
+"""
+
+from django.urls import path
+
+from .async_views import video_list_view, video_detail_view
+
+app_name = 'videos'
+
+urlpatterns = [
+    path('', video_list_view, name='video_list'),
+    path('<int:video_id>/', video_detail_view, name='video_detail'),
+]
@@ -0,0 +1,171 @@
+"""
+async versions of the hot read views, served by the ASGI entrypoint (config.asgi_urls).
+same templates, context and JSON as the sync views, but independent queries run
+at the same time through apps.core.aio
+"""
+
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Q, Sum
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from apps.analytics.models import VideoEngagementRollup
+from apps.comments.models import Comment
+from apps.core.aio import gather, get_page, page_bounds
+from apps.core.conditional import conditional, make_validators, not_modified, set_validators
+from apps.core.fastserializers import values_rows
+from apps.core.renderers import ORJSONRenderer
+from .api_views import VideoViewSet
+from .models import Video, VideoCategory
+from .serializers import VideoListValuesSerializer
+from .views import published_videos, video_detail_validators, video_list_validators
+
+sync_video_list_api = VideoViewSet.as_view({'get': 'list', 'post': 'create'})
+
+
+@conditional(video_list_validators, dated=False)
+async def video_list_view(request):
+    category_id = request.GET.get('category')
+    search = request.GET.get('search', '')
+
+    videos = published_videos(category_id, search).select_related('category').annotate(
+        total_comments=Count('comments', filter=Q(comments__is_approved=True))
+    ).order_by('-published_at')
+
+    videos_page, categories = await get_page(
+        videos, 12, request.GET.get('page'),
+        lambda: list(VideoCategory.objects.filter(is_active=True)),
+        count_queryset=published_videos(category_id, search),
+    )
+
+    context = {
+        'videos': videos_page,
+        'categories': categories,
+        'current_category': category_id,
+        'search_query': search,
+        'total_videos': videos_page.paginator.count,
+        'count_kind': videos_page.paginator.count_kind,
+    }
+
+    return render(request, 'videos/video_list.html', context)
+
+
+@conditional(video_detail_validators)
+async def video_detail_view(request, video_id):
+    try:
+        video = await Video.objects.select_related('category').annotate(
+            total_comments=Count('comments', filter=Q(comments__is_approved=True))
+        ).aget(id=video_id, status='published')
+    except Video.DoesNotExist:
+        raise Http404('No Video matches the given query.')
+
+    comments = Comment.objects.filter(
+        video=video,
+        parent_comment__isnull=True,
+        is_approved=True
+    ).select_related('parent_comment').prefetch_related(
+        'replies__replies'
+    ).order_by('-created_at')
+
+    approved = Comment.objects.filter(video=video, is_approved=True)
+
+    related_videos = Video.objects.filter(
+        category=video.category,
+        status='published'
+    ).exclude(id=video.id).annotate(
+        total_comments=Count('comments', filter=Q(comments__is_approved=True))
+    ).order_by('-view_count')[:6]
+
+    # last 7 days from the daily rollups, never from raw comments/events
+    engagement = VideoEngagementRollup.objects.filter(
+        video=video,
+        granularity='day',
+        bucket_start__gte=timezone.now() - timedelta(days=7)
+    )
+
+    comments_page, ai_comments, user_comments, approved_comments, related_videos, recent_engagement = await get_page(
+        comments, 20, request.GET.get('page'),
+        approved.filter(is_ai_generated=True).count,
+        approved.filter(is_ai_generated=False).count,
+        approved.count,
+        lambda: list(related_videos),
+        lambda: engagement.aggregate(
+            views=Sum('views'),
+            likes=Sum('likes'),
+            dislikes=Sum('dislikes'),
+            comments=Sum('comments')
+        ),
+    )
+
+    context = {
+        'video': video,
+        'comments': comments_page,
+        'comment_stats': {
+            'total_comments': video.total_comments,
+            'ai_comments': ai_comments,
+            'user_comments': user_comments,
+            'approved_comments': approved_comments,
+        },
+        'related_videos': related_videos,
+        'recent_engagement': recent_engagement,
+    }
+
+    return render(request, 'videos/video_detail.html', context)
+
+
+async def video_list_api(request):
+    """
+    GET /api/v1/videos/ as JSON with the count and the page fetched at the same time.
+    Anything else (POST, ?format=api, invalid filters or pages) is answered
+    by the sync VideoViewSet, so the responses stay the same.
+    """
+    if request.method != 'GET' or request.GET.get('format', 'json') != 'json':
+        return await sync_to_async(sync_video_list_api)(request)
+
+    view = VideoViewSet(action='list', action_map={'get': 'list'}, args=(), kwargs={}, format_kwarg=None)
+    view.headers = {}
+    try:
+        # authentication and django-filter validation may query, so run them off the event loop
+        (rows, queryset, values, salt), = await gather(lambda: build_list_queryset(view, request))
+    except APIException:
+        return await sync_to_async(sync_video_list_api)(request)
+
+    # the same validators as ConditionalGetMixin.list()
+    etag, _ = make_validators(values, *salt)
+    response = not_modified(request, etag, None, view.validator_vary)
+    if response is not None:
+        return response
+
+    paginator = view.paginator
+    page_number = request.GET.get(paginator.page_query_param, 1)
+    if not str(page_number).isdigit():
+        return await sync_to_async(sync_video_list_api)(request)
+
+    number, bottom = page_bounds(page_number, paginator.page_size)
+    page, = await get_page(rows, paginator.page_size, number, count_queryset=queryset)
+    if page.number != number:
+        # past the end, DRF answers 404 rather than the last page
+        return await sync_to_async(sync_video_list_api)(request)
+
+    paginator.page = page
+    paginator.request = view.request
+    data = paginator.get_paginated_response(VideoListValuesSerializer(page.object_list).data).data
+
+    response = HttpResponse(ORJSONRenderer().render(data), content_type='application/json')
+    response['Vary'] = 'Accept'
+    response['Allow'] = 'GET, POST, HEAD, OPTIONS'
+    return set_validators(response, etag, None, view.validator_vary)
+
+
+def build_list_queryset(view, request):
+    view.request = view.initialize_request(request)
+    view.initial(view.request)
+    queryset = view.filter_queryset(view.get_queryset())
+    view.request.accepted_renderer = ORJSONRenderer()
+    values = view.list_validators(queryset)
+    # the same values() rows and count as ValuesListMixin.list()
+    return values_rows(queryset, VideoListValuesSerializer), queryset, values, view.validator_salt(view.request)
@@ -0,0 +1,224 @@
+"""
+top-K video rankings kept in sorted sets (apps.core.sortedsets) instead of ORDER BY
+over the video table. The counter write paths update them as they go, other video
+changes reach them through the outbox (apps.videos.projections.sync_leaderboards),
+and rebuild_leaderboards recomputes them from the database:
+
+    views           published videos by views, likes breaking ties (the trending list)
+    likes           published videos by likes
+    category:<id>   published videos of one category, scored like views
+    channels        channels by the total views of their published videos
+
+A board that is missing (fresh Redis, or a new process with the in-memory stand-in)
+is rebuilt on first read. The in-memory stand-in only sees the writes of its own
+process, so it is also rebuilt once it is LEADERBOARDS['LOCAL_MAX_AGE'] seconds old;
+share the boards in Redis to have them exact. Readers fall back to the database when the sorted sets
+are unavailable, and writers only log, so Redis going away never fails a request.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db.models import Sum
+from redis.exceptions import RedisError
+
+from apps.core.locks import cache_lock
+from apps.core.sortedsets import get_client
+
+logger = logging.getLogger(__name__)
+
+# views * 2**21 + likes orders by views then likes with one score; a double holds
+# that exactly while views stay below 2**32
+LIKES_SPAN = 2 ** 21
+
+REBUILD_CHUNK_SIZE = 5000
+
+# VideoViewSet.trending and VideoDetailSerializer.is_trending
+TRENDING_SIZE = 10
+
+# monotonic time of the last rebuild of this process's in-memory boards
+_local_built_at = None
+
+
+def key(board):
+    return f'{settings.LEADERBOARDS["KEY_PREFIX"]}:{board}'
+
+
+def category_board(category_id):
+    return f'category:{category_id}'
+
+
+def video_score(view_count, like_count):
+    return view_count * LIKES_SPAN + like_count
+
+
+def is_ranked(video):
+    return video.status == 'published' and video.deleted_at is None
+
+
+def record(video, views=0, likes=0):
+    # called with the deltas a counter write just applied to the database
+    if not (views or likes) or not is_ranked(video):
+        return
+    client = get_client()
+    try:
+        delta = video_score(views, likes)
+        client.zincrby(key('views'), delta, video.pk)
+        if video.category_id:
+            client.zincrby(key(category_board(video.category_id)), delta, video.pk)
+        if likes:
+            client.zincrby(key('likes'), likes, video.pk)
+        if views:
+            client.zincrby(key('channels'), views, video.channel_name)
+    except (RedisError, OSError):
+        logger.exception('leaderboard update failed for video %s', video.pk)
+
+
+def sync_video(video_id, previous=()):
+    """
+    Puts the video at its score in the database, or takes it off the boards when it
+    is not published (any more) or was deleted. previous are the (category_id,
+    channel_name) pairs it may have been ranked under before the changes being
+    synced. The channel totals are recomputed from the database.
+    """
+    from .models import Video
+
+    row = Video.all_objects.filter(pk=video_id).values(
+        'status', 'deleted_at', 'category_id', 'channel_name', 'view_count', 'like_count'
+    ).first()
+    categories = {category_id for category_id, _ in previous}
+    channels = {channel_name for _, channel_name in previous}
+    if row is not None:
+        categories.add(row['category_id'])
+        channels.add(row['channel_name'])
+
+    client = get_client()
+    try:
+        for board in [key('views'), key('likes')] + [key(category_board(pk)) for pk in categories - {None}]:
+            client.zrem(board, video_id)
+
+        if row is not None and row['status'] == 'published' and row['deleted_at'] is None:
+            score = video_score(row['view_count'], row['like_count'])
+            client.zadd(key('views'), {video_id: score})
+            client.zadd(key('likes'), {video_id: row['like_count']})
+            if row['category_id']:
+                client.zadd(key(category_board(row['category_id'])), {video_id: score})
+
+        for channel in channels:
+            views = Video.objects.published().filter(channel_name=channel).aggregate(views=Sum('view_count'))['views']
+            if views is None:
+                client.zrem(key('channels'), channel)
+            else:
+                client.zadd(key('channels'), {channel: views})
+    except (RedisError, OSError):
+        logger.exception('leaderboard sync failed for video %s', video_id)
+
+
+def top(board, limit):
+    """
+    [(member, score)] of the first limit entries, best first, or None when the
+    sorted sets are unavailable (the caller then asks the database).
+    """
+    try:
+        if not ensure_built():
+            return None
+        return get_client().zrevrange(key(board), 0, limit - 1, withscores=True)
+    except (RedisError, OSError):
+        logger.exception('leaderboard read failed for %s', board)
+        return None
+
+
+def top_videos(board, limit, queryset=None):
+    # the videos of top(), in rank order, or None
+    from .models import Video
+
+    entries = top(board, limit)
+    if entries is None:
+        return None
+    ids = [int(member) for member, _ in entries]
+    videos = (Video.objects.all() if queryset is None else queryset).in_bulk(ids)
+    return [videos[pk] for pk in ids if pk in videos]
+
+
+def rank(board, member):
+    # 0-based position on the board, None when not on it or unavailable
+    try:
+        if not ensure_built():
+            return None
+        return get_client().zrevrank(key(board), member)
+    except (RedisError, OSError):
+        logger.exception('leaderboard read failed for %s', board)
+        return None
+
+
+def is_trending(video_id):
+    # in the top TRENDING_SIZE of the views leaderboard
+    position = rank('views', video_id)
+    return position is not None and position < TRENDING_SIZE
+
+
+def is_built():
+    client = get_client()
+    if not getattr(client, 'shared', True) and (
+        _local_built_at is None or time.monotonic() - _local_built_at > settings.LEADERBOARDS['LOCAL_MAX_AGE']
+    ):
+        return False
+    return bool(client.exists(key('views')))
+
+
+def ensure_built():
+    if is_built():
+        return True
+    # one process rebuilds, the others read from the database meanwhile
+    with cache_lock(key('rebuild'), 300) as acquired:
+        if not acquired:
+            return False
+        rebuild()
+    return True
+
+
+def rebuild():
+    """
+    Recomputes every board from the published videos. Each board is written under
+    a temporary key and renamed over the old one, so readers never see a half-built
+    board; increments applied while the rebuild runs are lost, the next one fixes them.
+    """
+    from .models import Video, VideoCategory
+
+    client = get_client()
+    views, likes, categories, channels = {}, {}, {}, {}
+    rows = Video.objects.published().values_list('pk', 'category_id', 'channel_name', 'view_count', 'like_count')
+    for pk, category_id, channel_name, view_count, like_count in rows.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        score = video_score(view_count, like_count)
+        views[pk] = score
+        likes[pk] = like_count
+        if category_id:
+            categories.setdefault(category_board(category_id), {})[pk] = score
+        channels[channel_name] = channels.get(channel_name, 0) + view_count
+
+    boards = {'views': views, 'likes': likes, 'channels': channels, **categories}
+    for board, scores in boards.items():
+        replace(client, key(board), scores)
+
+    # categories left without published videos
+    for category_id in VideoCategory.objects.values_list('pk', flat=True):
+        if category_board(category_id) not in categories:
+            client.delete(key(category_board(category_id)))
+
+    global _local_built_at
+    _local_built_at = time.monotonic()
+
+    return {board: len(scores) for board, scores in boards.items()}
+
+
+def replace(client, board_key, scores):
+    if not scores:
+        client.delete(board_key)
+        return
+    temporary = f'{board_key}:rebuild'
+    client.delete(temporary)
+    items = list(scores.items())
+    for start in range(0, len(items), REBUILD_CHUNK_SIZE):
+        client.zadd(temporary, dict(items[start:start + REBUILD_CHUNK_SIZE]))
+    client.rename(temporary, board_key)
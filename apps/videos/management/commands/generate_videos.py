@@ -5,6 +5,7 @@ from django.db import transaction
 from django.utils import timezone
 from faker import Faker
 
+from apps.core import outbox
 from apps.videos.models import Video, VideoCategory
 
 #python manage.py generate_videos --count 100
@@ -62,6 +63,9 @@ class Command(BaseCommand):
             if len(batch) >= batch_size or i == count - 1:
                 with transaction.atomic():
                     Video.objects.bulk_create(batch, ignore_conflicts=True)
+                    # ignore_conflicts leaves the ids unset, and a skipped slug only costs a redundant event
+                    video_ids = Video.all_objects.filter(slug__in=[video.slug for video in batch]).values_list('pk', flat=True)
+                    outbox.record_many('video', 'created', [(video_id, {}) for video_id in video_ids])
                 
                 videos_created += len(batch)
                 self.stdout.write(f'Created batch of {len(batch)} videos...')
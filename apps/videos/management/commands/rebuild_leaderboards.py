@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from redis.exceptions import RedisError
+
+from apps.videos import leaderboards
+
+# python manage.py rebuild_leaderboards
+# after bulk loads (generate_videos, ingest) or a Redis flush; missing boards are also rebuilt on first read
+
+
+class Command(BaseCommand):
+    help = 'Recompute the video and channel leaderboards from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=5,
+            help='Entries of each main board to print after the rebuild',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self.stdout.write('Rebuilding leaderboards...')
+        try:
+            sizes = leaderboards.rebuild()
+        except (RedisError, OSError) as exc:
+            raise CommandError(f'Leaderboard store unavailable: {exc}')
+
+        for board, size in sorted(sizes.items()):
+            self.stdout.write(f'  {board}: {size} entries')
+
+        if options['top'] > 0:
+            for board in ('views', 'likes', 'channels'):
+                self.stdout.write(f'Top {options["top"]} by {board}:')
+                for position, (member, score) in enumerate(leaderboards.top(board, options['top']) or [], 1):
+                    if board == 'views':
+                        score //= leaderboards.LIKES_SPAN
+                    self.stdout.write(f'  {position}. {member} ({int(score)})')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(sizes)} leaderboards in {time.perf_counter() - started:.2f}s'
+        ))
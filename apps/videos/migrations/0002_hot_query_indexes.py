@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:36
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='video',
+            name='videos_vide_status_ffba77_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='video',
+            name='videos_vide_categor_d2ff0e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='video',
+            name='videos_vide_view_co_02bc14_idx',
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True), ('status', 'published')), fields=['-published_at'], name='video_live_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True), ('status', 'published')), fields=['-view_count', '-like_count'], name='video_live_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True), ('status', 'published')), fields=['category', '-view_count'], name='video_live_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(models.F('channel_name'), django.db.models.functions.text.Upper('title'), condition=models.Q(('deleted_at__isnull', True)), name='video_channel_title_upper_idx'),
+        ),
+    ]
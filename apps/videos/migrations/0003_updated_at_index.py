@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['updated_at'], name='video_updated_at_idx'),
+        ),
+    ]
@@ -1,10 +1,30 @@
 import random
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from django.utils.text import slugify
 from django.conf import settings
+from django.db.models.functions import Upper
 
-from apps.core.models import TimeStampedModel, SoftDeleteModel
+from apps.core.models import TimeStampedModel, SoftDeleteModel, SoftDeleteManager
+
+
+# shared by the model properties and the values() list serializers
+
+def format_duration(duration):
+    minutes = duration // 60
+    seconds = duration % 60
+    if minutes >= 60:
+        hours = minutes // 60
+        minutes = minutes % 60
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def engagement_rate(like_count, view_count):
+    if view_count == 0:
+        return 0
+    return (like_count / view_count) * 100
 
 
 class VideoCategory(TimeStampedModel):
@@ -26,7 +46,7 @@ class VideoCategory(TimeStampedModel):
         super().save(*args, **kwargs)
 
 
-class VideoManager(models.Manager):
+class VideoManager(SoftDeleteManager):
     def published(self):
         return self.filter(status='published')
 
@@ -46,6 +66,24 @@ class VideoManager(models.Manager):
             engagement_score=models.F('like_count') + models.F('comment_count')
         ).order_by('-engagement_score')
 
+    def refresh_comment_counts(self, video_ids, batch_size=500):
+        # set-based version of Video.update_comment_count for many videos at once
+        from django.db.models.functions import Coalesce
+        from apps.comments.models import Comment
+
+        approved_comments = Comment.objects.filter(
+            video=models.OuterRef('pk'),
+            is_approved=True
+        ).order_by().values('video').annotate(total=models.Count('pk')).values('total')
+
+        video_ids = list(video_ids)
+        updated = 0
+        for start in range(0, len(video_ids), batch_size):
+            updated += self.model.all_objects.filter(
+                pk__in=video_ids[start:start + batch_size]
+            ).update(comment_count=Coalesce(models.Subquery(approved_comments), 0), updated_at=timezone.now())
+        return updated
+
 
 class Video(SoftDeleteModel):
     STATUS_CHOICES = [
@@ -95,20 +133,69 @@ class Video(SoftDeleteModel):
     
     objects = VideoManager()
 
+    # a save touching these moves the video on the leaderboards (apps.videos.projections)
+    RANKED_FIELDS = {'status', 'deleted_at', 'category', 'channel_name', 'view_count', 'like_count'}
+
     class Meta:
         ordering = ['-published_at', '-created_at']
         indexes = [
-            models.Index(fields=['status', 'published_at']),
-            models.Index(fields=['category', 'status']),
             models.Index(fields=['channel_name', 'status']),
-            models.Index(fields=['-view_count']),
             models.Index(fields=['-like_count']),
+            # MAX(updated_at) ETag validators (apps.core.conditional)
+            models.Index(fields=['updated_at'], name='video_updated_at_idx'),
+            # partial indexes for the public listings, which only ever see live published videos
+            models.Index(
+                fields=['-published_at'],
+                name='video_live_published_idx',
+                condition=models.Q(status='published', deleted_at__isnull=True),
+            ),
+            models.Index(
+                fields=['-view_count', '-like_count'],
+                name='video_live_popular_idx',
+                condition=models.Q(status='published', deleted_at__isnull=True),
+            ),
+            models.Index(
+                fields=['category', '-view_count'],
+                name='video_live_category_idx',
+                condition=models.Q(status='published', deleted_at__isnull=True),
+            ),
+            # duplicate title check in VideoCreateSerializer (title__iexact + channel_name)
+            models.Index(
+                models.F('channel_name'),
+                Upper('title'),
+                name='video_channel_title_upper_idx',
+                condition=models.Q(deleted_at__isnull=True),
+            ),
         ]
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
+        from apps.core import outbox
+        adding = self._state.adding
+        self.populate_defaults()
+
+        update_fields = kwargs.get('update_fields')
+        payload = {}
+        if update_fields is not None:
+            payload['fields'] = sorted(update_fields)
+        # the leaderboards drop the video from the category and channel it leaves
+        if not adding and (update_fields is None or {'category', 'channel_name'} & set(update_fields)):
+            payload['previous'] = Video.all_objects.filter(pk=self.pk).values_list('category_id', 'channel_name').first()
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            outbox.record('video', 'created' if adding else 'updated', self.pk, **payload)
+
+    def hard_delete(self, using=None, keep_parents=False):
+        from apps.core import outbox
+        with transaction.atomic():
+            outbox.record('video', 'deleted', self.pk, previous=(self.category_id, self.channel_name))
+            super().hard_delete(using=using, keep_parents=keep_parents)
+
+    def populate_defaults(self):
+        # also used by bulk_create paths, which never call save()
         if not self.slug:
             self.slug = slugify(self.title)
         
@@ -122,27 +209,17 @@ class Video(SoftDeleteModel):
             self.video_url = f"https://mock-video-storage.com/videos/{self.slug}.mp4"
         if not self.thumbnail_url:
             self.thumbnail_url = f"https://mock-video-storage.com/thumbnails/{self.slug}.jpg"
-        
-        super().save(*args, **kwargs)
 
     # def get_absolute_url(self):
     #     return reverse('videos:detail', kwargs={'slug': self.slug})
 
     @property
     def duration_formatted(self):
-        minutes = self.duration // 60
-        seconds = self.duration % 60
-        if minutes >= 60:
-            hours = minutes // 60
-            minutes = minutes % 60
-            return f"{hours}:{minutes:02d}:{seconds:02d}"
-        return f"{minutes}:{seconds:02d}"
+        return format_duration(self.duration)
 
     @property
     def engagement_rate(self):
-        if self.view_count == 0:
-            return 0
-        return (self.like_count / self.view_count) * 100
+        return engagement_rate(self.like_count, self.view_count)
 
     @property
     def like_ratio(self):
@@ -152,20 +229,30 @@ class Video(SoftDeleteModel):
         return (self.like_count / total_reactions) * 100
 
     def increment_view_count(self):
-        Video.objects.filter(pk=self.pk).update(view_count=models.F('view_count') + 1)
+        from apps.analytics.events import record_event
+        from . import leaderboards
+        Video.objects.filter(pk=self.pk).update(view_count=models.F('view_count') + 1, updated_at=timezone.now())
         self.refresh_from_db(fields=['view_count'])
+        leaderboards.record(self, views=1)
+        record_event(self, 'view')
 
     def add_like(self):
-        Video.objects.filter(pk=self.pk).update(like_count=models.F('like_count') + 1)
+        from apps.analytics.events import record_event
+        from . import leaderboards
+        Video.objects.filter(pk=self.pk).update(like_count=models.F('like_count') + 1, updated_at=timezone.now())
         self.refresh_from_db(fields=['like_count'])
+        leaderboards.record(self, likes=1)
+        record_event(self, 'like')
 
     def add_dislike(self):
-        Video.objects.filter(pk=self.pk).update(dislike_count=models.F('dislike_count') + 1)
+        from apps.analytics.events import record_event
+        Video.objects.filter(pk=self.pk).update(dislike_count=models.F('dislike_count') + 1, updated_at=timezone.now())
         self.refresh_from_db(fields=['dislike_count'])
+        record_event(self, 'dislike')
 
     def update_comment_count(self):
         count = self.comments.filter(is_approved=True).count()
-        Video.objects.filter(pk=self.pk).update(comment_count=count)
+        Video.objects.filter(pk=self.pk).update(comment_count=count, updated_at=timezone.now())
         self.refresh_from_db(fields=['comment_count'])
 
     @classmethod
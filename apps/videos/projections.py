@@ -0,0 +1,56 @@
+"""
+outbox handlers (OUTBOX['HANDLERS']) that keep denormalized video state in step with
+video and comment changes. Each gets a batch of OutboxEvents in id order and
+recomputes what the batch touched from the database, so a batch delivered twice
+does no harm
+"""
+
+import logging
+
+from redis.exceptions import RedisError
+
+from apps.comments.models import COUNTED_FIELDS
+from . import leaderboards
+from .models import Video
+
+logger = logging.getLogger(__name__)
+
+
+def changes(event, watched):
+    # created and deleted always count; an update when it saved one of the watched fields
+    fields = event.payload.get('fields')
+    return event.action != 'updated' or fields is None or bool(watched.intersection(fields))
+
+
+def refresh_comment_counts(events):
+    # one set-based recount for every video whose approved comments may have changed,
+    # including the one a comment moved away from
+    video_ids = set()
+    for event in events:
+        if event.topic == 'comment' and changes(event, COUNTED_FIELDS):
+            video_ids.add(event.payload['video_id'])
+            if event.payload.get('previous_video_id'):
+                video_ids.add(event.payload['previous_video_id'])
+    if video_ids:
+        Video.objects.refresh_comment_counts(video_ids)
+
+
+def sync_leaderboards(events):
+    previous = {}
+    for event in events:
+        if event.topic == 'video' and changes(event, Video.RANKED_FIELDS):
+            pairs = previous.setdefault(event.object_id, set())
+            if event.payload.get('previous'):
+                pairs.add(tuple(event.payload['previous']))
+    if not previous:
+        return
+
+    try:
+        # boards that were never built are built from the database on first read
+        if not leaderboards.is_built():
+            return
+    except (RedisError, OSError):
+        logger.exception('leaderboard store unavailable, %s videos left for the next rebuild', len(previous))
+        return
+    for video_id, pairs in previous.items():
+        leaderboards.sync_video(video_id, pairs)
@@ -2,10 +2,14 @@ from rest_framework import serializers
 from django.utils import timezone
 from django.core.validators import URLValidator
 
-from .models import Video, VideoCategory
+from apps.core.fastserializers import ValuesSerializer
+from apps.core.serializers import TimedModelSerializer
 
+from . import leaderboards
+from .models import Video, VideoCategory, engagement_rate, format_duration
 
-class VideoCategorySerializer(serializers.ModelSerializer):
+
+class VideoCategorySerializer(TimedModelSerializer):
     video_count = serializers.IntegerField(read_only=True)
 
     class Meta:
@@ -19,7 +23,7 @@ class VideoCategorySerializer(serializers.ModelSerializer):
         return value
 
 
-class VideoListSerializer(serializers.ModelSerializer):
+class VideoListSerializer(TimedModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     duration_formatted = serializers.CharField(read_only=True)
     engagement_rate = serializers.FloatField(read_only=True)
@@ -35,7 +39,16 @@ class VideoListSerializer(serializers.ModelSerializer):
         ]
 
 
-class VideoDetailSerializer(serializers.ModelSerializer):
+class VideoListValuesSerializer(ValuesSerializer):
+    # same output as VideoListSerializer, built from values() rows
+    serializer_class = VideoListSerializer
+    derived = {
+        'duration_formatted': (['duration'], format_duration),
+        'engagement_rate': (['like_count', 'view_count'], engagement_rate),
+    }
+
+
+class VideoDetailSerializer(TimedModelSerializer):
     category = VideoCategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=VideoCategory.objects.filter(is_active=True),
@@ -73,10 +86,8 @@ class VideoDetailSerializer(serializers.ModelSerializer):
         return len(obj.tags) if obj.tags else 0
 
     def get_is_trending(self, obj):
-        return obj.trending_records.filter(
-            trending_date=timezone.now().date(),
-            is_active=True
-        ).exists()
+        # on the trending list; VideoViewSet puts the same flag in the detail ETag
+        return leaderboards.is_trending(obj.id)
 
     def validate_duration(self, value):
         if value < 1:
@@ -128,7 +139,7 @@ class VideoDetailSerializer(serializers.ModelSerializer):
         return data
 
 
-class VideoCreateSerializer(serializers.ModelSerializer):
+class VideoCreateSerializer(TimedModelSerializer):
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=VideoCategory.objects.filter(is_active=True),
         source='category',
@@ -168,7 +179,7 @@ class VideoCreateSerializer(serializers.ModelSerializer):
         return video
 
 
-class VideoUpdateSerializer(serializers.ModelSerializer):
+class VideoUpdateSerializer(TimedModelSerializer):
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=VideoCategory.objects.filter(is_active=True),
         source='category',
@@ -198,7 +209,7 @@ class VideoUpdateSerializer(serializers.ModelSerializer):
         return instance
 
 
-class VideoStatsSerializer(serializers.ModelSerializer):
+class VideoStatsSerializer(TimedModelSerializer):
     engagement_rate = serializers.FloatField(read_only=True)
     like_ratio = serializers.FloatField(read_only=True)
     
@@ -4,47 +4,113 @@ Celery tasks for video statistics and management
 
 import random
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
 from django.db.models import F
 from django.utils import timezone
 
+from . import leaderboards
 from .models import Video, VideoCategory
+from apps.analytics.events import EventBuffer
 from apps.comments.models import Comment
+from apps.core.locks import skipped_run, task_lease
+from apps.core.models import Watermark
+
+
+STATS_WATERMARK = 'videos.update_video_statistics'
 
 
 @shared_task(bind=True)
-def update_video_statistics(self):
-    try:
-        videos = Video.objects.filter(status='published')
-        updated_videos = []
+def update_video_statistics(self, full=False):
+    """
+    Simulated views and likes, and comment_count recounted, for the videos that got
+    comments since the last run (the comment id watermark), so a run costs as much
+    as the activity since the previous one. full=True does every published video,
+    the daily reconciliation that also catches edits the watermark cannot see
+    (approvals, deletions, comments committed out of id order).
+    """
+    with task_lease('videos.update_video_statistics') as lease:
+        if not lease.acquired:
+            return skipped_run('update_video_statistics')
         
-        for video in videos:
-            new_views = random.randint(0, 20)
-            video.view_count = F('view_count') + new_views
+        try:
+            watermark, _ = Watermark.objects.get_or_create(name=STATS_WATERMARK)
+            # comments written during the run are left for the next one
+            upper = Comment.objects.order_by('-id').values_list('id', flat=True).first() or 0
             
-            new_likes = random.randint(0, 3)
-            video.like_count = F('like_count') + new_likes
+            if full:
+                video_ids, field = Video.objects.published().values_list('pk', flat=True), 'pk'
+            else:
+                video_ids, field = Comment.objects.filter(
+                    id__gt=watermark.value, id__lte=upper
+                ).values_list('video_id', flat=True), 'video_id'
             
-            actual_comment_count = video.comments.count()
-            video.comment_count = actual_comment_count
+            videos_updated = 0
+            batch_size = settings.YOUTUBE_SIMULATION['VIDEO_STATS_BATCH_SIZE']
+            for batch in id_batches(video_ids, field, batch_size):
+                if not lease.heartbeat():
+                    break
+                videos_updated += update_statistics_batch(batch)
+            else:
+                # only a run that got through everything moves the watermark
+                Watermark.objects.filter(name=STATS_WATERMARK).update(
+                    value=max(upper, watermark.value), updated_at=timezone.now()
+                )
             
-            video.save(update_fields=['view_count', 'like_count', 'comment_count'])
+            return {
+                'task': 'update_video_statistics',
+                'status': 'completed' if lease.held else 'lease_lost',
+                'mode': 'full' if full else 'incremental',
+                'videos_updated': videos_updated,
+                'watermark': Watermark.objects.get(name=STATS_WATERMARK).value,
+                'timestamp': timezone.now().isoformat()
+            }
             
-            updated_videos.append({
-                'video_id': video.id,
-                'title': video.title,
-                'new_views': new_views,
-                'new_likes': new_likes,
-            })
-        
-        return {
-            'task': 'update_video_statistics',
-            'status': 'completed',
-            'videos_updated': len(updated_videos),
-            'timestamp': timezone.now().isoformat()
-        }
-        
-    except Exception as exc:
-        self.retry(exc=exc, countdown=60, max_retries=3)
+        except Exception as exc:
+            self.retry(exc=exc, countdown=60, max_retries=3)
+
+
+def id_batches(queryset, field, batch_size):
+    # keyset pagination over the distinct values of an id column
+    last = 0
+    while True:
+        ids = list(
+            queryset.filter(**{f'{field}__gt': last}).order_by(field).values_list(field, flat=True).distinct()[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def update_statistics_batch(video_ids):
+    # one UPDATE per distinct (views, likes) increment and one comment recount for the batch
+    videos = list(
+        Video.objects.published().filter(pk__in=video_ids).only('id', 'status', 'deleted_at', 'category_id', 'channel_name')
+    )
+    increments = {}
+    for video in videos:
+        video.new_views = random.randint(0, 20)
+        video.new_likes = random.randint(0, 3)
+        increments.setdefault((video.new_views, video.new_likes), []).append(video.pk)
+    
+    now = timezone.now()
+    with transaction.atomic():
+        for (new_views, new_likes), ids in increments.items():
+            Video.all_objects.filter(pk__in=ids).update(
+                view_count=F('view_count') + new_views,
+                like_count=F('like_count') + new_likes,
+                updated_at=now
+            )
+        Video.objects.refresh_comment_counts([video.pk for video in videos])
+    
+    with EventBuffer() as events:
+        for video in videos:
+            leaderboards.record(video, views=video.new_views, likes=video.new_likes)
+            events.add(video, 'view', quantity=video.new_views)
+            events.add(video, 'like', quantity=video.new_likes)
+    
+    return len(videos)
 
 
 @shared_task
@@ -85,4 +151,20 @@ def generate_new_video_content(category_name=None, count=1):
         }
         
     except Exception as exc:
-        raise exc
\ No newline at end of file
+        raise exc
+
+@shared_task
+def rebuild_leaderboards():
+    # daily resync of the sorted sets with the database, see apps.videos.leaderboards
+    with task_lease('videos.rebuild_leaderboards') as lease:
+        if not lease.acquired:
+            return skipped_run('rebuild_leaderboards')
+        sizes = leaderboards.rebuild()
+    
+    return {
+        'task': 'rebuild_leaderboards',
+        'status': 'completed',
+        'boards': len(sizes),
+        'ranked_videos': sizes.get('views', 0),
+        'timestamp': timezone.now().isoformat()
+    }
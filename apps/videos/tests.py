@@ -1 +1,463 @@
-from django.test import TestCase
\ No newline at end of file
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from apps.core import outbox
+from apps.core.renderers import ORJSONRenderer
+from apps.core.sortedsets import get_client
+from apps.core.testing import ExplainMixin
+from apps.videos import leaderboards
+from apps.videos.models import Video, VideoCategory
+from apps.videos.serializers import VideoListSerializer, VideoListValuesSerializer
+
+
+class HotQueryIndexTests(ExplainMixin, TestCase):
+    """
+    EXPLAIN the hot video queries with and without the indexes added in
+    videos.0002 and check the planner switches over to them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [
+            VideoCategory.objects.create(name=f'Index category {number}') for number in range(5)
+        ]
+        for number in range(200):
+            video = Video.objects.create(
+                title=f'Index test {number}',
+                channel_name=f'Channel {number % 20}',
+                category=cls.categories[number % 5],
+                duration=60,
+                view_count=number * 10,
+                status='published' if number % 4 else 'draft',
+            )
+            if number % 25 == 0:
+                video.delete()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_default_manager_hides_soft_deleted_videos(self):
+        self.assertFalse(Video.objects.filter(deleted_at__isnull=False).exists())
+        self.assertTrue(Video.all_objects.filter(deleted_at__isnull=False).exists())
+
+    def test_published_listing_uses_partial_index(self):
+        queryset = Video.objects.filter(status='published').order_by('-published_at')[:12]
+        self.assertUsesIndex(queryset, 'video_live_published_idx')
+
+    def test_trending_uses_partial_index(self):
+        queryset = Video.objects.filter(status='published').order_by('-view_count', '-like_count')[:10]
+        self.assertUsesIndex(queryset, 'video_live_popular_idx')
+
+    def test_related_videos_use_partial_index(self):
+        queryset = Video.objects.filter(
+            category=self.categories[0],
+            status='published'
+        ).order_by('-view_count')[:6]
+        self.assertUsesIndex(queryset, 'video_live_category_idx')
+
+    def test_duplicate_title_check_uses_functional_index(self):
+        queryset = Video.objects.filter(title__iexact='index test 7', channel_name='Channel 7')
+        self.assertUsesIndex(queryset, 'video_channel_title_upper_idx')
+
+
+class VideoListValuesSerializerTests(TestCase):
+    """
+    the values() list serializer and orjson must give the bytes of
+    VideoListSerializer and JSONRenderer
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = VideoCategory.objects.create(name='Values category')
+        for number in range(12):
+            Video.objects.create(
+                title=f'Values test {number} \u00e9\u2028',
+                channel_name='Values',
+                category=category if number % 3 else None,
+                duration=number * 1234 + 1,
+                view_count=number * 7,
+                like_count=number,
+                status='published' if number % 2 else 'draft',
+                published_at=timezone.now() if number % 2 else None,
+            )
+
+    def test_same_output_as_model_serializer(self):
+        queryset = Video.objects.select_related('category').order_by('id')
+        expected = JSONRenderer().render(VideoListSerializer(queryset, many=True).data)
+        rows = queryset.values(*VideoListValuesSerializer.columns())
+        self.assertEqual(ORJSONRenderer().render(VideoListValuesSerializer(rows).data), expected)
+
+    def test_list_endpoint_uses_values_rows(self):
+        # ETag validators over the filtered list, count, page
+        with self.assertNumQueries(3) as queries:
+            response = self.client.get('/api/v1/videos/', HTTP_HOST='localhost')
+        self.assertIn("status\" = 'published'", queries.captured_queries[0]['sql'])
+        self.assertNotIn('JOIN', queries.captured_queries[1]['sql'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 6)
+        # like VideoListSerializer, no category_name for the two published videos without a category
+        results = response.json()['results']
+        self.assertEqual(sum('category_name' not in video for video in results), 2)
+
+
+def response_vary(response):
+    return [header.strip() for header in response['Vary'].split(',')]
+
+
+class ConditionalGetTests(TestCase):
+    """
+    a repeated GET with the ETag gets a 304 until something the response shows changes
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.videos = [
+            Video.objects.create(
+                title=f'Conditional test {number}',
+                channel_name='Conditional',
+                duration=60,
+                view_count=number * 100,
+                status='published',
+            )
+            for number in range(12)
+        ]
+
+    def setUp(self):
+        get_client().flushdb()
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, HTTP_HOST='localhost', **headers)
+
+    def assertRevalidates(self, url):
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        return etag
+
+    def test_list_write_changes_etag(self):
+        etag = self.assertRevalidates('/api/v1/videos/')
+        self.videos[0].add_like()
+        response = self.get('/api/v1/videos/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_soft_delete_changes_etag(self):
+        url = '/api/v1/videos/?ordering=-view_count'
+        etag = self.assertRevalidates(url)
+        self.videos[0].delete()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_list_hard_delete_changes_etag(self):
+        etag = self.assertRevalidates('/api/v1/videos/')
+        self.videos[0].hard_delete()
+        self.assertEqual(self.get('/api/v1/videos/', etag).status_code, 200)
+
+    def test_list_queryset_delete_changes_etag(self):
+        url = '/api/v1/videos/?ordering=-view_count'
+        etag = self.assertRevalidates(url)
+        Video.all_objects.filter(pk=self.videos[1].pk).delete()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_list_category_delete_changes_etag(self):
+        category = VideoCategory.objects.create(name='Conditional category')
+        Video.objects.filter(pk=self.videos[2].pk).update(category=category)
+        etag = self.assertRevalidates('/api/v1/videos/')
+        category.delete()
+        self.assertEqual(self.get('/api/v1/videos/', etag).status_code, 200)
+
+    def test_list_etag_is_per_filter(self):
+        etag = self.assertRevalidates('/api/v1/videos/?search=Conditional test 1')
+        self.assertNotEqual(self.assertRevalidates('/api/v1/videos/?search=Conditional test 2'), etag)
+        # a write outside the filtered list leaves its ETag alone
+        self.videos[2].add_like()
+        self.assertEqual(self.get('/api/v1/videos/?search=Conditional test 1', etag).status_code, 304)
+
+    def test_list_has_no_last_modified(self):
+        response = self.get('/api/v1/videos/')
+        self.assertNotIn('Last-Modified', response)
+        self.assertNotIn('Last-Modified', self.get('/videos/'))
+
+    def test_staff_get_their_own_etag(self):
+        etag = self.assertRevalidates('/api/v1/videos/')
+        self.assertIn('Cookie', response_vary(self.get('/api/v1/videos/', etag)))
+        staff = User.objects.create_user('conditional-staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+        response = self.get('/api/v1/videos/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(set(response_vary(response)) & {'Cookie', 'Authorization'}, {'Cookie', 'Authorization'})
+
+    def test_detail_etag_follows_trending(self):
+        leaderboards.rebuild()
+        video = self.videos[0]
+        url = f'/api/v1/videos/{video.id}/'
+        etag = self.assertRevalidates(url)
+        self.assertFalse(self.get(url).json()['is_trending'])
+
+        # the board moves, the row does not
+        get_client().zadd(leaderboards.key('views'), {video.id: leaderboards.video_score(10 ** 6, 0)})
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_trending'])
+        self.assertRevalidates(url)
+
+
+class LeaderboardTests(TestCase):
+    """
+    the sorted set leaderboards (in-memory stand-in here) against the ORDER BY
+    queries they replace, after a rebuild and after incremental updates
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [VideoCategory.objects.create(name=f'Leaderboard category {number}') for number in range(3)]
+        cls.videos = []
+        for number in range(30):
+            video = Video.objects.create(
+                title=f'Leaderboard test {number}',
+                channel_name=f'Leaderboard channel {number % 4}',
+                category=cls.categories[number % 3],
+                duration=60,
+                # equal views for pairs of videos, so likes break the tie
+                view_count=(number // 2) * 100,
+                like_count=number % 7,
+                status='draft' if number % 10 == 9 else 'published',
+            )
+            if number == 28:
+                video.delete()
+            cls.videos.append(video)
+
+    def setUp(self):
+        get_client().flushdb()
+
+    def assertMatchesDatabase(self):
+        published = Video.objects.published()
+        views = list(published.order_by('-view_count', '-like_count').values_list('id', flat=True)[:10])
+        self.assertEqual([video.id for video in leaderboards.top_videos('views', 10)], views)
+        likes = [video.like_count for video in leaderboards.top_videos('likes', 10)]
+        self.assertEqual(likes, list(published.order_by('-like_count').values_list('like_count', flat=True)[:10]))
+        category = self.categories[1]
+        self.assertEqual(
+            [video.id for video in leaderboards.top_videos(leaderboards.category_board(category.id), 5)],
+            list(published.filter(category=category).order_by('-view_count', '-like_count').values_list('id', flat=True)[:5]),
+        )
+        channels = published.values('channel_name').annotate(views=Sum('view_count')).order_by('-views')
+        self.assertEqual(
+            [(channel, int(views)) for channel, views in leaderboards.top('channels', 4)],
+            [(channel['channel_name'], channel['views']) for channel in channels],
+        )
+
+    def test_rebuilt_on_first_read(self):
+        self.assertMatchesDatabase()
+
+    def test_incremental_updates(self):
+        self.assertMatchesDatabase()
+        last = self.videos[0]
+        for _ in range(3000):
+            last.increment_view_count()
+        last.add_like()
+        self.assertEqual(leaderboards.rank('views', last.id), 0)
+        self.videos[27].delete()
+        self.videos[19].status = 'published'
+        self.videos[19].save()
+        # saves reach the boards through the outbox
+        outbox.drain()
+        self.assertMatchesDatabase()
+
+    def test_trending_endpoint_reads_leaderboard(self):
+        leaderboards.rebuild()
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/videos/trending/', HTTP_HOST='localhost')
+        results = response.json()['results']
+        self.assertEqual([video['id'] for video in results], [video.id for video in leaderboards.top_videos('views', 10)])
+        self.assertTrue(all(video['is_trending'] for video in results))
+
+    def test_local_boards_are_rebuilt_when_stale(self):
+        leaderboards.rebuild()
+        # a write made by another process, which this process's boards never saw
+        Video.objects.filter(pk=self.videos[2].pk).update(view_count=10 ** 6)
+        self.assertNotEqual(leaderboards.rank('views', self.videos[2].id), 0)
+
+        later = time.monotonic() + settings.LEADERBOARDS['LOCAL_MAX_AGE'] + 1
+        with mock.patch('apps.videos.leaderboards.time.monotonic', return_value=later):
+            self.assertEqual(leaderboards.rank('views', self.videos[2].id), 0)
+        self.assertMatchesDatabase()
+
+    def test_rebuild_command_recovers_from_direct_updates(self):
+        leaderboards.rebuild()
+        # bulk writes bypass the incremental updates
+        Video.objects.filter(pk=self.videos[2].pk).update(view_count=10 ** 6)
+        call_command('rebuild_leaderboards', top=0, stdout=StringIO())
+        self.assertEqual(leaderboards.rank('views', self.videos[2].id), 0)
+        self.assertMatchesDatabase()
+
+
+class AdminAtScaleTests(TestCase):
+    """
+    admin changelists and actions run a fixed number of queries, whatever the
+    number of rows on the page or selected
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.categories = [VideoCategory.objects.create(name=f'Admin category {number}') for number in range(6)]
+        cls.videos = [
+            Video.objects.create(
+                title=f'Admin test {number}',
+                channel_name='Admin',
+                category=cls.categories[number % 6],
+                duration=60,
+                status='draft' if number < 6 else 'published',
+            )
+            for number in range(24)
+        ]
+        cls.videos[7].delete()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_category_changelist_annotates_video_counts(self):
+        with self.assertNumQueries(5) as queries:
+            response = self.client.get('/admin/videos/videocategory/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('"videos_video"', ' '.join(query['sql'] for query in queries.captured_queries[:-1]))
+        # 4 videos per category, minus a draft each and the deleted one
+        self.assertContains(response, '3 videos</a>', count=5)
+        self.assertContains(response, '2 videos</a>', count=1)
+
+    def test_video_changelist_includes_soft_deleted_videos(self):
+        deleted = self.videos[7]
+        response = self.client.get('/admin/videos/video/?deleted_at__isnull=False', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].result_list), [Video.all_objects.get(pk=deleted.pk)])
+        response = self.client.get(f'/admin/videos/video/{deleted.pk}/change/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_comment_counts_is_set_based(self):
+        from apps.comments.models import Comment
+
+        Comment.objects.bulk_create([
+            Comment(video=self.videos[2], content='Counted', author_name='Admin', is_approved=True) for _ in range(3)
+        ])
+        # session, user, changelist count and filters, the ids, one UPDATE
+        with self.assertNumQueries(7):
+            response = self.client.post('/admin/videos/video/', {
+                'action': 'update_comment_counts',
+                'select_across': '1',
+                'index': '0',
+                '_selected_action': [video.pk for video in self.videos],
+            }, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 302)
+        self.videos[2].refresh_from_db()
+        self.assertEqual(self.videos[2].comment_count, 3)
+
+
+class IncrementalStatisticsTests(TestCase):
+    """
+    update_video_statistics touches only the videos commented on since its
+    watermark, full=True reconciles every published video
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.videos = [
+            Video.objects.create(title=f'Statistics test {number}', channel_name='Statistics', duration=60, status='published')
+            for number in range(6)
+        ]
+
+    def comment_on(self, *videos):
+        from apps.comments.models import Comment
+
+        Comment.objects.bulk_create([
+            Comment(video=video, content='New', author_name='Statistics', is_approved=True) for video in videos
+        ])
+
+    def updated_ids(self, since):
+        return set(Video.objects.filter(updated_at__gt=since).values_list('id', flat=True))
+
+    def test_only_commented_videos_are_updated(self):
+        from apps.core.models import Watermark
+        from apps.videos.tasks import STATS_WATERMARK, update_video_statistics
+
+        self.comment_on(self.videos[1], self.videos[1], self.videos[4])
+        started = timezone.now()
+        result = update_video_statistics.apply().get()
+        self.assertEqual((result['mode'], result['videos_updated']), ('incremental', 2))
+        self.assertEqual(self.updated_ids(started), {self.videos[1].id, self.videos[4].id})
+        self.videos[1].refresh_from_db()
+        self.assertEqual(self.videos[1].comment_count, 2)
+        self.assertEqual(result['watermark'], Watermark.objects.get(name=STATS_WATERMARK).value)
+
+        # nothing new since the watermark
+        self.assertEqual(update_video_statistics.apply().get()['videos_updated'], 0)
+        self.comment_on(self.videos[2])
+        self.assertEqual(update_video_statistics.apply().get()['videos_updated'], 1)
+
+    def test_full_run_reconciles_every_published_video(self):
+        from apps.videos.tasks import update_video_statistics
+
+        self.videos[5].delete()
+        started = timezone.now()
+        result = update_video_statistics.apply(kwargs={'full': True}).get()
+        self.assertEqual((result['mode'], result['videos_updated']), ('full', 5))
+        self.assertEqual(self.updated_ids(started), {video.id for video in self.videos[:5]})
+
+
+@override_settings(ROOT_URLCONF='config.asgi_urls', REQUEST_TIMING={'SAMPLE_RATE': 1})
+class AsyncViewTests(TransactionTestCase):
+    """
+    the async views answer like the sync ones through an all-async middleware chain,
+    whose query wrappers see the queries run on the aio threads
+    """
+
+    def setUp(self):
+        category = VideoCategory.objects.create(name='Async category')
+        for number in range(25):
+            Video.objects.create(
+                title=f'Async test {number}',
+                channel_name='Async',
+                category=category,
+                duration=60,
+                view_count=number,
+                status='published',
+                published_at=timezone.now(),
+            )
+
+    def timed_queries(self, response):
+        db = next(entry for entry in response['Server-Timing'].split(', ') if entry.startswith('db;'))
+        return int(db.split('desc="')[1].split()[0])
+
+    async def test_list_api_matches_sync_view(self):
+        response = await self.async_client.get('/api/v1/videos/?page=2')
+        self.assertEqual(response.status_code, 200)
+        with self.settings(ROOT_URLCONF='config.urls'):
+            expected = await self.async_client.get('/api/v1/videos/?page=2')
+        self.assertEqual(response.json()['results'], expected.json()['results'])
+        self.assertEqual(response.json()['count'], 25)
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertEqual(response['ETag'], expected['ETag'])
+        # validators, then the count and the page at the same time on the aio threads
+        self.assertEqual(self.timed_queries(response), 3)
+
+    async def test_list_page_counts_pool_queries(self):
+        response = await self.async_client.get('/videos/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_videos'], 25)
+        self.assertEqual(len(response.context['videos'].object_list), 12)
+        # validators, then the count, the page and the categories on the aio threads
+        self.assertEqual(self.timed_queries(response), 5)
+
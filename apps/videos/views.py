@@ -2,33 +2,85 @@
 template views for the simple video UI
 """
 
+from datetime import timedelta
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Count, Q
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum
 from django.core.paginator import Paginator
+from django.utils import timezone
+
+from apps.core.pagination import EstimatedCountPaginator
 
 from .models import Video, VideoCategory
+from apps.analytics.models import VideoEngagementRollup
 from apps.comments.models import Comment
+from apps.core.conditional import conditional
 
 
-def video_list_view(request):
-    category_id = request.GET.get('category')
-    search = request.GET.get('search', '')
-    
-    videos = Video.objects.filter(status='published').select_related('category').annotate(
-        total_comments=Count('comments', filter=Q(comments__is_approved=True))
-    ).order_by('-published_at')
-    
+def published_videos(category_id, search):
+    videos = Video.objects.filter(status='published')
+
     if category_id:
         videos = videos.filter(category_id=category_id)
-    
+
     if search:
         videos = videos.filter(
-            Q(title__icontains=search) | 
+            Q(title__icontains=search) |
             Q(description__icontains=search) |
             Q(channel_name__icontains=search)
         )
+
+    return videos
+
+
+# validators for conditional GET (apps.core.conditional), one query each
+
+
+def video_list_validators(request):
+    # comment totals follow Video.comment_count, whose refresh sets Video.updated_at;
+    # the counts move when videos or categories are deleted
+    values = published_videos(request.GET.get('category'), request.GET.get('search', '')).order_by().aggregate(
+        updated_at=Max('updated_at'),
+        count=Count('pk'),
+        category_updated_at=Max('category__updated_at'),
+        categorised=Count('category'),
+    )
+    values.update(VideoCategory.objects.filter(is_active=True).order_by().aggregate(
+        categories_updated_at=Max('updated_at'),
+        categories=Count('pk'),
+    ))
+    return values
+
+
+def video_detail_validators(request, video_id):
+    comments = Comment.objects.filter(video=OuterRef('pk')).order_by().values('video')
+    related = Video.objects.filter(category=OuterRef('category'), status='published').order_by().values('category')
+    engagement = VideoEngagementRollup.objects.filter(video=OuterRef('pk'), granularity='day').order_by().values('video')
+
+    values = Video.objects.filter(id=video_id, status='published').values(
+        'updated_at', 'view_count', 'like_count', 'dislike_count', 'comment_count', 'category__updated_at'
+    ).annotate(
+        comments_updated_at=Subquery(comments.annotate(latest=Max('updated_at')).values('latest')),
+        comments=Subquery(comments.annotate(total=Count('pk')).values('total')),
+        related_updated_at=Subquery(related.annotate(latest=Max('updated_at')).values('latest')),
+        engagement_updated_at=Subquery(engagement.annotate(latest=Max('updated_at')).values('latest')),
+    ).first()
+    if values is not None:
+        # the engagement box covers the last 7 days, so it changes with the date as well
+        values['today'] = timezone.now().date()
+    return values
+
+
+@conditional(video_list_validators, dated=False)
+def video_list_view(request):
+    category_id = request.GET.get('category')
+    search = request.GET.get('search', '')
+    
+    videos = published_videos(category_id, search).select_related('category').annotate(
+        total_comments=Count('comments', filter=Q(comments__is_approved=True))
+    ).order_by('-published_at')
     
-    paginator = Paginator(videos, 12)
+    # counted once, without the comment join, and estimated for big listings
+    paginator = EstimatedCountPaginator(videos, 12, count_queryset=published_videos(category_id, search))
     page_number = request.GET.get('page')
     videos_page = paginator.get_page(page_number)
     
@@ -39,12 +91,14 @@ def video_list_view(request):
         'categories': categories,
         'current_category': category_id,
         'search_query': search,
-        'total_videos': videos.count(),
+        'total_videos': paginator.count,
+        'count_kind': paginator.count_kind,
     }
     
     return render(request, 'videos/video_list.html', context)
 
 
+@conditional(video_detail_validators)
 def video_detail_view(request, video_id):
     video = get_object_or_404(
         Video.objects.select_related('category').annotate(
@@ -91,11 +145,24 @@ def video_detail_view(request, video_id):
         total_comments=Count('comments', filter=Q(comments__is_approved=True))
     ).order_by('-view_count')[:6]
     
+    # last 7 days from the daily rollups, never from raw comments/events
+    recent_engagement = VideoEngagementRollup.objects.filter(
+        video=video,
+        granularity='day',
+        bucket_start__gte=timezone.now() - timedelta(days=7)
+    ).aggregate(
+        views=Sum('views'),
+        likes=Sum('likes'),
+        dislikes=Sum('dislikes'),
+        comments=Sum('comments')
+    )
+    
     context = {
         'video': video,
         'comments': comments_page,
         'comment_stats': comment_stats,
         'related_videos': related_videos,
+        'recent_engagement': recent_engagement,
     }
     
     return render(request, 'videos/video_detail.html', context)
\ No newline at end of file
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# same site, with the async versions of the hot read views
+os.environ.setdefault("DJANGO_URLCONF", "config.asgi_urls")
 
 application = get_asgi_application()
@@ -0,0 +1,19 @@
+"""
+URL configuration for the ASGI entrypoint: config.urls with the hot read views
+swapped for their async versions (apps.videos.async_views)
+"""
+
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_ROUTES = {
+    'videos/': 'apps.videos.async_urls',
+    'api/v1/videos/': 'apps.videos.async_api_urls',
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), include(ASYNC_ROUTES[str(pattern.pattern)]))
+    if str(pattern.pattern) in ASYNC_ROUTES else pattern
+    for pattern in sync_urlpatterns
+]
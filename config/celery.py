@@ -6,6 +6,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 app = Celery('yt_integration')
 
+# the beat schedule is CELERY_BEAT_SCHEDULE in settings
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
@@ -21,24 +22,6 @@ app.conf.update(
         'apps.videos.tasks.update_video_stats': {'queue': 'analytics'},
         'apps.analytics.tasks.calculate_engagement_metrics': {'queue': 'analytics'},
     },
-    beat_schedule={
-        'generate-ai-comments-every-5-minutes': {
-            'task': 'apps.comments.tasks.generate_ai_comments_for_popular_videos',
-            'schedule': 300.0,
-        },
-        'update-video-statistics-every-10-minutes': {
-            'task': 'apps.videos.tasks.update_video_statistics',
-            'schedule': 600.0,
-        },
-        'calculate-engagement-metrics-hourly': {
-            'task': 'apps.analytics.tasks.calculate_engagement_metrics',
-            'schedule': 3600.0,
-        },
-        'generate-trending-videos-daily': {
-            'task': 'apps.videos.tasks.update_trending_videos',
-            'schedule': 86400.0,
-        },
-    },
 )
 
 
@@ -35,24 +35,33 @@ INSTALLED_APPS = [
     'apps.videos',
     'apps.comments',
     'apps.core',
+    'apps.analytics',
 ]
 
 MIDDLEWARE = [
+    'apps.core.middleware.RequestTimingMiddleware',
+    'apps.core.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.core.middleware.QueryStatsMiddleware',
+    'apps.analytics.middleware.EngagementEventMiddleware',
 ]
 
-ROOT_URLCONF = 'config.urls'
+# config/asgi.py switches to config.asgi_urls (async read views)
+ROOT_URLCONF = config('DJANGO_URLCONF', default='config.urls')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render() timed for sampled requests (apps.core.timing)
+        'BACKEND': 'apps.core.timing.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,8 +94,15 @@ if config('USE_POSTGRES', default=False, cast=bool):
         'PASSWORD': config('POSTGRES_PASSWORD', default='postgres'),
         'HOST': config('POSTGRES_HOST', default='db'),
         'PORT': config('POSTGRES_PORT', default='5432'),
+        # async views keep a connection per apps.core.aio pool thread
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 
+# monthly partitions of comments_comment (PostgreSQL only, see comments.0003 and
+# partition_comments); off by default, the primary key becomes (id, created_at)
+COMMENT_PARTITIONING = config('COMMENT_PARTITIONING', default=False, cast=bool)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -122,7 +138,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.pagination.EstimatedCountPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -130,9 +146,16 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'apps.core.renderers.ORJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'apps.core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # the browsable API only with ?format=api
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'apps.core.negotiation.ExplicitBrowsableAPINegotiation',
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
@@ -158,18 +181,55 @@ CELERY_TASK_ALWAYS_EAGER = config('CELERY_ALWAYS_EAGER', default=False, cast=boo
 
 # Celery beat (scheduled tasks)
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+# the only beat schedule (django_celery_beat syncs it into its tables on start). every
+# periodic task also takes a lease (apps.core.locks.task_lease), so a run outlasting its
+# interval makes the next one skip; expires drops messages left in the queue past it
 CELERY_BEAT_SCHEDULE = {
-    'generate-ai-comments-every-10-minutes': {
+    'drain-outbox-every-10-seconds': {
+        'task': 'apps.core.tasks.drain_outbox',
+        'schedule': 10.0,
+        'options': {'expires': 10},
+    },
+    'generate-ai-comments-every-5-minutes': {
         'task': 'apps.comments.tasks.generate_ai_comments_for_popular_videos',
+        'schedule': 300.0,
+        'options': {'expires': 300},
+    },
+    'update-video-statistics-every-10-minutes': {
+        'task': 'apps.videos.tasks.update_video_statistics',
         'schedule': 600.0,
+        'options': {'expires': 600},
     },
-    'update-video-statistics-every-15-minutes': {
+    'reconcile-video-statistics-daily': {
         'task': 'apps.videos.tasks.update_video_statistics',
-        'schedule': 900.0,
+        'schedule': 86400.0,
+        'kwargs': {'full': True},
+        'options': {'expires': 86400},
     },
-    'analyze-and-reply-every-15-minutes': {
+    'analyze-and-reply-every-10-minutes': {
         'task': 'apps.comments.tasks.analyze_and_reply_to_recent_comments',
-        'schedule': 900.0,
+        'schedule': 600.0,
+        'options': {'expires': 600},
+    },
+    'calculate-engagement-metrics-hourly': {
+        'task': 'apps.analytics.tasks.calculate_engagement_metrics',
+        'schedule': 3600.0,
+        'options': {'expires': 3600},
+    },
+    'cleanup-rolled-up-events-daily': {
+        'task': 'apps.analytics.tasks.cleanup_rolled_up_events',
+        'schedule': 86400.0,
+        'options': {'expires': 86400},
+    },
+    'cleanup-old-ai-comments-daily': {
+        'task': 'apps.comments.tasks.cleanup_old_ai_comments',
+        'schedule': 86400.0,
+        'options': {'expires': 86400},
+    },
+    'rebuild-leaderboards-daily': {
+        'task': 'apps.videos.tasks.rebuild_leaderboards',
+        'schedule': 86400.0,
+        'options': {'expires': 86400},
     },
 }
 
@@ -212,6 +272,17 @@ YOUTUBE_SIMULATION = {
     'DEFAULT_COMMENTS_PER_VIDEO': (5, 50),
     'CONTENT_GENERATION_INTERVAL': 300,
     'COMMENT_GENERATION_INTERVAL': 60,
+    'COMMENT_BATCH_MAX_SIZE': 100,
+    'VIDEO_STATS_BATCH_SIZE': 500,  # videos per batch of update_video_statistics
+    'AI_COMMENT_VIDEOS_PER_RUN': 50,
+    'AI_COMMENT_VIDEO_LOCK_SECONDS': 300,
+    'AI_COMMENT_RETENTION_DAYS': 30,
+    'COMMENT_PURGE_BATCH_SIZE': 1000,
+    'COMMENT_PURGE_TIME_LIMIT': 600,  # seconds per run, the next run resumes from the checkpoint
+    'COMMENT_ARCHIVE_AFTER_MONTHS': 6,
+    'COMMENT_PARTITION_MONTHS_AHEAD': 3,
+    # likes after the first one on a comment within this many seconds are written together, 0 writes each like
+    'COMMENT_LIKE_WINDOW_SECONDS': config('COMMENT_LIKE_WINDOW_SECONDS', default=2, cast=int),
     'AI_COMMENT_SENTIMENT_DISTRIBUTION': {
         'positive': 0.6,
         'neutral': 0.3,
@@ -231,10 +302,88 @@ YOUTUBE_SIMULATION = {
     ],
 }
 
-# cache
+ANALYTICS = {
+    'ROLLUP_BATCH_SIZE': 10000,
+    'RAW_EVENT_RETENTION_DAYS': 7,
+}
+
+# query fingerprints for index_advisor (apps.core.querystats), every query pays a small cost when on
+QUERY_STATS = {
+    'ENABLED': config('QUERY_STATS_ENABLED', default=False, cast=bool),
+    'FLUSH_INTERVAL': 30,  # seconds between writes of the in-memory aggregates
+}
+
+# per-request timing (apps.core.timing): Server-Timing header and a JSON log line,
+# only for the sampled share of requests; 0 disables the middleware
+REQUEST_TIMING = {
+    'SAMPLE_RATE': config('REQUEST_TIMING_SAMPLE_RATE', default=0.01, cast=float),
+}
+
+# async read views (apps.core.aio): independent queries of one request run on this many threads
+ASYNC_READS = {
+    'DB_THREADS': config('ASYNC_DB_THREADS', default=8, cast=int),
+}
+
+# staff-only request profiling (apps.core.profiling): ?profile=sample|cprofile writes the
+# profile and the SQL of that request to DIR, served back by /api/profiles/<file>
+PROFILING = {
+    'ENABLED': config('PROFILING_ENABLED', default=True, cast=bool),
+    'DIR': config('PROFILING_DIR', default=str(BASE_DIR / 'profiles')),
+    'SAMPLE_INTERVAL_MS': 5,  # the GIL switch interval, sampling faster gains nothing
+    'MAX_SQL_STATEMENTS': 1000,
+    'KEEP_REPORTS': config('PROFILING_KEEP_REPORTS', default=200, cast=int),  # older ones are deleted
+}
+
+# periodic task leases (apps.core.locks.task_lease): a run that stops heartbeating for
+# TTL seconds is considered dead and the next run takes over
+TASK_LEASES = {
+    'TTL': config('TASK_LEASE_TTL', default=120, cast=int),
+}
+
+# transactional outbox (apps.core.outbox): video and comment changes are recorded with
+# the write and drain_outbox hands them to these projections in batches
+OUTBOX = {
+    'BATCH_SIZE': config('OUTBOX_BATCH_SIZE', default=500, cast=int),
+    'HANDLERS': [
+        'apps.videos.projections.refresh_comment_counts',
+        'apps.videos.projections.sync_leaderboards',
+    ],
+}
+
+# paginated API lists, the video list page and the admin (apps.core.pagination) stop
+# running COUNT(*) on every page above THRESHOLD rows: they use the planner's estimate
+# (PostgreSQL) or an exact count cached for CACHE_SECONDS
+COUNT_ESTIMATES = {
+    'THRESHOLD': config('COUNT_ESTIMATE_THRESHOLD', default=100000, cast=int),
+    'CACHE_SECONDS': config('COUNT_CACHE_SECONDS', default=300, cast=int),
+}
+
+# top-K leaderboards (apps.videos.leaderboards) in Redis sorted sets; without a URL each
+# process keeps its own in-memory copy (apps.core.sortedsets), which only sees that
+# process's writes and is rebuilt from the database every LOCAL_MAX_AGE seconds
+LEADERBOARDS = {
+    'REDIS_URL': config('LEADERBOARD_REDIS_URL', default=''),
+    'KEY_PREFIX': 'leaderboard',
+    'LOCAL_MAX_AGE': config('LEADERBOARD_LOCAL_MAX_AGE', default=60, cast=int),
+}
+
+# prometheus metrics served on /api/metrics/ (apps.core.metrics); set PROMETHEUS_MULTIPROC_DIR
+# to a directory shared by all web and worker processes to aggregate across them
+METRICS = {
+    'ENABLED': config('METRICS_ENABLED', default=True, cast=bool),
+    'QUEUES': ['celery', 'ai_generation', 'analytics'],  # broker queues whose length is reported
+}
+
+# cache, apps.core.cache backends count hits and misses for the metrics. without
+# CACHE_REDIS_URL every process has its own, and what needs a shared cache (comment
+# like coalescing) is turned off
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'apps.core.cache.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'apps.core.cache.LocMemCache',
         'LOCATION': 'youtube-simulation-cache',
     }
 }
\ No newline at end of file
@@ -4,7 +4,7 @@ The `urlpatterns` list routes URLs to views. For more information please see:
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import (
@@ -13,7 +13,8 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
-from apps.core.views import home_view, api_status, health_check
+from apps.core.profiling import FILE_NAME_RE
+from apps.core.views import home_view, api_status, health_check, metrics_view, profile_file
 
 urlpatterns = [
     # Home
@@ -25,6 +26,8 @@ urlpatterns = [
     # Sys Endpoints
     path('api/status/', api_status, name='api_status'),
     path('api/health/', health_check, name='health_check'),
+    path('api/metrics/', metrics_view, name='metrics'),
+    re_path(rf'^api/profiles/(?P<name>{FILE_NAME_RE})$', profile_file, name='profile_file'),
     
     # Admin
     path('admin/', admin.site.urls),
@@ -37,6 +40,8 @@ urlpatterns = [
     # API Endpoints
     path('api/v1/videos/', include('apps.videos.api_urls')),
     path('api/v1/comments/', include('apps.comments.urls')),
+    path('api/v1/jobs/', include('apps.core.api_urls')),
+    path('api/v1/analytics/', include('apps.analytics.urls')),
 ]
 
 if settings.DEBUG: